@@ -1,4 +1,6 @@
 import os
 from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mermeladas.settings")
+# Sin conexiones persistentes bajo ASGI (ver DATABASES en settings)
+os.environ.setdefault("CONN_MAX_AGE", "0")
 application = get_asgi_application()
@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 
 # --- Paths / Core ---
@@ -40,7 +41,8 @@ INSTALLED_APPS = [
 # --- Middleware ---
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # servir estáticos en Render
+    "ventas.estaticos.WhiteNoiseAsincronoMiddleware",  # servir estáticos en Render (WhiteNoise, también bajo ASGI)
+    "ventas.instrumentacion.InstrumentacionMiddleware",  # mide consultas y latencia (ver INSTRUMENTACION_*)
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -56,7 +58,7 @@ WSGI_APPLICATION = "mermeladas.wsgi.application"
 # --- Templates ---
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "ventas.instrumentacion.PlantillasDjango",  # DjangoTemplates que mide el tiempo de render
         "DIRS": [BASE_DIR / "templates"],  # opcional
         "APP_DIRS": True,
         "OPTIONS": {
@@ -75,7 +77,9 @@ TEMPLATES = [
 DATABASES = {
     "default": dj_database_url.config(
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",
-        conn_max_age=600,  # para producción
+        # Conexiones persistentes en producción (WSGI). Bajo ASGI asgi.py lo deja en 0: cada solicitud
+        # corre su ORM en un hilo distinto y las conexiones persistentes no se reutilizarían
+        conn_max_age=int(os.environ.get("CONN_MAX_AGE", "600")),
     )
 }
 
@@ -86,6 +90,19 @@ if DATABASES["default"]["ENGINE"] in (
 ):
     DATABASES["default"].setdefault("OPTIONS", {})
     DATABASES["default"]["OPTIONS"]["sslmode"] = "require"
+elif DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # SQLite no tiene select_for_update: BEGIN IMMEDIATE toma el bloqueo de escritura al abrir la
+    # transacción, así dos ventas simultáneas se turnan (esperando hasta `timeout` segundos)
+    DATABASES["default"].setdefault("OPTIONS", {})
+    DATABASES["default"]["OPTIONS"].update({"transaction_mode": "IMMEDIATE", "timeout": 20})
+    # Base de pruebas en archivo: la prueba de ventas concurrentes abre una conexión por hilo, y en
+    # memoria (caché compartida) SQLite falla en vez de esperar el bloqueo de escritura. Un nombre por
+    # corrida (SQLITE_TEST_NAME o el PID), para que dos corridas en la misma máquina no compartan la
+    # base; va al entorno para que los procesos de --parallel hereden el mismo nombre
+    os.environ.setdefault(
+        "SQLITE_TEST_NAME", str(Path(tempfile.gettempdir()) / f"mermeladas_pruebas_{os.getpid()}.sqlite3")
+    )
+    DATABASES["default"].setdefault("TEST", {"NAME": os.environ["SQLITE_TEST_NAME"]})
 
 # --- Localización ---
 LANGUAGE_CODE = "es-cl"
@@ -107,10 +124,53 @@ STORAGES = {
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# --- Comprobantes PDF ---
+# Carpeta donde quedan los PDF ya generados (las ventas no cambian tras el checkout)
+COMPROBANTES_DIR = Path(os.environ.get("COMPROBANTES_DIR", Path(tempfile.gettempdir()) / "mermeladas_comprobantes"))
+# Procesos para generar comprobantes en la exportación masiva
+COMPROBANTES_PROCESOS = int(os.environ.get("COMPROBANTES_PROCESOS", min(4, os.cpu_count() or 1)))
+
+# --- Trabajos en segundo plano (ver ventas/trabajos.py y el comando correr_trabajos) ---
+# Carpeta de los archivos que generan los trabajos (exportaciones, comprobantes masivos)
+TRABAJOS_DIR = Path(os.environ.get("TRABAJOS_DIR", Path(tempfile.gettempdir()) / "mermeladas_trabajos"))
+# Procesos de correr_trabajos
+TRABAJOS_PROCESOS = int(os.environ.get("TRABAJOS_PROCESOS", 2))
+# Días que se conservan los trabajos terminados y sus archivos
+TRABAJOS_RETENCION_DIAS = int(os.environ.get("TRABAJOS_RETENCION_DIAS", 7))
+# Ejecutar cada trabajo en la misma solicitud al encolarlo (desarrollo, sin correr_trabajos)
+TRABAJOS_EN_LINEA = os.environ.get("TRABAJOS_EN_LINEA", str(DEBUG)).lower() == "true"
+
+# --- Caché ---
+# Sólo guarda valores: las versiones que los invalidan están en la base (ventas/cache.py),
+# así que cada proceso con su memoria local nunca sirve datos viejos. Con varios workers,
+# una caché compartida evita que cada uno calcule lo mismo (p. ej.
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache y CACHE_LOCATION=/tmp/mermeladas_cache).
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "mermeladas"),
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+}
+
+# --- Instrumentación ---
+# Fracción de solicitudes medidas (0 = apagado, 1 = todas); en producción basta una muestra pequeña (p. ej. 0.05)
+INSTRUMENTACION_MUESTREO = float(os.environ.get("INSTRUMENTACION_MUESTREO", "1" if DEBUG else "0"))
+# Veces que puede repetirse una misma consulta en una solicitud antes de avisar de un posible N+1
+INSTRUMENTACION_UMBRAL_N1 = int(os.environ.get("INSTRUMENTACION_UMBRAL_N1", 5))
+# Solicitudes más lentas que esto se registran como WARNING
+INSTRUMENTACION_LENTO_MS = int(os.environ.get("INSTRUMENTACION_LENTO_MS", 1000))
+# Token (cabecera "Authorization: Bearer ...") para que Prometheus lea /metricas sin sesión de staff
+INSTRUMENTACION_TOKEN = os.environ.get("INSTRUMENTACION_TOKEN", "")
+
 # --- Logging a consola (útil en Render) ---
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "handlers": {"console": {"class": "logging.StreamHandler"}},
     "root": {"handlers": ["console"], "level": "ERROR"},
+    "loggers": {
+        # Avisos de N+1 y solicitudes lentas (DEBUG registra cada solicitud medida)
+        "ventas.instrumentacion": {"level": os.environ.get("INSTRUMENTACION_LOG", "WARNING")},
+    },
 }
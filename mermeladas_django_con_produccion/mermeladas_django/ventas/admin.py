@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Category, Product, Client, RawMaterial, Recipe, RecipeItem, Sale, SaleItem, ProductBatch
+from .forms import RawMaterialForm
+from .inventario import registrar_movimientos
+from .models import Category, Product, Client, RawMaterial, Recipe, RecipeItem, Sale, SaleItem, ProductBatch, StockMovement, DailySalesSummary, Job
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -10,6 +12,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display = ("nombre", "categoria", "unidad", "precio_unitario", "stock", "activo")
     list_filter = ("categoria", "activo")
     search_fields = ("nombre",)
+    readonly_fields = ("stock",)  # saldo del libro de movimientos
 
 @admin.register(Client)
 class ClientAdmin(admin.ModelAdmin):
@@ -18,11 +21,14 @@ class ClientAdmin(admin.ModelAdmin):
 
 @admin.register(RawMaterial)
 class RawMaterialAdmin(admin.ModelAdmin):
+    form = RawMaterialForm  # no deja pasar a otra dimensión una materia usada en recetas
     list_display = ("nombre", "unidad", "costo_unitario", "stock")
     search_fields = ("nombre",)
 
 class RecipeItemInline(admin.TabularInline):
     model = RecipeItem
+    fields = ("materia_prima", "cantidad", "unidad", "cantidad_base")
+    readonly_fields = ("cantidad_base",)
     extra = 1
 
 @admin.register(Recipe)
@@ -44,3 +50,59 @@ class ProductBatchAdmin(admin.ModelAdmin):
     list_display = ("producto", "codigo_lote", "fecha_produccion", "fecha_vencimiento", "cantidad")
     list_filter = ("producto", "fecha_vencimiento")
     search_fields = ("codigo_lote",)
+
+    def save_model(self, request, obj, form, change):
+        # Los cambios de cantidad hechos a mano quedan como ajuste en el libro de stock
+        anterior = ProductBatch.objects.get(pk=obj.pk) if change else None
+        super().save_model(request, obj, form, change)
+        deltas = {obj.producto_id: obj.cantidad}
+        if anterior:
+            deltas[anterior.producto_id] = deltas.get(anterior.producto_id, 0) - anterior.cantidad
+        registrar_movimientos([
+            StockMovement(producto_id=pk, lote=obj, tipo="AJUSTE", cantidad=delta, detalle="Ajuste desde admin")
+            for pk, delta in deltas.items()
+        ])
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, ProductBatch.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        # Lo que quedaba en los lotes borrados sale del libro como ajuste; el
+        # lote del movimiento quedaría en NULL al borrar, así que va en el detalle
+        lotes = list(queryset.filter(cantidad__gt=0))
+        registrar_movimientos([
+            StockMovement(producto_id=lote.producto_id, tipo="AJUSTE", cantidad=-lote.cantidad,
+                          detalle=f"Lote {lote.codigo_lote} borrado desde admin")
+            for lote in lotes
+        ])
+        super().delete_queryset(request, queryset)
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    # El libro es de sólo agregar: se consulta, pero no se carga, edita ni borra a mano
+    list_display = ("fecha", "producto", "tipo", "cantidad", "lote", "venta")
+    list_filter = ("tipo",)
+    search_fields = ("producto__nombre", "detalle")
+    raw_id_fields = ("producto", "lote", "venta")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(DailySalesSummary)
+class DailySalesSummaryAdmin(admin.ModelAdmin):
+    list_display = ("fecha", "producto", "metodo_pago", "unidades", "monto", "lineas")
+    list_filter = ("metodo_pago",)
+    date_hierarchy = "fecha"
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "tarea", "estado", "prioridad", "intentos", "creado", "terminado", "trabajador")
+    list_filter = ("estado", "tarea")
+    search_fields = ("clave",)
+    readonly_fields = ("creado", "iniciado", "terminado", "trabajador")
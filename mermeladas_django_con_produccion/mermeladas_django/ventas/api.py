@@ -0,0 +1,201 @@
+"""
+API JSON de sólo lectura para las terminales de venta.
+
+Las respuestas son compactas: una lista de `campos` y las `filas` como
+listas de valores, paginadas por cursor sobre el id. El ETag sale de las
+versiones de la caché versionada ("productos", "inventario"), que están en
+la base: un If-None-Match que coincide se responde con 304 con una sola
+consulta de pocas filas, y un cambio hecho por un comando o un trabajador de
+la cola cambia el ETag igual que uno hecho en la web. Si el cliente acepta
+gzip, el cuerpo se comprime (y el ETag lo distingue).
+
+Para refrescar sin bajar el catálogo completo, /api/productos/cambios/
+devuelve sólo los productos con version mayor a la que ya tiene la
+terminal (Product.version se actualiza en cada cambio de datos o de stock).
+
+Las vistas son asíncronas (ORM y caché con la API a*): bajo ASGI una
+terminal esperando la base no ocupa un hilo.
+"""
+import gzip
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET
+
+from .cache import aversiones
+from .models import Product, ProductBatch
+from .paginacion import codificar_cursor, decodificar_cursor
+
+LIMITE = 500
+LIMITE_MAXIMO = 2000
+# Bajo este tamaño no vale la pena comprimir
+MINIMO_GZIP = 512
+# Los cambios se piden con este margen hacia atrás (en microsegundos, como Product.version): cubre
+# transacciones que tomaron su versión antes pero confirmaron después de la última consulta de la terminal
+MARGEN_CAMBIOS = 60 * 1_000_000
+
+CAMPOS_PRODUCTO = {
+    "id": "id",
+    "nombre": "nombre",
+    "categoria": "categoria__nombre",
+    "unidad": "unidad",
+    "precio": "precio_unitario",
+    "stock": "stock",
+    "activo": "activo",
+    "version": "version",
+}
+CAMPOS_LOTE = {
+    "id": "id",
+    "producto": "producto_id",
+    "codigo": "codigo_lote",
+    "produccion": "fecha_produccion",
+    "vencimiento": "fecha_vencimiento",
+    "cantidad": "cantidad",
+}
+GRUPOS_CATALOGO = ("productos", "inventario")
+
+
+def _acepta_gzip(request):
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
+
+async def _etag(request, nombre, grupos):
+    """ ETag fuerte: versión de los grupos (en la base) + parámetros de la consulta + codificación. """
+    version = ".".join(str(v) for v in await aversiones(grupos))
+    consulta = hashlib.sha256(request.GET.urlencode().encode()).hexdigest()[:12]
+    return f'"{nombre}-{version}-{consulta}{"-gz" if _acepta_gzip(request) else ""}"'
+
+
+def _cabeceras(response, etag):
+    response["ETag"] = etag
+    patch_vary_headers(response, ["Accept-Encoding"])
+    # La terminal guarda la respuesta pero la revalida siempre (If-None-Match)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _respuesta(request, datos, etag):
+    cuerpo = json.dumps(datos, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    comprimir = _acepta_gzip(request) and len(cuerpo) >= MINIMO_GZIP
+    response = HttpResponse(gzip.compress(cuerpo, 6) if comprimir else cuerpo, content_type="application/json")
+    if comprimir:
+        response["Content-Encoding"] = "gzip"
+    return _cabeceras(response, etag)
+
+
+def _error(mensaje):
+    return JsonResponse({"error": mensaje}, status=400)
+
+
+def _campos(request, disponibles):
+    """ Campos pedidos en ?campos=a,b,c (el id va siempre primero, lo usa el cursor). """
+    pedidos = [c for c in request.GET.get("campos", "").split(",") if c]
+    desconocidos = set(pedidos) - set(disponibles)
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos: {', '.join(sorted(desconocidos))}.")
+    return ["id"] + [c for c in (pedidos or disponibles) if c != "id"]
+
+
+def _limite(request):
+    try:
+        return min(max(int(request.GET.get("limite", LIMITE)), 1), LIMITE_MAXIMO)
+    except ValueError:
+        raise ValueError("limite debe ser un entero.")
+
+
+async def _pagina(request, queryset, disponibles, **extra):
+    """ Una página de filas (id ascendente) con los campos pedidos y el cursor de la siguiente. """
+    campos = _campos(request, disponibles)
+    limite = _limite(request)
+    token = request.GET.get("cursor")
+    if token:
+        valores = decodificar_cursor(token, [queryset.model._meta.pk])
+        if valores is None:
+            raise ValueError("cursor inválido.")
+        queryset = queryset.filter(pk__gt=valores[0])
+    filas = [f async for f in queryset.order_by("pk").values_list(*[disponibles[c] for c in campos])[: limite + 1]]
+    siguiente = codificar_cursor([filas[limite - 1][0]]) if len(filas) > limite else None
+    return {**extra, "campos": campos, "filas": filas[:limite], "siguiente": siguiente}
+
+
+async def _listado(request, nombre, grupos, calcular):
+    etag = await _etag(request, nombre, grupos)
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        # El 304 repite las cabeceras de validación y de caché del 200 (RFC 9110)
+        return _cabeceras(no_modificado, etag)
+    try:
+        datos = await calcular()
+    except ValueError as e:
+        return _error(str(e))
+    return _respuesta(request, datos, etag)
+
+
+@require_GET
+async def productos(request):
+    """
+    Catálogo de productos (?activos=1 sólo activos, ?campos=, ?limite=, ?cursor=).
+    `version` es desde dónde pedir /api/productos/cambios/ después de bajar el catálogo.
+    """
+    async def calcular():
+        version = (await Product.objects.aaggregate(v=Max("version")))["v"] or 0
+        queryset = Product.objects.all()
+        if request.GET.get("activos") == "1":
+            queryset = queryset.filter(activo=True)
+        return await _pagina(request, queryset, CAMPOS_PRODUCTO, version=version)
+    return await _listado(request, "productos", GRUPOS_CATALOGO, calcular)
+
+
+@require_GET
+async def stock(request):
+    """ Stock de los productos activos: sólo id y stock. """
+    async def calcular():
+        campos = {"id": "id", "stock": "stock"}
+        return await _pagina(request, Product.objects.filter(activo=True), campos)
+    return await _listado(request, "stock", GRUPOS_CATALOGO, calcular)
+
+
+@require_GET
+async def lotes(request):
+    """ Lotes con saldo (?producto=<id> para los de un producto). """
+    async def calcular():
+        queryset = ProductBatch.objects.filter(cantidad__gt=0)
+        if request.GET.get("producto"):
+            try:
+                queryset = queryset.filter(producto_id=int(request.GET["producto"]))
+            except ValueError:
+                raise ValueError("producto debe ser un id.")
+        return await _pagina(request, queryset, CAMPOS_LOTE)
+    return await _listado(request, "lotes", ("inventario",), calcular)
+
+
+@require_GET
+async def productos_cambios(request):
+    """
+    Productos que cambiaron (datos o stock) desde ?desde=<version>. La
+    respuesta trae la `version` a usar en la próxima consulta. Si cambiaron
+    más de LIMITE_MAXIMO productos responde `resincronizar: true` y la
+    terminal debe volver a bajar /api/productos/.
+    """
+    async def calcular():
+        try:
+            desde = int(request.GET["desde"])
+        except (KeyError, ValueError):
+            raise ValueError("desde debe ser la versión (entero) de la última consulta.")
+        campos = _campos(request, CAMPOS_PRODUCTO)
+        filas = [
+            f async for f in Product.objects.filter(version__gt=desde - MARGEN_CAMBIOS).order_by("version", "id")
+            .values_list("version", *[CAMPOS_PRODUCTO[c] for c in campos])[: LIMITE_MAXIMO + 1]
+        ]
+        if len(filas) > LIMITE_MAXIMO:
+            return {"resincronizar": True}
+        return {
+            "version": max([desde] + [f[0] for f in filas]),
+            "campos": campos,
+            "filas": [f[1:] for f in filas],
+        }
+    return await _listado(request, "cambios", GRUPOS_CATALOGO, calcular)
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class VentasConfig(AppConfig):
+    default_auto_field = "django.db.models.BigAutoField"
+    name = "ventas"
+
+    def ready(self):
+        from . import instrumentacion, signals, tareas  # noqa: F401 (registra los receptores y las tareas)
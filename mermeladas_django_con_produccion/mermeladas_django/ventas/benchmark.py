@@ -0,0 +1,205 @@
+"""
+Benchmark de los flujos de venta y producción.
+
+Cada escenario hace una petición con el cliente de pruebas de Django (o
+llama directo a la función, en el caso de FEFO) y se mide su latencia y su
+número de consultas. El resultado es un informe JSON que se puede guardar
+como línea base y comparar contra corridas posteriores.
+
+Se corre sobre los datos de la base (ver el comando sembrar_datos) dentro de
+una transacción que se revierte al final, así que la base queda igual.
+"""
+import json
+import math
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Client as Cliente, Product, Recipe, Sale
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Contexto:
+    """ Ids de la base que usan los escenarios para armar peticiones variadas. """
+
+    def __init__(self, semilla=42):
+        self.azar = random.Random(semilla)
+        self.http = Client(HTTP_HOST="localhost")
+        self.productos = dict(
+            Product.objects.filter(activo=True, stock__gt=0).order_by("-stock").values_list("pk", "precio_unitario")[:500]
+        )
+        self.recetas = list(
+            Recipe.objects.filter(producto_final__isnull=False).order_by("pk").values_list("pk", flat=True)[:500]
+        )
+        self.clientes = list(Cliente.objects.order_by("pk").values_list("pk", flat=True)[:500])
+        rango = Sale.objects.aggregate(min=Min("pk"), max=Max("pk"), desde=Min("fecha"))
+        self.ventas = (rango["min"], rango["max"])
+        self.primera_fecha = timezone.localtime(rango["desde"]).date() if rango["desde"] else timezone.localdate()
+
+    def venta_al_azar(self):
+        if self.ventas[0] is None:
+            return None
+        return self.azar.randint(*self.ventas)
+
+
+def _get(nombre_url, **parametros):
+    def escenario(ctx):
+        return ctx.http.get(reverse(nombre_url), parametros)
+    return escenario
+
+
+def _ventas_filtradas(ctx):
+    desde = ctx.primera_fecha + timedelta(days=ctx.azar.randint(0, 300))
+    return ctx.http.get(reverse("ventas_list"), {
+        "desde": desde.isoformat(), "hasta": (desde + timedelta(days=30)).isoformat(), "metodo_pago": "EFECTIVO",
+    })
+
+
+def _venta_detalle(ctx):
+    pk = ctx.venta_al_azar()
+    return ctx.http.get(reverse("venta_detail", args=[pk])) if pk else None
+
+
+def _venta_pdf(ctx):
+    pk = ctx.venta_al_azar()
+    return ctx.http.get(reverse("venta_pdf", args=[pk])) if pk else None
+
+
+def _venta_crear(ctx):
+    if not ctx.productos:
+        return None
+    elegidos = ctx.azar.sample(list(ctx.productos), k=min(len(ctx.productos), ctx.azar.randint(1, 3)))
+    datos = {
+        "cliente": ctx.azar.choice(ctx.clientes) if ctx.clientes else "",
+        "metodo_pago": "TRANSFERENCIA",
+        "items-TOTAL_FORMS": len(elegidos), "items-INITIAL_FORMS": 0,
+        "items-MIN_NUM_FORMS": 0, "items-MAX_NUM_FORMS": 1000,
+    }
+    for i, pk in enumerate(elegidos):
+        datos[f"items-{i}-producto"] = pk
+        datos[f"items-{i}-cantidad"] = "1"
+        datos[f"items-{i}-precio_unitario"] = ctx.productos[pk]
+    return ctx.http.post(reverse("venta_create"), datos)
+
+
+def _receta_producir(ctx):
+    if not ctx.recetas:
+        return None
+    hoy = timezone.localdate()
+    return ctx.http.post(reverse("receta_producir", args=[ctx.azar.choice(ctx.recetas)]), {
+        "multiplicador": "0.1", "codigo_lote": "-", "fecha_produccion": hoy.isoformat(),
+        "fecha_vencimiento": (hoy + timedelta(days=180)).isoformat(),
+    })
+
+
+def _fefo(ctx):
+    from .views import _descontar_por_FEFO
+
+    if not ctx.productos:
+        return None
+    _descontar_por_FEFO(Product.objects.get(pk=ctx.azar.choice(list(ctx.productos))), 1)
+
+
+ESCENARIOS = {
+    "home": _get("home"),
+    "productos_list": _get("productos_list"),
+    "clientes_list": _get("clientes_list"),
+    "materias_list": _get("materias_list"),
+    "recetas_list": _get("recetas_list"),
+    "ventas_list": _get("ventas_list"),
+    "ventas_list_filtrada": _ventas_filtradas,
+    "venta_detalle": _venta_detalle,
+    "venta_pdf": _venta_pdf,
+    "venta_crear": _venta_crear,
+    "receta_producir": _receta_producir,
+    "descontar_por_fefo": _fefo,
+}
+
+
+def percentil(ordenados, p):
+    """ Percentil por rango más cercano sobre una lista ya ordenada. """
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def _fallo(respuesta):
+    """ Error HTTP, o un POST que no redirigió (el formulario volvió con errores). """
+    if respuesta is None:
+        return False
+    if respuesta.request["REQUEST_METHOD"] == "POST":
+        return respuesta.status_code != 302
+    return respuesta.status_code >= 400
+
+
+def medir(escenario, ctx, iteraciones, calentamiento=2):
+    """ Corre el escenario y resume latencias (ms) y consultas por ejecución. """
+    for _ in range(calentamiento):
+        escenario(ctx)
+    tiempos, consultas, errores = [], [], 0
+    for _ in range(iteraciones):
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            respuesta = escenario(ctx)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(len(capturadas))
+        errores += _fallo(respuesta)
+    tiempos.sort()
+    resultado = {"n": iteraciones, "errores": errores}
+    for p in PERCENTILES:
+        resultado[f"p{p}_ms"] = round(percentil(tiempos, p), 2)
+    resultado.update({
+        "media_ms": round(statistics.fmean(tiempos), 2),
+        "max_ms": round(tiempos[-1], 2),
+        "consultas_media": round(statistics.fmean(consultas), 2),
+        "consultas_max": max(consultas),
+    })
+    return resultado
+
+
+def correr(nombres=None, iteraciones=30, calentamiento=2, semilla=42):
+    """ Mide los escenarios pedidos (todos por defecto) y devuelve el informe. """
+    ctx = Contexto(semilla)
+    return {
+        "fecha": timezone.now().isoformat(timespec="seconds"),
+        "motor": connection.vendor,
+        "volumen": {
+            "productos": Product.objects.count(),
+            "ventas": Sale.objects.count(),
+            "clientes": Cliente.objects.count(),
+            "recetas": Recipe.objects.count(),
+        },
+        "escenarios": {
+            nombre: medir(ESCENARIOS[nombre], ctx, iteraciones, calentamiento)
+            for nombre in (nombres or ESCENARIOS)
+        },
+    }
+
+
+def comparar(informe, base, tolerancia=0.2):
+    """
+    Regresiones del informe respecto de la línea base: p95 más de
+    `tolerancia` por sobre la base, o más consultas que en la base.
+    """
+    regresiones = []
+    for nombre, actual in informe["escenarios"].items():
+        anterior = base.get("escenarios", {}).get(nombre)
+        if not anterior:
+            continue
+        if actual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} ms -> {actual['p95_ms']} ms")
+        if actual["consultas_max"] > anterior["consultas_max"]:
+            regresiones.append(f"{nombre}: consultas {anterior['consultas_max']} -> {actual['consultas_max']}")
+    return regresiones
+
+
+def leer_informe(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,89 @@
+"""
+Caché versionada por grupos de datos ("ventas", "productos", "clientes", ...).
+
+Cada grupo tiene un contador de versión (CacheVersion, en la base). Las
+claves de lo que se guarda incluyen la versión de todos los grupos de los que
+depende, así que invalidar es sólo incrementar un contador: las entradas
+viejas dejan de leerse y expiran solas.
+
+Los contadores van en la base y no en la caché porque escriben datos varios
+procesos (web, comandos de manage.py, trabajadores de correr_trabajos) y el
+backend por defecto (memoria local) es uno por proceso: un contador en la
+caché sólo lo vería incrementar el proceso que hizo el cambio. Leerlos es
+una consulta a una tabla de pocas filas; la caché guarda sólo los valores.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import CacheVersion
+
+PREFIJO = "ventas"
+DURACION = 60 * 10
+
+
+def _version_inicial():
+    # Basada en el reloj: si la tabla se vacía (o es otra base), las versiones nuevas no chocan
+    # con claves que sigan en una caché compartida
+    return time.time_ns() // 1000
+
+
+def versiones(grupos):
+    """ Versión actual de cada grupo (una consulta); 0 si el grupo nunca se invalidó. """
+    encontradas = dict(CacheVersion.objects.filter(grupo__in=grupos).values_list("grupo", "version"))
+    return [encontradas.get(g, 0) for g in grupos]
+
+
+def invalidar(*grupos):
+    """ Incrementa la versión de los grupos al confirmar la transacción en curso. """
+    grupos = sorted(set(grupos))
+
+    def _incrementar():
+        # Un solo UPDATE fuera de la transacción del cambio: las ventas concurrentes no esperan por él
+        actualizados = CacheVersion.objects.filter(grupo__in=grupos).update(version=F("version") + 1)
+        if actualizados < len(grupos):
+            CacheVersion.objects.bulk_create(
+                [CacheVersion(grupo=g, version=_version_inicial()) for g in grupos], ignore_conflicts=True
+            )
+    transaction.on_commit(_incrementar)
+
+
+def clave_versionada(nombre, grupos):
+    """ Clave de caché de `nombre` con las versiones actuales de `grupos`. """
+    sufijo = ".".join(str(v) for v in versiones(grupos))
+    return f"{PREFIJO}:{nombre}:{sufijo}"
+
+
+def cacheado(nombre, grupos, calcular, duracion=DURACION):
+    """ Devuelve `calcular()` guardado en caché bajo `nombre` y las versiones de `grupos`. """
+    clave = clave_versionada(nombre, grupos)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, duracion)
+    return valor
+
+
+# Variantes para vistas asíncronas. Los backends de caché de Django no tienen E/S asíncrona nativa
+# (su API a* corre cada operación en un hilo), así que la búsqueda completa se hace en un solo salto
+
+async def aversiones(grupos):
+    """ Como versiones(), sin bloquear el event loop. """
+    return await sync_to_async(versiones)(grupos)
+
+
+def _buscar(nombre, grupos):
+    clave = clave_versionada(nombre, grupos)
+    return clave, cache.get(clave)
+
+
+async def acacheado(nombre, grupos, calcular, duracion=DURACION):
+    """ Como cacheado(), con `calcular` asíncrona. """
+    clave, valor = await sync_to_async(_buscar)(nombre, grupos)
+    if valor is None:
+        valor = await calcular()
+        await cache.aset(clave, valor, duracion)
+    return valor
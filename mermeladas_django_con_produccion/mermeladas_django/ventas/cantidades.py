@@ -0,0 +1,52 @@
+"""
+Cantidades y montos exactos.
+
+Montos: pesos enteros (el CLP no tiene decimales). Cantidades: Decimal con
+tres decimales, como todas las columnas de cantidad y stock; para operar
+sobre ellas como enteros se usan milésimas.
+
+Toda cantidad calculada (cantidad x multiplicador, sumas de demanda, lo que
+llega de un formulario o de un float) pasa por `redondear()` antes de
+escribirse en lotes, movimientos o deltas de stock. Si no, la base redondea
+cada columna a tres decimales por su lado (y cada motor a su manera), y el
+delta F() del stock, el lote y el movimiento del libro dejan de coincidir.
+Redondeada en Python, la base no tiene nada que redondear: lo que se calcula
+es exactamente lo que queda guardado.
+"""
+from decimal import ROUND_HALF_EVEN, Decimal
+
+MILESIMA = Decimal("0.001")
+CERO = Decimal("0")
+
+
+def redondear(valor, redondeo=ROUND_HALF_EVEN):
+    """ `valor` (Decimal, int, str o float) como Decimal a milésimas. """
+    if not isinstance(valor, Decimal):
+        # repr da el decimal más corto que representa al float (0.1 -> "0.1", no 0.1000000000000000055)
+        valor = Decimal(repr(valor)) if isinstance(valor, float) else Decimal(valor or 0)
+    # `redondeo` posicional: como palabra clave, quantize es el doble de lento
+    return valor.quantize(MILESIMA, redondeo)
+
+
+def milesimas(valor):
+    """ Cantidad en milésimas enteras (1.25 -> 1250). """
+    return int(redondear(valor) * 1000)
+
+
+def de_milesimas(entero):
+    """ Milésimas enteras como cantidad Decimal (1250 -> Decimal("1.250")). """
+    return Decimal(entero).scaleb(-3)
+
+
+def multiplicar(valor, factor):
+    """ valor x factor redondeado a milésimas (p. ej. cantidad de una receta x multiplicador). """
+    return redondear(redondear(valor) * redondear(factor))
+
+
+def subtotal(precio_unitario, valor):
+    """
+    Precio (pesos enteros) x cantidad, truncado a pesos enteros. Con la
+    cantidad ya a milésimas el producto es exacto (entero x Decimal de 3
+    decimales, muy por debajo de los 28 dígitos del contexto): sin float.
+    """
+    return int(int(precio_unitario or 0) * redondear(valor))
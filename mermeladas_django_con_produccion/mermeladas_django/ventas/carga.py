@@ -0,0 +1,160 @@
+"""
+Prueba de carga HTTP a concurrencia fija.
+
+A diferencia de benchmark.py (cliente de pruebas, una petición a la vez),
+acá se le pega a un servidor de verdad: `concurrencia` conexiones keep-alive
+piden a la vez, durante `duracion` segundos por escenario, y se mide el
+throughput (solicitudes por segundo) y la latencia. Sólo hay escenarios GET,
+así que la base no cambia.
+
+Sirve para comparar despliegues o versiones con la misma carga, p. ej. las
+vistas asíncronas bajo uvicorn contra la versión anterior (--salida y
+--comparar en el comando benchmark_carga).
+"""
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.db import connection
+from django.db.models import Max, Min
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmark import PERCENTILES, percentil
+from .models import Client as Cliente, Product, Sale
+
+
+class ContextoCarga:
+    """ Ids de la base para armar las rutas de los escenarios. """
+
+    def __init__(self):
+        rango = Sale.objects.aggregate(min=Min("pk"), max=Max("pk"))
+        self.ventas = (rango["min"], rango["max"])
+        self.clientes = list(Cliente.objects.order_by("pk").values_list("pk", flat=True)[:500])
+
+
+def _fija(nombre_url):
+    def ruta(ctx, azar):
+        return reverse(nombre_url)
+    return ruta
+
+
+def _venta_detalle(ctx, azar):
+    return reverse("venta_detail", args=[azar.randint(*ctx.ventas)]) if ctx.ventas[0] else None
+
+
+def _cliente_detalle(ctx, azar):
+    return reverse("cliente_detalle", args=[azar.choice(ctx.clientes)]) if ctx.clientes else None
+
+
+ESCENARIOS = {
+    "home": _fija("home"),
+    "productos_list": _fija("productos_list"),
+    "clientes_list": _fija("clientes_list"),
+    "ventas_list": _fija("ventas_list"),
+    "venta_detalle": _venta_detalle,
+    "cliente_detalle": _cliente_detalle,
+    "api_productos": _fija("api_productos"),
+    "api_stock": _fija("api_stock"),
+}
+
+
+def _trabajador(url_base, ruta, ctx, semilla, inicio, fin, resultados, lock):
+    azar = random.Random(semilla)
+    destino = urlsplit(url_base)
+    conexion = None
+    tiempos, errores = [], 0
+    inicio.wait()
+    while time.perf_counter() < fin[0]:
+        camino = ruta(ctx, azar)
+        if camino is None:
+            break
+        t0 = time.perf_counter()
+        try:
+            if conexion is None:
+                conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=60)
+            conexion.request("GET", camino, headers={"Host": destino.hostname})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            if respuesta.status >= 400:
+                errores += 1
+        except (OSError, http.client.HTTPException):
+            errores += 1
+            if conexion is not None:
+                conexion.close()
+            conexion = None
+            continue
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    if conexion is not None:
+        conexion.close()
+    with lock:
+        resultados["tiempos"].extend(tiempos)
+        resultados["errores"] += errores
+
+
+def medir_carga(url_base, ruta, ctx, concurrencia, duracion, semilla=42):
+    """ Corre un escenario con `concurrencia` clientes durante `duracion` segundos. """
+    resultados, lock = {"tiempos": [], "errores": 0}, threading.Lock()
+    inicio, fin = threading.Barrier(concurrencia + 1), [0.0]
+    hilos = [
+        threading.Thread(target=_trabajador, args=(url_base, ruta, ctx, semilla + i, inicio, fin, resultados, lock))
+        for i in range(concurrencia)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    fin[0] = time.perf_counter() + duracion
+    t0 = time.perf_counter()
+    inicio.wait()
+    for hilo in hilos:
+        hilo.join()
+    transcurrido = time.perf_counter() - t0
+
+    tiempos = sorted(resultados["tiempos"])
+    resultado = {"n": len(tiempos), "errores": resultados["errores"],
+                 "rps": round(len(tiempos) / transcurrido, 1)}
+    if tiempos:
+        for p in PERCENTILES:
+            resultado[f"p{p}_ms"] = round(percentil(tiempos, p), 2)
+        resultado["media_ms"] = round(statistics.fmean(tiempos), 2)
+    return resultado
+
+
+def correr_carga(url_base, nombres=None, concurrencia=32, duracion=10.0, servidor=""):
+    """ Mide los escenarios pedidos (todos por defecto) y devuelve el informe. """
+    ctx = ContextoCarga()
+    return {
+        "fecha": timezone.now().isoformat(timespec="seconds"),
+        "motor": connection.vendor,
+        "servidor": servidor or url_base,
+        "concurrencia": concurrencia,
+        "duracion_s": duracion,
+        "volumen": {"productos": Product.objects.count(), "ventas": Sale.objects.count(),
+                    "clientes": Cliente.objects.count()},
+        "escenarios": {
+            nombre: medir_carga(url_base, ESCENARIOS[nombre], ctx, concurrencia, duracion)
+            for nombre in (nombres or ESCENARIOS)
+        },
+    }
+
+
+def comparar_carga(informe, base, tolerancia=0.1):
+    """ Regresiones respecto de la línea base: throughput o p95 peores en más de `tolerancia`. """
+    regresiones = []
+    for nombre, actual in informe["escenarios"].items():
+        anterior = base.get("escenarios", {}).get(nombre)
+        if not anterior or not actual["n"] or not anterior["n"]:
+            continue
+        if actual["rps"] < anterior["rps"] * (1 - tolerancia):
+            regresiones.append(f"{nombre}: {anterior['rps']} -> {actual['rps']} req/s")
+        if actual["p95_ms"] > anterior["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {anterior['p95_ms']} ms -> {actual['p95_ms']} ms")
+    return regresiones
+
+
+def leer_informe(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,73 @@
+"""
+Catálogo de los formularios de venta y de recetas.
+
+Las opciones de los selects (productos, materias primas) y los mapas que usa
+el JavaScript del formulario (precios, stock, unidades) se calculan una vez
+y se guardan en dos niveles: la caché compartida (versionada, ver cache.py) y
+un diccionario del proceso, que evita deserializar la entrada en cada
+solicitud. Los mapas se guardan ya convertidos a JSON.
+
+Una entrada local vale mientras la clave versionada no cambie. Las versiones
+de los grupos están en la base (ver cache.py), así que un cambio hecho en
+cualquier proceso (la web, un comando como importar_csv o vencer_lotes, un
+trabajador de correr_trabajos) descarta las entradas de todos en la próxima
+lectura: cada lectura cuesta una consulta a las versiones y nada más.
+"""
+import json
+
+from django.core.cache import cache
+
+from .cache import DURACION, clave_versionada
+from .models import Product, RawMaterial
+
+# nombre -> (clave versionada, valor)
+_local = {}
+
+
+def _obtener(nombre, grupos, calcular):
+    clave = clave_versionada(nombre, grupos)
+    encontrado = _local.get(nombre)
+    if encontrado is not None and encontrado[0] == clave:
+        return encontrado[1]
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, DURACION)
+    _local[nombre] = (clave, valor)
+    return valor
+
+
+def _productos():
+    filas = list(Product.objects.values_list("pk", "nombre", "precio_unitario", "activo"))
+    return {
+        "opciones": [(pk, nombre) for pk, nombre, _, _ in filas],
+        "precios": json.dumps({pk: int(precio) for pk, _, precio, activo in filas if activo}),
+    }
+
+
+def _stock():
+    filas = Product.objects.filter(activo=True, stock__gt=0).values_list("pk", "stock")
+    return json.dumps({pk: float(stock) for pk, stock in filas})
+
+
+def _materias():
+    filas = list(RawMaterial.objects.values_list("pk", "nombre", "unidad"))
+    return {
+        "opciones": [(pk, nombre) for pk, nombre, _ in filas],
+        "unidades": json.dumps({pk: unidad for pk, _, unidad in filas}),
+    }
+
+
+def productos():
+    """ {"opciones": [(pk, nombre)], "precios": JSON {pk: precio} de los activos}. """
+    return _obtener("catalogo:productos", ("productos",), _productos)
+
+
+def stock_json():
+    """ JSON {pk: stock} de los productos activos con stock (cambia con cada venta, por eso va aparte). """
+    return _obtener("catalogo:stock", ("productos", "inventario"), _stock)
+
+
+def materias():
+    """ {"opciones": [(pk, nombre)], "unidades": JSON {pk: unidad}}. """
+    return _obtener("catalogo:materias", ("materias",), _materias)
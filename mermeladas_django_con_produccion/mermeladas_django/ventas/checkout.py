@@ -0,0 +1,91 @@
+import random
+import time
+from decimal import Decimal
+
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+
+from .cantidades import redondear
+from .inventario import asignar_fefo_carrito, movimientos_de_asignacion, registrar_movimientos
+from .models import SaleItem, calcular_subtotal
+from .resumen import acumular_venta
+
+
+def preparar_lineas(filas):
+    """
+    Convierte las filas del carrito [(producto, cantidad, precio_unitario)] en
+    ítems de venta sin guardar, con la cantidad a milésimas y el subtotal
+    ya calculado en pesos enteros.
+    Si la fila no trae precio se usa el precio de lista del producto.
+    """
+    items = []
+    for producto, cantidad, precio in filas:
+        precio = int(precio) if precio else int(producto.precio_unitario)
+        cantidad = redondear(cantidad)
+        items.append(SaleItem(
+            producto=producto,
+            cantidad=cantidad,
+            precio_unitario=precio,
+            subtotal=calcular_subtotal(precio, cantidad),
+        ))
+    return items
+
+
+def demanda_por_producto(items):
+    """ Cantidad total pedida de cada producto ({producto: cantidad}). """
+    demanda = {}
+    for item in items:
+        demanda[item.producto] = demanda.get(item.producto, Decimal("0")) + item.cantidad
+    return demanda
+
+
+def registrar_venta(venta, items):
+    """
+    Guarda la venta y sus ítems y descuenta el stock (FEFO) de todo el carrito.
+
+    Debe llamarse dentro de una transacción. El número de consultas es fijo:
+    bloqueo de productos, bloqueo de lotes, bulk_update de lotes, INSERT de la venta, bulk_create de
+    los ítems, bulk_create de los movimientos de stock, UPDATE del saldo de
+    los productos y hasta tres consultas para el resumen diario.
+    Nunca vende lotes vencidos. Lanza StockInsuficiente antes de escribir nada
+    si algún producto no alcanza.
+    """
+    asignaciones = asignar_fefo_carrito(demanda_por_producto(items), vigentes_al=timezone.localdate())
+
+    venta.total = sum(item.subtotal for item in items)
+    venta.save()
+    for item in items:
+        item.venta = venta
+    SaleItem.objects.bulk_create(items)
+    registrar_movimientos(movimientos_de_asignacion(asignaciones, tipo="VENTA", venta=venta))
+    acumular_venta(venta, items)
+    return venta
+
+
+# Intentos de una transacción abortada por la base por bloqueos (deadlock, "database is locked")
+REINTENTOS = 3
+# Espera base entre intentos, en segundos (se duplica en cada intento, con azar para desincronizar)
+ESPERA_REINTENTO = 0.05
+
+
+def en_transaccion_con_reintentos(funcion, *args, intentos=REINTENTOS, **kwargs):
+    """
+    Ejecuta `funcion` en su propia transacción y la repite desde cero (hasta
+    `intentos` veces) si la base la aborta con OperationalError, como hace
+    PostgreSQL con la víctima de un deadlock o SQLite cuando la base está
+    bloqueada. Si agota los intentos, relanza el último error.
+
+    Dentro de una transacción ya abierta no reintenta: el error es de la
+    transacción de afuera.
+    """
+    if connection.in_atomic_block:
+        with transaction.atomic():
+            return funcion(*args, **kwargs)
+    for intento in range(intentos):
+        try:
+            with transaction.atomic():
+                return funcion(*args, **kwargs)
+        except OperationalError:
+            if intento == intentos - 1:
+                raise
+            time.sleep(random.uniform(0, ESPERA_REINTENTO * 2 ** intento))
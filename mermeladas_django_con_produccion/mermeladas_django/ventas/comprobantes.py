@@ -0,0 +1,236 @@
+"""
+Comprobantes PDF de venta.
+
+Las ventas no cambian después del checkout, así que cada PDF se genera una
+sola vez y queda en disco (COMPROBANTES_DIR) con la huella de su contenido
+en el nombre: si cambia algo que se imprime (p. ej. el nombre del cliente),
+cambia la huella y se vuelve a generar. La huella es también el ETag.
+
+El dibujo trabaja sobre un diccionario plano (`datos_comprobante`), de modo
+que puede correr en otro proceso para la exportación masiva.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+from .cantidades import redondear
+from .models import SaleItem
+
+# Cambiarla invalida todos los PDF en disco (p. ej. al modificar el diseño)
+VERSION_DISENO = 1
+VENTAS_POR_BLOQUE = 50
+
+
+def _pesos(valor):
+    return f"${int(valor):,}".replace(",", ".")
+
+
+def ventas_para_comprobante(queryset):
+    """ Ventas con cliente e ítems (y su producto) precargados, en tres consultas por bloque. """
+    items = SaleItem.objects.select_related("producto").only(
+        "venta_id", "cantidad", "precio_unitario", "subtotal", "producto__nombre"
+    ).order_by("id")
+    return queryset.select_related("cliente").prefetch_related(Prefetch("items", queryset=items))
+
+
+def datos_comprobante(venta):
+    """ Todo lo que se imprime de una venta, como datos simples (serializables y picklables). """
+    cliente = venta.cliente
+    return {
+        "version": VERSION_DISENO,
+        "id": venta.pk,
+        "fecha": timezone.localtime(venta.fecha).strftime("%d-%m-%Y %H:%M"),
+        "cliente": cliente.nombre if cliente else None,
+        "direccion": cliente.direccion if cliente else None,
+        "items": [
+            [item.producto.nombre, str(item.cantidad), item.precio_unitario, item.subtotal]
+            for item in venta.items.all()
+        ],
+        "total": venta.total,
+    }
+
+
+def huella(datos):
+    """ Hash del contenido del comprobante (sirve de ETag y de nombre en caché). """
+    texto = json.dumps(datos, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(texto.encode()).hexdigest()[:32]
+
+
+def dibujar_comprobante(c, datos):
+    """ Dibuja un comprobante en el canvas `c`, empezando en una página nueva. """
+    width, height = A4
+    x_margin, y_margin = 2 * cm, 2 * cm
+    y = height - y_margin
+
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(x_margin, y, "Comprobante de Venta")
+    y -= 1.2 * cm
+
+    c.setFont("Helvetica", 11)
+    c.drawString(x_margin, y, f"Venta #{datos['id']}  |  Fecha: {datos['fecha']}")
+    y -= 0.6 * cm
+    c.drawString(x_margin, y, f"Cliente: {datos['cliente'] or 'Sin cliente'}")
+    y -= 0.4 * cm
+    if datos["direccion"]:
+        c.drawString(x_margin, y, f"Dirección: {datos['direccion']}")
+        y -= 0.4 * cm
+    y -= 0.4 * cm
+
+    c.setFont("Helvetica-Bold", 10)
+    c.drawString(x_margin, y, "Producto")
+    c.drawString(x_margin + 8 * cm, y, "Cant.")
+    c.drawString(x_margin + 11 * cm, y, "P. Unit.")
+    c.drawString(x_margin + 14 * cm, y, "Subtotal")
+    y -= 0.5 * cm
+    c.line(x_margin, y, width - x_margin, y)
+    y -= 0.3 * cm
+
+    c.setFont("Helvetica", 10)
+    for nombre, cantidad, precio, subtotal in datos["items"]:
+        if y < 3 * cm:
+            c.showPage()
+            y = height - y_margin
+            c.setFont("Helvetica", 10)
+
+        c.drawString(x_margin, y, nombre[:40])
+        c.drawRightString(x_margin + 10 * cm, y, f"{redondear(cantidad):.3f}")
+        c.drawRightString(x_margin + 13 * cm, y, _pesos(precio))
+        c.drawRightString(width - x_margin, y, _pesos(subtotal))
+        y -= 0.45 * cm
+
+    y -= 0.2 * cm
+    c.line(x_margin, y, width - x_margin, y)
+    y -= 0.6 * cm
+    c.setFont("Helvetica-Bold", 12)
+    c.drawRightString(width - x_margin, y, f"TOTAL: {_pesos(datos['total'])}")
+    c.showPage()
+
+
+def renderizar_pdf(datos):
+    """ PDF de un comprobante, en bytes. Función de módulo para poder usarla en un pool de procesos. """
+    salida = BytesIO()
+    c = canvas.Canvas(salida, pagesize=A4, invariant=True)
+    dibujar_comprobante(c, datos)
+    c.save()
+    return salida.getvalue()
+
+
+def _directorio():
+    directorio = Path(settings.COMPROBANTES_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def ruta_en_cache(datos, etag=None):
+    return _directorio() / f"venta_{datos['id']}_{etag or huella(datos)}.pdf"
+
+
+def guardar_en_cache(ruta, contenido):
+    """ Escritura atómica: otro proceso nunca ve un PDF a medio escribir. """
+    fd, temporal = tempfile.mkstemp(dir=ruta.parent, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def obtener_pdf(datos, etag=None):
+    """ Ruta del PDF en disco, generándolo sólo si no estaba. """
+    ruta = ruta_en_cache(datos, etag)
+    if not ruta.exists():
+        guardar_en_cache(ruta, renderizar_pdf(datos))
+    return ruta
+
+
+def _procesos():
+    return max(1, getattr(settings, "COMPROBANTES_PROCESOS", os.cpu_count() or 1))
+
+
+def pdfs_de_ventas(queryset, procesos=None):
+    """
+    Genera (datos, pdf) para las ventas del queryset, por bloques de
+    VENTAS_POR_BLOQUE: lee el bloque de la base, toma de disco los PDF ya
+    generados y reparte los faltantes en un pool de procesos. En memoria hay
+    a lo sumo un bloque de PDF a la vez.
+    """
+    procesos = procesos or _procesos()
+    ventas = ventas_para_comprobante(queryset).iterator(chunk_size=VENTAS_POR_BLOQUE)
+    pool = ProcessPoolExecutor(max_workers=procesos) if procesos > 1 else None
+    try:
+        bloque = []
+        for venta in ventas:
+            bloque.append(datos_comprobante(venta))
+            if len(bloque) == VENTAS_POR_BLOQUE:
+                yield from _resolver_bloque(bloque, pool)
+                bloque = []
+        if bloque:
+            yield from _resolver_bloque(bloque, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _resolver_bloque(bloque, pool):
+    rutas = [ruta_en_cache(datos) for datos in bloque]
+    faltantes = [datos for datos, ruta in zip(bloque, rutas) if not ruta.exists()]
+    mapa = pool.map if pool is not None and len(faltantes) > 1 else map
+    nuevos = dict(zip((d["id"] for d in faltantes), mapa(renderizar_pdf, faltantes)))
+    for datos, ruta in zip(bloque, rutas):
+        if datos["id"] in nuevos:
+            guardar_en_cache(ruta, nuevos[datos["id"]])
+            yield datos, nuevos[datos["id"]]
+        else:
+            yield datos, ruta.read_bytes()
+
+
+class _Tubo:
+    """ Archivo de sólo escritura que se vacía a medida que zipfile escribe (sin seek). """
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def zip_de_ventas(queryset, procesos=None):
+    """ Genera un ZIP con un PDF por venta, por trozos, para StreamingHttpResponse o un archivo. """
+    tubo = _Tubo()
+    with zipfile.ZipFile(tubo, "w", compression=zipfile.ZIP_DEFLATED) as archivo:
+        for datos, pdf in pdfs_de_ventas(queryset, procesos):
+            archivo.writestr(f"venta_{datos['id']}.pdf", pdf)
+            yield tubo.vaciar()
+    yield tubo.vaciar()
+
+
+def pdf_unico_de_ventas(queryset, destino):
+    """ Escribe en `destino` (archivo abierto) un único PDF con una página por comprobante. """
+    c = canvas.Canvas(destino, pagesize=A4, invariant=True)
+    for venta in ventas_para_comprobante(queryset).iterator(chunk_size=VENTAS_POR_BLOQUE):
+        dibujar_comprobante(c, datos_comprobante(venta))
+    c.save()
@@ -0,0 +1,128 @@
+"""
+Conciliación de Product.stock con los lotes.
+
+El stock de un producto debe ser la suma de las cantidades de sus lotes
+(cada venta, producción, ajuste o vencimiento mueve las dos cosas a la vez).
+Para encontrar los que se desviaron se recorren en paralelo, ordenados por
+producto, dos cursores por bloques: una única consulta agrupada con el saldo
+de lotes de todos los productos y los (id, stock) de los productos. Es un
+merge join en Python, así que la memoria no depende de la cantidad de
+productos ni de lotes.
+
+Las diferencias se corrigen por bloques: el stock pasa a ser el saldo de
+lotes (bulk_update) y, si el libro de stock tampoco coincide con los lotes,
+se agrega un movimiento AJUSTE por la diferencia, así el libro sigue
+cuadrando con el stock. Antes de corregir un bloque se bloquean sus
+productos y se vuelven a calcular sus saldos, así una venta que ocurrió
+entre la lectura y la corrección no produce un ajuste equivocado.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .cache import invalidar
+from .cantidades import CERO, redondear
+from .inventario import bloquear_productos
+from .models import Product, ProductBatch, StockMovement, nueva_version
+
+PRODUCTOS_POR_BLOQUE = 2000
+
+
+def saldos_de_lotes(productos=None):
+    """
+    (producto_id, saldo de sus lotes) de los productos con lotes, por
+    producto_id (una consulta agrupada). El saldo viene tal como lo suma la
+    base: en SQLite, en punto flotante; pasarlo por redondear().
+    """
+    lotes = ProductBatch.objects.all()
+    if productos is not None:
+        lotes = lotes.filter(producto_id__in=productos)
+    return lotes.values_list("producto_id").annotate(saldo=Sum("cantidad")).order_by("producto_id")
+
+
+def diferencias(bloque=PRODUCTOS_POR_BLOQUE):
+    """
+    Genera (producto_id, stock, saldo de lotes) de cada producto cuyo stock no
+    coincide con sus lotes (los productos sin lotes tienen saldo 0), en orden
+    de producto. Devuelve, al agotarse, la cantidad de productos revisados.
+    """
+    saldos = saldos_de_lotes().iterator(chunk_size=bloque)
+    productos = Product.objects.order_by("pk").values_list("pk", "stock").iterator(chunk_size=bloque)
+    siguiente = next(saldos, None)
+    revisados = 0
+    for pk, stock in productos:
+        revisados += 1
+        # Lotes de productos que ya no existen no pueden quedar: el FK es CASCADE
+        while siguiente is not None and siguiente[0] < pk:
+            siguiente = next(saldos, None)
+        saldo = CERO
+        if siguiente is not None and siguiente[0] == pk:
+            saldo = redondear(siguiente[1])
+        if stock != saldo:
+            yield pk, stock, saldo
+    return revisados
+
+
+@transaction.atomic
+def _corregir_bloque(ids):
+    """ Lleva el stock (y el libro) de los productos `ids` al saldo de sus lotes, con el bloqueo tomado. """
+    stocks = bloquear_productos(ids)
+    lotes = {pk: redondear(saldo) for pk, saldo in saldos_de_lotes(stocks)}
+    libro = {
+        pk: redondear(saldo)
+        for pk, saldo in StockMovement.objects.filter(producto_id__in=stocks).values_list("producto_id")
+        .annotate(saldo=Sum("cantidad")).order_by()
+    }
+    version = nueva_version()
+    productos = [
+        Product(pk=pk, stock=lotes.get(pk, CERO), version=version)
+        for pk, stock in stocks.items() if lotes.get(pk, CERO) != stock
+    ]
+    ajustes = [
+        StockMovement(producto_id=producto.pk, tipo="AJUSTE", cantidad=producto.stock - libro.get(producto.pk, CERO),
+                      detalle="Conciliación con lotes")
+        for producto in productos
+        if producto.stock != libro.get(producto.pk, CERO)
+    ]
+    Product.objects.bulk_update(productos, ["stock", "version"])
+    StockMovement.objects.bulk_create(ajustes)
+    if productos:
+        invalidar("inventario")
+    return len(productos)
+
+
+def conciliar_stock(corregir=False, bloque=PRODUCTOS_POR_BLOQUE, informar=None):
+    """
+    Compara el stock de todos los productos con sus lotes y, con `corregir`,
+    ajusta las diferencias de a `bloque` productos por transacción.
+    `informar(pk, stock, saldo)` se llama por cada diferencia encontrada.
+    Devuelve las métricas de la desviación (JSON serializable).
+    """
+    resumen = {"revisados": 0, "con_diferencia": 0, "sobrante": CERO, "faltante": CERO,
+               "desviacion_maxima": CERO, "corregidos": 0}
+    pendientes = []
+    recorrido = diferencias(bloque)
+    while True:
+        try:
+            pk, stock, saldo = next(recorrido)
+        except StopIteration as fin:
+            resumen["revisados"] = fin.value
+            break
+        desviacion = stock - saldo
+        resumen["con_diferencia"] += 1
+        if desviacion > 0:
+            resumen["sobrante"] += desviacion
+        else:
+            resumen["faltante"] -= desviacion
+        resumen["desviacion_maxima"] = max(resumen["desviacion_maxima"], abs(desviacion))
+        if informar is not None:
+            informar(pk, stock, saldo)
+        if corregir:
+            pendientes.append(pk)
+            if len(pendientes) >= bloque:
+                resumen["corregidos"] += _corregir_bloque(pendientes)
+                pendientes = []
+    if pendientes:
+        resumen["corregidos"] += _corregir_bloque(pendientes)
+    return {clave: str(valor) if isinstance(valor, Decimal) else valor for clave, valor in resumen.items()}
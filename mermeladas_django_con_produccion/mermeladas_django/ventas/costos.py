@@ -0,0 +1,20 @@
+from .cache import cacheado
+from .models import Recipe
+
+GRUPOS = ("recetas",)
+
+
+def calcular_costos():
+    """ Costo de todas las recetas en una sola consulta: {pk: {"costo", "costo_por_unidad"}}. """
+    return {
+        fila["id"]: {"costo": fila["costo"], "costo_por_unidad": fila["costo_por_unidad"]}
+        for fila in Recipe.objects.with_costs().values("id", "costo", "costo_por_unidad")
+    }
+
+
+def costos_recetas():
+    """
+    Costos del recetario desde la caché versionada. Se invalida al cambiar
+    una receta, sus ítems o el costo unitario de una materia prima.
+    """
+    return cacheado("costos_recetas", GRUPOS, calcular_costos)
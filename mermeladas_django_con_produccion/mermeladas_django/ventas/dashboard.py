@@ -0,0 +1,75 @@
+import asyncio
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import acacheado
+from .models import Client, DailySalesSummary, Product, ProductBatch, Sale
+
+DIAS_INGRESOS = 14
+DIAS_TOP_PRODUCTOS = 30
+DIAS_POR_VENCER = 7
+GRUPOS = ("ventas", "productos", "clientes", "inventario")
+
+
+async def calcular_dashboard(hoy):
+    """
+    KPIs del panel a partir del resumen diario (nunca recorre SaleItem). Las
+    consultas son independientes y se lanzan juntas con asyncio.gather.
+    """
+    desde = hoy - timedelta(days=DIAS_INGRESOS - 1)
+    ingresos_qs = (
+        DailySalesSummary.objects.filter(fecha__gte=desde, fecha__lte=hoy)
+        .values_list("fecha").annotate(monto=Sum("monto")).order_by()
+    )
+    top_qs = (
+        DailySalesSummary.objects.filter(fecha__gt=hoy - timedelta(days=DIAS_TOP_PRODUCTOS), fecha__lte=hoy)
+        .values("producto__nombre")
+        .annotate(unidades=Sum("unidades"), monto=Sum("monto"))
+        .order_by("-monto")[:5]
+    )
+    por_vencer_qs = (
+        ProductBatch.objects.filter(
+            cantidad__gt=0, fecha_vencimiento__gte=hoy, fecha_vencimiento__lte=hoy + timedelta(days=DIAS_POR_VENCER)
+        )
+        .order_by("fecha_vencimiento", "id")
+        .values("codigo_lote", "producto__nombre", "fecha_vencimiento", "cantidad")[:10]
+    )
+    total_productos, total_clientes, total_ventas, por_dia, top_productos, por_vencer = await asyncio.gather(
+        Product.objects.acount(),
+        Client.objects.acount(),
+        Sale.objects.acount(),
+        _lista(ingresos_qs),
+        _lista(top_qs),
+        _lista(por_vencer_qs),
+    )
+    por_dia = dict(por_dia)
+
+    dias = [desde + timedelta(days=i) for i in range(DIAS_INGRESOS)]
+    maximo = max(por_dia.values(), default=0) or 1
+    ingresos = [
+        {"fecha": d, "monto": por_dia.get(d, 0), "porcentaje": round(100 * por_dia.get(d, 0) / maximo)}
+        for d in dias
+    ]
+
+    return {
+        "total_productos": total_productos,
+        "total_clientes": total_clientes,
+        "total_ventas": total_ventas,
+        "ingresos": ingresos,
+        "ingresos_total": sum(por_dia.values()),
+        "top_productos": top_productos,
+        "por_vencer": por_vencer,
+        "dias_por_vencer": DIAS_POR_VENCER,
+    }
+
+
+async def _lista(queryset):
+    return [fila async for fila in queryset]
+
+
+async def datos_dashboard():
+    """ Datos del panel servidos desde la caché versionada. """
+    hoy = timezone.localdate()
+    return await acacheado(f"dashboard:{hoy.isoformat()}", GRUPOS, lambda: calcular_dashboard(hoy))
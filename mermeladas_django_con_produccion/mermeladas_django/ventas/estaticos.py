@@ -0,0 +1,36 @@
+"""
+WhiteNoise para despliegues ASGI.
+
+WhiteNoiseMiddleware (6.x) es sólo síncrono: bajo ASGI Django corre la cadena
+entera desde él en un hilo y las vistas asíncronas que vienen después vuelven
+a ocupar uno mientras esperan la base. Esta subclase es híbrida: con una
+cadena asíncrona busca el archivo estático sin salir del event loop y sólo
+usa un hilo para servirlo.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class WhiteNoiseAsincronoMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        self.asincronico = iscoroutinefunction(get_response)
+        if self.asincronico:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincronico:
+            return self._acall(request)
+        return super().__call__(request)
+
+    async def _acall(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve, thread_sensitive=False)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,117 @@
+"""
+Exportación de ventas para contabilidad.
+
+Las filas salen de values_list(...).iterator(chunk_size): sin instanciar
+modelos ni cargar el resultado completo, de modo que la memoria no depende
+de la cantidad de ventas exportadas.
+"""
+import csv
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import SaleItem
+
+FILAS_POR_BLOQUE = 2000
+
+COLUMNAS_VENTAS = ("venta_id", "fecha", "cliente_id", "cliente", "metodo_pago", "total", "monto_pagado")
+COLUMNAS_ITEMS = (
+    "venta_id", "fecha", "cliente_id", "cliente", "metodo_pago",
+    "producto_id", "producto", "cantidad", "precio_unitario", "subtotal",
+)
+NIVELES = {"ventas": COLUMNAS_VENTAS, "items": COLUMNAS_ITEMS}
+
+
+def filas_ventas(ventas):
+    """ Una fila por venta, en el orden del queryset. """
+    filas = ventas.values_list(
+        "pk", "fecha", "cliente_id", "cliente__nombre", "metodo_pago", "total", "monto_pagado"
+    ).iterator(chunk_size=FILAS_POR_BLOQUE)
+    zona = timezone.get_current_timezone()
+    for pk, fecha, cliente_id, cliente, metodo, total, pagado in filas:
+        yield pk, fecha.astimezone(zona).replace(microsecond=0), cliente_id, cliente, metodo, total, pagado
+
+
+def filas_items(ventas):
+    """ Una fila por ítem vendido, con los datos de su venta (un solo JOIN, sin consultas por fila). """
+    filas = (
+        SaleItem.objects.filter(venta__in=ventas.order_by().values("pk"))
+        .order_by("venta__fecha", "venta_id", "id")
+        .values_list(
+            "venta_id", "venta__fecha", "venta__cliente_id", "venta__cliente__nombre", "venta__metodo_pago",
+            "producto_id", "producto__nombre", "cantidad", "precio_unitario", "subtotal",
+        )
+        .iterator(chunk_size=FILAS_POR_BLOQUE)
+    )
+    zona = timezone.get_current_timezone()
+    venta_anterior = local = None
+    for venta_id, fecha, *resto in filas:
+        # Los ítems de una venta vienen juntos: la fecha local se calcula una vez por venta
+        if venta_id != venta_anterior:
+            venta_anterior, local = venta_id, fecha.astimezone(zona).replace(microsecond=0)
+        yield (venta_id, local, *resto)
+
+
+def filas_de(nivel, ventas):
+    return filas_items(ventas) if nivel == "items" else filas_ventas(ventas)
+
+
+class _Eco:
+    """ "Archivo" para csv.writer que devuelve lo escrito en vez de guardarlo. """
+
+    def write(self, valor):
+        return valor
+
+
+def csv_por_partes(columnas, filas, filas_por_parte=500):
+    """
+    Genera el CSV por trozos de texto (para StreamingHttpResponse o un archivo).
+    Empieza con BOM para que Excel reconozca UTF-8.
+    """
+    escritor = csv.writer(_Eco())
+    yield "﻿" + escritor.writerow(columnas)
+    parte = []
+    for fila in filas:
+        parte.append(escritor.writerow(fila))
+        if len(parte) >= filas_por_parte:
+            yield "".join(parte)
+            parte = []
+    if parte:
+        yield "".join(parte)
+
+
+def escribir_parquet(ruta, columnas, filas, filas_por_grupo=50_000):
+    """
+    Escribe las filas en Parquet por grupos de filas (requiere pyarrow, que
+    es opcional: se importa sólo aquí). Devuelve la cantidad de filas.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = {
+        "fecha": pa.timestamp("s", tz=settings.TIME_ZONE),
+        "cliente": pa.string(), "metodo_pago": pa.string(), "producto": pa.string(),
+        "cantidad": pa.decimal128(12, 3),
+    }
+    esquema = pa.schema([(c, tipos.get(c, pa.int64())) for c in columnas])
+    filas = iter(filas)
+    total = 0
+    escritor = pq.ParquetWriter(ruta, esquema)
+    try:
+        while True:
+            grupo = []
+            for fila in filas:
+                grupo.append(fila)
+                if len(grupo) >= filas_por_grupo:
+                    break
+            if not grupo:
+                break
+            escritor.write_table(
+                pa.Table.from_pydict({c: [f[i] for f in grupo] for i, c in enumerate(columnas)}, schema=esquema)
+            )
+            total += len(grupo)
+            if len(grupo) < filas_por_grupo:
+                break
+    finally:
+        escritor.close()
+    return total
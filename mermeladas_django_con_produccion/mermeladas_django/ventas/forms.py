@@ -1,6 +1,12 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
-from django.forms import inlineformset_factory
-from .models import Product, Client, RawMaterial, Recipe, RecipeItem, Sale, SaleItem
+from django.core.exceptions import ValidationError
+from django.forms import BaseInlineFormSet, inlineformset_factory
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .models import Product, Client, RawMaterial, Recipe, RecipeItem, Sale, SaleItem, PAYMENT_CHOICES
+from .unidades import compatibles
 
 class ProductForm(forms.ModelForm):
     class Meta:
@@ -17,7 +23,30 @@ class RawMaterialForm(forms.ModelForm):
         model = RawMaterial
         fields = ["nombre", "unidad", "costo_unitario", "stock"]
 
-class RecipeForm(forms.ModelForm):
+    def clean_unidad(self):
+        # Los ingredientes que la usan se reconvierten a la unidad nueva; a otra dimensión no se puede
+        unidad = self.cleaned_data["unidad"]
+        anterior = self.instance.unidad
+        if (self.instance.pk and unidad not in compatibles(anterior)
+                and RecipeItem.objects.filter(materia_prima=self.instance).exists()):
+            raise ValidationError(
+                f"Hay recetas que la usan en {anterior}: sólo puede pasar a {', '.join(compatibles(anterior))}."
+            )
+        return unidad
+
+class OpcionesPrecargadasMixin:
+    """
+    Acepta `opciones` ({campo: [(pk, etiqueta)]}) ya calculadas para los
+    selects de claves foráneas, que si no consultan la base cada vez que se dibujan.
+    """
+    def __init__(self, *args, opciones=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for campo, lista in (opciones or {}).items():
+            field = self.fields[campo]
+            vacia = [("", field.empty_label)] if field.empty_label is not None else []
+            field.choices = vacia + list(lista)
+
+class RecipeForm(OpcionesPrecargadasMixin, forms.ModelForm):
     class Meta:
         model = Recipe
         fields = ["nombre", "producto_final", "rendimiento_unidades"]
@@ -26,10 +55,16 @@ from django import forms
 from django.forms import inlineformset_factory
 from .models import Recipe, RecipeItem
 
+class RecipeItemForm(OpcionesPrecargadasMixin, forms.ModelForm):
+    class Meta:
+        model = RecipeItem
+        fields = ["materia_prima", "cantidad", "unidad"]
+
 RecipeItemFormSet = inlineformset_factory(
     Recipe,
     RecipeItem,
-    fields=["materia_prima", "cantidad"],
+    form=RecipeItemForm,
+    fields=["materia_prima", "cantidad", "unidad"],
     widgets={"cantidad": forms.NumberInput(attrs={"step": "0.001", "min": "0"})},
     extra=0,          # 👈 sin filas iniciales
     can_delete=True,
@@ -51,18 +86,127 @@ class SaleForm(forms.ModelForm):
         # Monto pagado solo será requerido en vista si es EFECTIVO (lo validamos en la view)
         self.fields["monto_pagado"].required = False
 
-class SaleItemForm(forms.ModelForm):
+class ProductoChoiceField(forms.ModelChoiceField):
+    """ Resuelve el producto desde un diccionario precargado (si lo hay) en vez de un .get() por fila. """
+    productos = None
+
+    def to_python(self, value):
+        if self.productos is None or value in self.empty_values:
+            return super().to_python(value)
+        try:
+            return self.productos[int(value)]
+        except (KeyError, ValueError, TypeError):
+            raise ValidationError(
+                self.error_messages["invalid_choice"], code="invalid_choice", params={"value": value}
+            )
+
+class SaleItemForm(OpcionesPrecargadasMixin, forms.ModelForm):
     class Meta:
         model = SaleItem
         fields = ["producto", "cantidad", "precio_unitario"]
+        field_classes = {"producto": ProductoChoiceField}
+
+    def __init__(self, *args, productos=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["producto"].productos = productos
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        # El producto ya se validó contra la base al precargarlo; evita un SELECT por fila
+        if self.fields["producto"].productos is not None:
+            exclude.add("producto")
+        return exclude
+
+class BaseSaleItemFormSet(BaseInlineFormSet):
+    """ Carga todos los productos del carrito en una sola consulta y los comparte entre las filas. """
+
+    @cached_property
+    def productos(self):
+        if not self.is_bound:
+            return None
+        ids = set()
+        for i in range(self.total_form_count()):
+            valor = self.data.get(f"{self.add_prefix(i)}-producto")
+            if valor and str(valor).isdigit():
+                ids.add(int(valor))
+        return Product.objects.in_bulk(ids) if ids else {}
+
+    def get_form_kwargs(self, index):
+        kwargs = super().get_form_kwargs(index)
+        kwargs["productos"] = self.productos
+        return kwargs
 
 # Aumenta número de filas iniciales visibles
 SaleItemFormSet = inlineformset_factory(
-    Sale, SaleItem, form=SaleItemForm, extra=3, can_delete=True
+    Sale, SaleItem, form=SaleItemForm, formset=BaseSaleItemFormSet, extra=3, can_delete=True
 )
 
+class SaleFilterForm(forms.Form):
+    """ Filtros del listado de ventas (todos opcionales). """
+    desde = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date", "class": "form-control form-control-sm"}))
+    hasta = forms.DateField(required=False, widget=forms.DateInput(attrs={"type": "date", "class": "form-control form-control-sm"}))
+    metodo_pago = forms.ChoiceField(required=False, choices=[("", "Todos")] + PAYMENT_CHOICES,
+                                    widget=forms.Select(attrs={"class": "form-select form-select-sm"}))
+    cliente = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+
+    def filtrar(self, queryset):
+        """ Aplica los filtros válidos a un queryset de Sale (sin filtros si el formulario no es válido). """
+        if not self.is_valid():
+            return queryset
+        datos = self.cleaned_data
+        zona = timezone.get_current_timezone()
+        # Rango semiabierto sobre la columna (sin __date) para aprovechar el índice
+        if datos["desde"]:
+            queryset = queryset.filter(fecha__gte=datetime.combine(datos["desde"], time.min, zona))
+        if datos["hasta"]:
+            queryset = queryset.filter(fecha__lt=datetime.combine(datos["hasta"] + timedelta(days=1), time.min, zona))
+        if datos["metodo_pago"]:
+            queryset = queryset.filter(metodo_pago=datos["metodo_pago"])
+        if datos["cliente"]:
+            queryset = queryset.filter(cliente_id=datos["cliente"])
+        return queryset
+
 class ProductionForm(forms.Form):
     multiplicador = forms.DecimalField(min_value=0.001, decimal_places=3, initial=1, help_text="Cuántas veces ejecutar la receta")
     codigo_lote = forms.CharField(max_length=50)
     fecha_produccion = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
-    fecha_vencimiento = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
\ No newline at end of file
+    fecha_vencimiento = forms.DateField(widget=forms.DateInput(attrs={"type": "date"}))
+class ProductionPlanForm(forms.Form):
+    """ Plan de producción: un multiplicador (opcional) por receta y fechas comunes a todos los lotes. """
+    fecha_produccion = forms.DateField(widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}))
+    fecha_vencimiento = forms.DateField(widget=forms.DateInput(attrs={"type": "date", "class": "form-control"}))
+
+    def __init__(self, *args, recetas=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.recetas = list(recetas)
+        for receta in self.recetas:
+            self.fields[f"receta_{receta.pk}"] = forms.DecimalField(
+                required=False, min_value=0, decimal_places=3,
+                widget=forms.NumberInput(attrs={"step": "0.001", "min": "0", "class": "form-control form-control-sm"}),
+            )
+
+    def filas(self):
+        """ (receta, campo del multiplicador) para la plantilla. """
+        return [(receta, self[f"receta_{receta.pk}"]) for receta in self.recetas]
+
+    def clean(self):
+        datos = super().clean()
+        plan = [
+            (receta, datos[f"receta_{receta.pk}"]) for receta in self.recetas if datos.get(f"receta_{receta.pk}")
+        ]
+        if not plan:
+            raise ValidationError("Indique el multiplicador de al menos una receta.")
+        fprod, fven = datos.get("fecha_produccion"), datos.get("fecha_vencimiento")
+        if fprod and fven and fven < fprod:
+            self.add_error("fecha_vencimiento", "El vencimiento no puede ser anterior a la producción.")
+        datos["plan"] = plan
+        return datos
+
+class ImportForm(forms.Form):
+    """ Carga masiva desde CSV (con encabezado; separado por coma o punto y coma, UTF-8). """
+    tipo = forms.ChoiceField(choices=[
+        ("productos", "Productos"), ("materias", "Materias primas"), ("clientes", "Clientes"), ("recetas", "Recetas"),
+    ], widget=forms.Select(attrs={"class": "form-select"}))
+    archivo = forms.FileField(widget=forms.ClearableFileInput(attrs={"class": "form-control", "accept": ".csv,text/csv"}))
+    simular = forms.BooleanField(required=False, help_text="Valida todo sin guardar cambios.",
+                                 widget=forms.CheckboxInput(attrs={"class": "form-check-input"}))
@@ -0,0 +1,372 @@
+"""
+Importación masiva desde CSV (productos, materias primas, clientes y recetas).
+
+El archivo se lee por bloques de FILAS_POR_BLOQUE. Cada fila se valida con
+el formulario de siempre (mismos validadores de formulario y de modelo),
+pero sin las consultas por fila: las claves foráneas se resuelven por nombre
+con una consulta por bloque y la unicidad de `nombre` la resuelve el upsert.
+Las filas inválidas se informan con su número de línea y no detienen la
+importación.
+"""
+import csv
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+
+from .cache import invalidar
+from .forms import ClientForm, ProductForm, RawMaterialForm, RecipeForm, RecipeItemForm
+from .models import Category, Product, RawMaterial, Recipe, RecipeItem
+from .unidades import compatibles
+
+FILAS_POR_BLOQUE = 1000
+MAXIMO_ERRORES = 500
+FALSOS = {"0", "no", "n", "false", "falso", "f"}
+
+
+def _formulario(form_class, sin_campos=()):
+    """
+    Una instancia del formulario para validar todas las filas, sin los campos
+    `sin_campos` y sin la validación de unicidad (que consulta la base).
+    """
+    clase = type(f"Importar{form_class.__name__}", (form_class,), {"validate_unique": lambda self: None})
+    form = clase(data={})
+    for campo in sin_campos:
+        form.fields.pop(campo, None)
+    return form
+
+
+def _validar(form, datos):
+    """
+    Valida `datos` reutilizando el mismo formulario: construir uno por fila
+    (copia profunda de todos sus campos) era lo más caro de la importación.
+    Devuelve la instancia nueva del modelo, o None si hay errores.
+    """
+    form.data = datos
+    form.instance = form._meta.model()
+    form._errors = None
+    return form.instance if form.is_valid() else None
+
+
+def _texto_error(form):
+    return "; ".join(f"{campo}: {' '.join(errores)}" if campo != "__all__" else " ".join(errores)
+                     for campo, errores in form.errors.items())
+
+
+def _primero_por_nombre(modelo, nombres):
+    """ {nombre: pk} tomando el pk más bajo si el nombre se repite (una consulta). """
+    mapa = {}
+    for nombre, pk in modelo.objects.filter(nombre__in=nombres).order_by("-pk").values_list("nombre", "pk"):
+        mapa[nombre] = pk
+    return mapa
+
+
+class Importador:
+    """
+    Base de los importadores. Cada subclase define el formulario, las
+    columnas esperadas y cómo guardar un bloque de instancias válidas.
+    """
+    form_class = None
+    columnas = ()
+    opcionales = ()  # columnas que pueden faltar en el CSV (se toman vacías)
+    foraneas = ()  # columnas con el nombre de un objeto relacionado, fuera del formulario
+    grupos_cache = ()
+
+    def __init__(self):
+        self.form = _formulario(self.form_class, self.foraneas)
+        self.creados = 0
+        self.actualizados = 0
+        self.filas = 0
+        self.errores = []
+        self.total_errores = 0
+
+    def error(self, linea, texto):
+        self.total_errores += 1
+        if len(self.errores) < MAXIMO_ERRORES:
+            self.errores.append((linea, texto))
+
+    def preparar(self, fila):
+        """ Normaliza los valores de texto de una fila antes de validarla. """
+        datos = {c: (fila.get(c) or "").strip() for c in self.columnas + self.opcionales}
+        if "activo" in datos:
+            datos["activo"] = "" if datos["activo"].lower() in FALSOS else (datos["activo"] or "on")
+        return datos
+
+    def validar(self, linea, datos):
+        instancia = _validar(self.form, datos)
+        if instancia is None:
+            self.error(linea, _texto_error(self.form))
+        return instancia
+
+    def resolver_foraneas(self, bloque):
+        """ Resuelve por nombre las columnas foráneas del bloque (una consulta por columna). """
+
+    def guardar(self, bloque):
+        """ Guarda las filas válidas del bloque: [(linea, datos, instancia)]. """
+        raise NotImplementedError
+
+    def importar(self, lector):
+        bloque = []
+        for linea, fila in enumerate(lector, start=2):
+            self.filas += 1
+            datos = self.preparar(fila)
+            instancia = self.validar(linea, datos)
+            if instancia is not None:
+                bloque.append((linea, datos, instancia))
+            if len(bloque) >= FILAS_POR_BLOQUE:
+                self._procesar(bloque)
+                bloque = []
+        if bloque:
+            self._procesar(bloque)
+        if self.grupos_cache:
+            invalidar(*self.grupos_cache)
+
+    def _procesar(self, bloque):
+        self.resolver_foraneas(bloque)
+        self.guardar([fila for fila in bloque if fila[2] is not None])
+
+    @staticmethod
+    def ultimos_por_clave(bloque, clave):
+        """ Si una clave se repite en el bloque, gana la última fila. """
+        return list({clave(instancia): (linea, datos, instancia) for linea, datos, instancia in bloque}.values())
+
+
+class ImportadorUpsert(Importador):
+    """ Modelos con `nombre` único: un INSERT ... ON CONFLICT (nombre) DO UPDATE por bloque. """
+    campos_actualizables = ()
+
+    def guardar(self, bloque):
+        bloque = self.ultimos_por_clave(bloque, lambda i: i.nombre)
+        if not bloque:
+            return
+        modelo = self.form_class._meta.model
+        nombres = [i.nombre for _, _, i in bloque]
+        existentes = set(modelo.objects.filter(nombre__in=nombres).values_list("nombre", flat=True))
+        modelo.objects.bulk_create(
+            [i for _, _, i in bloque], update_conflicts=True, unique_fields=["nombre"],
+            update_fields=list(self.campos_actualizables),
+        )
+        self.actualizados += len(existentes)
+        self.creados += len(bloque) - len(existentes)
+
+
+class ImportadorPorNombre(Importador):
+    """
+    Modelos cuyo `nombre` no es único: se actualiza el registro de menor id
+    con ese nombre (bulk_update) y se crean los demás (bulk_create).
+    """
+    campos_actualizables = ()
+
+    def guardar(self, bloque):
+        bloque = self.ultimos_por_clave(bloque, lambda i: i.nombre)
+        existentes = _primero_por_nombre(self.form_class._meta.model, [i.nombre for _, _, i in bloque])
+        nuevos, cambios = [], []
+        for _, _, instancia in bloque:
+            instancia.pk = existentes.get(instancia.nombre)
+            (cambios if instancia.pk else nuevos).append(instancia)
+        modelo = self.form_class._meta.model
+        if cambios:
+            modelo.objects.bulk_update(cambios, list(self.campos_actualizables), batch_size=FILAS_POR_BLOQUE)
+        if nuevos:
+            modelo.objects.bulk_create(nuevos)
+        self.actualizados += len(cambios)
+        self.creados += len(nuevos)
+
+
+class ImportadorMaterias(ImportadorUpsert):
+    form_class = RawMaterialForm
+    columnas = ("nombre", "unidad", "costo_unitario", "stock")
+    campos_actualizables = ("unidad", "costo_unitario", "stock")
+    grupos_cache = ("recetas", "materias")
+
+    def guardar(self, bloque):
+        # Como en RawMaterialForm: si la unidad cambia, los ingredientes que la usan se reconvierten,
+        # y una materia usada en recetas no puede pasar a otra dimensión
+        bloque = self.ultimos_por_clave(bloque, lambda i: i.nombre)
+        actuales = {
+            nombre: (pk, unidad)
+            for pk, nombre, unidad in RawMaterial.objects.filter(nombre__in=[i.nombre for _, _, i in bloque])
+            .values_list("pk", "nombre", "unidad")
+        }
+        en_recetas = set(RecipeItem.objects.filter(materia_prima_id__in=[pk for pk, _ in actuales.values()])
+                         .values_list("materia_prima_id", flat=True).distinct())
+        validas, cambiadas = [], []
+        for linea, datos, materia in bloque:
+            pk, unidad = actuales.get(materia.nombre, (None, materia.unidad))
+            if unidad != materia.unidad:
+                if pk in en_recetas and materia.unidad not in compatibles(unidad):
+                    self.error(linea, f"unidad: hay recetas que usan {materia.nombre} en {unidad}: "
+                                      f"sólo puede pasar a {', '.join(compatibles(unidad))}.")
+                    continue
+                cambiadas.append(pk)
+            validas.append((linea, datos, materia))
+        super().guardar(validas)
+        if cambiadas:
+            RecipeItem.objects.filter(materia_prima_id__in=cambiadas).recalcular_base()
+
+
+class ImportadorClientes(ImportadorPorNombre):
+    form_class = ClientForm
+    columnas = ("nombre", "email", "telefono", "direccion")
+    campos_actualizables = ("email", "telefono", "direccion")
+    grupos_cache = ("clientes",)
+
+
+class ImportadorProductos(ImportadorPorNombre):
+    """ La categoría va por nombre y se crea si no existe. El stock no se importa: lo lleva el libro. """
+    form_class = ProductForm
+    columnas = ("nombre", "categoria", "unidad", "precio_unitario", "activo")
+    foraneas = ("categoria",)
+    # `version` toma la de la instancia recién validada: el cambio se ve en la API de catálogo
+    campos_actualizables = ("categoria", "unidad", "precio_unitario", "activo", "version")
+    grupos_cache = ("productos", "recetas")
+
+    def resolver_foraneas(self, bloque):
+        nombres = {datos["categoria"] for _, datos, _ in bloque if datos["categoria"]}
+        if nombres:
+            Category.objects.bulk_create([Category(nombre=n) for n in nombres], ignore_conflicts=True)
+        categorias = dict(Category.objects.filter(nombre__in=nombres).values_list("nombre", "pk"))
+        for _, datos, instancia in bloque:
+            instancia.categoria_id = categorias.get(datos["categoria"])
+
+
+class ImportadorRecetas(Importador):
+    """
+    Una fila por ingrediente: receta, producto_final, rendimiento_unidades,
+    materia_prima, cantidad y, opcional, unidad (vacía: la de la materia
+    prima). Las cantidades se guardan convertidas a la unidad de la materia.
+    Los ingredientes de una receta importada reemplazan a los que tenía (la
+    primera vez que aparece en el archivo).
+    """
+    form_class = RecipeForm
+    columnas = ("receta", "producto_final", "rendimiento_unidades", "materia_prima", "cantidad")
+    opcionales = ("unidad",)
+    foraneas = ("producto_final",)
+    grupos_cache = ("recetas",)
+
+    def __init__(self):
+        super().__init__()
+        # RecipeItemForm y no RecipeItemFormSet.form: cada formset en línea agrega "receta" a los
+        # Meta.fields de su formulario, y después de editar una receta todas las filas quedaban inválidas
+        self.form_item = _formulario(RecipeItemForm, ("materia_prima",))
+        self.vistas = set()
+
+    def validar(self, linea, datos):
+        receta = super().validar(linea, {**datos, "nombre": datos["receta"]})
+        if receta is None:
+            return None
+        item = _validar(self.form_item, {"cantidad": datos["cantidad"], "unidad": datos["unidad"]})
+        if item is None:
+            self.error(linea, _texto_error(self.form_item))
+            return None
+        if not datos["materia_prima"]:
+            self.error(linea, "materia_prima: Este campo es obligatorio.")
+            return None
+        receta.item = item
+        return receta
+
+    def resolver_foraneas(self, bloque):
+        productos = _primero_por_nombre(Product, {d["producto_final"] for _, d, _ in bloque if d["producto_final"]})
+        materias = {
+            materia.nombre: materia
+            for materia in RawMaterial.objects.filter(nombre__in={d["materia_prima"] for _, d, _ in bloque})
+            .only("id", "nombre", "unidad")
+        }
+        for i, (linea, datos, receta) in enumerate(bloque):
+            if datos["producto_final"] and datos["producto_final"] not in productos:
+                self.error(linea, f"producto_final: no existe el producto {datos['producto_final']}.")
+                bloque[i] = (linea, datos, None)
+            elif datos["materia_prima"] not in materias:
+                self.error(linea, f"materia_prima: no existe la materia prima {datos['materia_prima']}.")
+                bloque[i] = (linea, datos, None)
+            else:
+                receta.producto_final_id = productos.get(datos["producto_final"])
+                receta.item.materia_prima = materias[datos["materia_prima"]]
+                try:
+                    # Unidad compatible con la de la materia (la misma validación del formulario de recetas)
+                    receta.item.clean()
+                except ValidationError as e:
+                    self.error(linea, "; ".join(f"{campo}: {' '.join(errores)}"
+                                                for campo, errores in e.message_dict.items()))
+                    bloque[i] = (linea, datos, None)
+
+    def guardar(self, bloque):
+        if not bloque:
+            return
+        cabeceras = self.ultimos_por_clave(bloque, lambda r: r.nombre)
+        nombres = [r.nombre for _, _, r in cabeceras]
+        existentes = set(Recipe.objects.filter(nombre__in=nombres).values_list("nombre", flat=True))
+        Recipe.objects.bulk_create(
+            [r for _, _, r in cabeceras], update_conflicts=True, unique_fields=["nombre"],
+            update_fields=["producto_final", "rendimiento_unidades"],
+        )
+        ids = dict(Recipe.objects.filter(nombre__in=nombres).values_list("nombre", "pk"))
+        primeras = [ids[n] for n in nombres if n not in self.vistas]
+        if primeras:
+            RecipeItem.objects.filter(receta_id__in=primeras).delete()
+        ya_vistas = [ids[n] for n in nombres if n in self.vistas]
+        self.vistas.update(nombres)
+
+        # Un ingrediente repetido suma cantidades (en la unidad de la materia), también si ya vino
+        # en un bloque anterior
+        cantidades, unidades = {}, {}
+        for _, _, r in bloque:
+            clave = (ids[r.nombre], r.item.materia_prima_id)
+            cantidades[clave] = cantidades.get(clave, Decimal("0")) + r.item.calcular_base()
+            unidades[clave] = r.item.materia_prima.unidad
+        previos = {
+            (item.receta_id, item.materia_prima_id): item
+            for item in RecipeItem.objects.filter(receta_id__in=ya_vistas)
+        } if ya_vistas else {}
+        sumados = []
+        for clave, item in previos.items():
+            if clave in cantidades:
+                cantidad = cantidades.pop(clave)
+                item.cantidad = F("cantidad") + cantidad
+                item.cantidad_base = F("cantidad_base") + cantidad
+                sumados.append(item)
+        if sumados:
+            RecipeItem.objects.bulk_update(sumados, ["cantidad", "cantidad_base"])
+        RecipeItem.objects.bulk_create([
+            RecipeItem(receta_id=receta_id, materia_prima_id=mp_id, cantidad=cantidad,
+                       unidad=unidades[receta_id, mp_id], cantidad_base=cantidad)
+            for (receta_id, mp_id), cantidad in cantidades.items()
+        ])
+        nuevas = [n for n in nombres if n not in existentes]
+        self.creados += len(nuevas)
+        self.actualizados += len(nombres) - len(nuevas)
+
+
+IMPORTADORES = {
+    "productos": ImportadorProductos,
+    "materias": ImportadorMaterias,
+    "clientes": ImportadorClientes,
+    "recetas": ImportadorRecetas,
+}
+
+
+def importar_csv(tipo, archivo, simular=False):
+    """
+    Importa un CSV (archivo de texto abierto, con encabezado) en una sola
+    transacción. Con simular=True valida y escribe, pero deshace todo al final.
+    Devuelve el importador, con los contadores y errores por línea.
+    """
+    importador = IMPORTADORES[tipo]()
+    lector = csv.DictReader(archivo, delimiter=_separador(archivo))
+    faltantes = [c for c in importador.columnas if c not in (lector.fieldnames or ())]
+    if faltantes:
+        raise ValueError("Faltan columnas en el CSV: " + ", ".join(faltantes))
+    with transaction.atomic():
+        importador.importar(lector)
+        if simular:
+            transaction.set_rollback(True)
+    return importador
+
+
+def _separador(archivo):
+    """ Detecta ',' o ';' (Excel en español guarda con ';') mirando la primera línea. """
+    posicion = archivo.tell()
+    primera = archivo.readline()
+    archivo.seek(posicion)
+    return ";" if primera.count(";") > primera.count(",") else ","
@@ -0,0 +1,280 @@
+"""
+Instrumentación por solicitud: consultas SQL, tiempo en la base, tiempo de
+plantillas y latencia total, agregados por vista.
+
+El middleware mide sólo una muestra de las solicitudes
+(INSTRUMENTACION_MUESTREO, entre 0 y 1); las demás pasan sin ningún costo
+extra. En las medidas, las consultas se cuentan con un execute_wrapper
+instalado en cada conexión, que lee la medición en curso de una ContextVar
+(así cuenta también las consultas de las vistas asíncronas, que el ORM
+ejecuta en otro hilo), y se agrupan por "huella" (el SQL sin literales):
+una misma huella repetida INSTRUMENTACION_UMBRAL_N1 veces en una solicitud
+es el síntoma típico de un N+1 y se registra en el log.
+
+Los agregados viven en memoria del proceso (cada worker tiene los suyos) y
+se consultan en JSON o en formato de texto de Prometheus.
+"""
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Límites (en segundos) del histograma de latencia
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_medicion = ContextVar("medicion", default=None)
+
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_LISTAS = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+
+
+def huella_sql(sql):
+    """ SQL normalizado: sin literales y con las listas IN (%s, %s, ...) colapsadas. """
+    return _LISTAS.sub("(...)", _LITERALES.sub("?", sql))
+
+
+class Medicion:
+    """ Lo medido durante una solicitud. """
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.tiempo_plantillas = 0.0
+        self.huellas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.tiempo_db += time.perf_counter() - inicio
+            self.consultas += 1
+            self.huellas[huella_sql(sql)] += 1
+
+    def repetidas(self, umbral):
+        return [(sql, n) for sql, n in self.huellas.most_common() if n >= umbral]
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    return medicion(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _instalar_medidor(sender, connection, **kwargs):
+    # Primero en la lista: connection.execute_wrapper() quita el último al salir y no debe llevarse éste
+    if _medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _medir_consulta)
+
+
+class _Vista:
+    def __init__(self):
+        self.solicitudes = 0
+        self.errores = 0
+        self.latencia = 0.0
+        self.tiempo_db = 0.0
+        self.tiempo_plantillas = 0.0
+        self.consultas = 0
+        self.consultas_max = 0
+        self.n_mas_1 = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class Estadisticas:
+    """ Agregados por vista, seguros entre hilos. """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vistas = {}
+
+    def registrar(self, vista, medicion, latencia, error, n_mas_1):
+        with self._lock:
+            v = self._vistas.setdefault(vista, _Vista())
+            v.solicitudes += 1
+            v.errores += error
+            v.latencia += latencia
+            v.tiempo_db += medicion.tiempo_db
+            v.tiempo_plantillas += medicion.tiempo_plantillas
+            v.consultas += medicion.consultas
+            v.consultas_max = max(v.consultas_max, medicion.consultas)
+            v.n_mas_1 += n_mas_1
+            for i, limite in enumerate(BUCKETS):
+                if latencia <= limite:
+                    v.buckets[i] += 1
+
+    def reiniciar(self):
+        with self._lock:
+            self._vistas = {}
+
+    def _copia(self):
+        with self._lock:
+            return {nombre: vars(v).copy() for nombre, v in sorted(self._vistas.items())}
+
+    def como_dict(self):
+        """ Resumen por vista (promedios en milisegundos), para el endpoint JSON. """
+        resumen = {}
+        for nombre, v in self._copia().items():
+            n = v["solicitudes"]
+            resumen[nombre] = {
+                "solicitudes": n,
+                "errores": v["errores"],
+                "latencia_media_ms": round(v["latencia"] / n * 1000, 2),
+                "db_media_ms": round(v["tiempo_db"] / n * 1000, 2),
+                "plantillas_media_ms": round(v["tiempo_plantillas"] / n * 1000, 2),
+                "consultas_media": round(v["consultas"] / n, 2),
+                "consultas_max": v["consultas_max"],
+                "solicitudes_con_n_mas_1": v["n_mas_1"],
+            }
+        return resumen
+
+    def como_prometheus(self, prefijo="mermeladas"):
+        """ Agregados en el formato de texto de exposición de Prometheus. """
+        vistas = self._copia()
+        lineas = []
+
+        def metrica(nombre, tipo, ayuda, campo):
+            lineas.append(f"# HELP {prefijo}_{nombre} {ayuda}")
+            lineas.append(f"# TYPE {prefijo}_{nombre} {tipo}")
+            for vista, v in vistas.items():
+                lineas.append(f'{prefijo}_{nombre}{{vista="{_etiqueta(vista)}"}} {v[campo]}')
+
+        metrica("solicitudes_total", "counter", "Solicitudes medidas.", "solicitudes")
+        metrica("errores_total", "counter", "Solicitudes medidas con respuesta 5xx.", "errores")
+        metrica("consultas_total", "counter", "Consultas SQL en solicitudes medidas.", "consultas")
+        metrica("db_segundos_total", "counter", "Tiempo en la base de datos.", "tiempo_db")
+        metrica("plantillas_segundos_total", "counter", "Tiempo renderizando plantillas.", "tiempo_plantillas")
+        metrica("n_mas_1_total", "counter", "Solicitudes con consultas repetidas (posible N+1).", "n_mas_1")
+
+        nombre = f"{prefijo}_latencia_segundos"
+        lineas.append(f"# HELP {nombre} Latencia total de las solicitudes medidas.")
+        lineas.append(f"# TYPE {nombre} histogram")
+        for vista, v in vistas.items():
+            etiqueta = _etiqueta(vista)
+            for limite, cantidad in zip(BUCKETS, v["buckets"]):
+                lineas.append(f'{nombre}_bucket{{vista="{etiqueta}",le="{limite}"}} {cantidad}')
+            lineas.append(f'{nombre}_bucket{{vista="{etiqueta}",le="+Inf"}} {v["solicitudes"]}')
+            lineas.append(f'{nombre}_sum{{vista="{etiqueta}"}} {v["latencia"]}')
+            lineas.append(f'{nombre}_count{{vista="{etiqueta}"}} {v["solicitudes"]}')
+        return "\n".join(lineas) + "\n"
+
+
+def _etiqueta(valor):
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+estadisticas = Estadisticas()
+
+
+def _en_muestra():
+    muestreo = getattr(settings, "INSTRUMENTACION_MUESTREO", 0)
+    return muestreo >= 1 or (muestreo > 0 and random.random() < muestreo)
+
+
+class InstrumentacionMiddleware:
+    """
+    Mide una muestra de las solicitudes y la agrega por vista (nombre de la
+    URL). Agrega la cabecera Server-Timing a las respuestas medidas. Es
+    síncrono o asíncrono según la cadena de middlewares (bajo ASGI no fuerza
+    un cambio de hilo).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincronico = iscoroutinefunction(get_response)
+        if self.asincronico:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincronico:
+            return self._acall(request)
+        if not _en_muestra():
+            return self.get_response(request)
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        return self._registrar(request, response, medicion, time.perf_counter() - inicio)
+
+    async def _acall(self, request):
+        if not _en_muestra():
+            return await self.get_response(request)
+        medicion = Medicion()
+        token = _medicion.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion.reset(token)
+        return self._registrar(request, response, medicion, time.perf_counter() - inicio)
+
+    def _registrar(self, request, response, medicion, latencia):
+        match = request.resolver_match
+        if match is None:
+            return response
+        vista = match.view_name or match._func_path
+        repetidas = medicion.repetidas(getattr(settings, "INSTRUMENTACION_UMBRAL_N1", 5))
+        estadisticas.registrar(vista, medicion, latencia, response.status_code >= 500, bool(repetidas))
+
+        for sql, veces in repetidas:
+            logger.warning("Posible N+1 en %s: %d veces %s", vista, veces, sql[:300])
+        lento = getattr(settings, "INSTRUMENTACION_LENTO_MS", 1000) / 1000
+        logger.log(
+            logging.WARNING if latencia >= lento else logging.DEBUG,
+            "%s %s -> %s: %.1f ms, %d consultas (%.1f ms en la base, %.1f ms en plantillas)",
+            request.method, request.path, vista, latencia * 1000, medicion.consultas,
+            medicion.tiempo_db * 1000, medicion.tiempo_plantillas * 1000,
+        )
+        response["Server-Timing"] = (
+            f"db;dur={medicion.tiempo_db * 1000:.1f}, tpl;dur={medicion.tiempo_plantillas * 1000:.1f}, "
+            f"total;dur={latencia * 1000:.1f}"
+        )
+        return response
+
+
+class _PlantillaMedida:
+    """ Envoltorio de una plantilla que suma su tiempo de render a la medición en curso. """
+
+    def __init__(self, plantilla):
+        self.plantilla = plantilla
+
+    def __getattr__(self, nombre):
+        return getattr(self.plantilla, nombre)
+
+    def render(self, context=None, request=None):
+        medicion = _medicion.get()
+        if medicion is None:
+            return self.plantilla.render(context, request)
+        inicio, db_antes = time.perf_counter(), medicion.tiempo_db
+        try:
+            return self.plantilla.render(context, request)
+        finally:
+            # Las consultas hechas al renderizar (querysets perezosos) cuentan en la base, no en plantillas
+            medicion.tiempo_plantillas += time.perf_counter() - inicio - (medicion.tiempo_db - db_antes)
+
+
+class PlantillasDjango(DjangoTemplates):
+    """ Backend de plantillas de Django que mide el tiempo de render (ver TEMPLATES en settings). """
+
+    def from_string(self, template_code):
+        return _PlantillaMedida(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _PlantillaMedida(super().get_template(template_name))
@@ -0,0 +1,169 @@
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Sum, Value, When, Window
+
+from .cache import invalidar
+from .cantidades import redondear
+from .models import Product, ProductBatch, StockMovement, nueva_version
+
+# Orden FEFO (First Expiring, First Out): primero vence, primero sale.
+ORDEN_FEFO = ("fecha_vencimiento", "fecha_produccion", "id")
+
+
+class StockInsuficiente(Exception):
+    """ Los lotes del producto no alcanzan para cubrir la cantidad pedida. """
+
+    def __init__(self, producto, solicitado, disponible):
+        self.producto = producto
+        self.solicitado = solicitado
+        self.disponible = disponible
+        super().__init__(
+            f"Stock insuficiente para {producto}. Solicitado: {solicitado}, Disponible: {disponible}."
+        )
+
+
+def _delta_por_producto(deltas, campo="pk"):
+    """
+    Expresión CASE con el delta de cada producto, para ajustar varios en un
+    solo UPDATE. `campo` es la columna con el id del producto.
+    """
+    return Case(
+        *[When(**{campo: pk}, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(Decimal("0")),
+        output_field=DecimalField(max_digits=12, decimal_places=3),
+    )
+
+
+def lotes_necesarios(restante, vigentes_al=None):
+    """
+    Lotes con saldo que hacen falta para cubrir `restante` ({producto_id:
+    cantidad}) en orden FEFO: los de cada producto cuyo saldo acumulado
+    anterior (ventana SUM por producto) todavía no cubre lo pedido. Con
+    `vigentes_al` se saltan los lotes vencidos a esa fecha.
+    """
+    lotes = ProductBatch.objects.filter(producto_id__in=restante, cantidad__gt=0)
+    if vigentes_al is not None:
+        lotes = lotes.filter(fecha_vencimiento__gte=vigentes_al)
+    acumulado = Window(Sum("cantidad"), partition_by=[F("producto_id")], order_by=[F(c).asc() for c in ORDEN_FEFO])
+    falta_antes = _delta_por_producto(restante, campo="producto_id") - (acumulado - F("cantidad"))
+    return lotes.annotate(falta_antes=falta_antes).filter(falta_antes__gt=0)
+
+
+def _ajustar_stock(deltas):
+    """
+    Suma a Product.stock el delta de cada producto ({producto_id: delta}) en
+    un único UPDATE, que también marca la nueva versión de catálogo.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if deltas:
+        Product.objects.filter(pk__in=deltas).update(
+            stock=F("stock") + _delta_por_producto(deltas), version=nueva_version()
+        )
+
+
+def registrar_movimientos(movimientos):
+    """
+    Agrega movimientos al libro de stock y actualiza el saldo de cada producto.
+
+    Es la única vía para cambiar Product.stock: un INSERT (bulk_create) de los
+    movimientos más un UPDATE con el delta F() de todos los productos tocados.
+    """
+    movimientos = [m for m in movimientos if m.cantidad]
+    if not movimientos:
+        return []
+    deltas = {}
+    for m in movimientos:
+        deltas[m.producto_id] = deltas.get(m.producto_id, Decimal("0")) + m.cantidad
+    StockMovement.objects.bulk_create(movimientos)
+    _ajustar_stock(deltas)
+    invalidar("inventario")
+    return movimientos
+
+
+def bloquear_productos(ids):
+    """
+    Bloquea (select_for_update) las filas de los productos, siempre en orden
+    de pk: dos transacciones que tocan productos en común los piden en el
+    mismo orden y no pueden quedar esperándose una a la otra (deadlock).
+    Devuelve {producto_id: stock} leído con el bloqueo ya tomado.
+    """
+    return dict(
+        Product.objects.select_for_update().filter(pk__in=ids).order_by("pk").values_list("pk", "stock")
+    )
+
+
+def movimientos_de_asignacion(asignaciones, tipo="VENTA", venta=None):
+    """ Un movimiento de salida por cada lote tocado en una asignación FEFO. """
+    return [
+        StockMovement(producto_id=pk, lote=lote, venta=venta, tipo=tipo, cantidad=-tomado)
+        for pk, lista in asignaciones.items()
+        for lote, tomado in lista
+    ]
+
+
+def asignar_fefo_carrito(demanda, vigentes_al=None):
+    """
+    Descuenta en orden FEFO la cantidad pedida de cada producto de `demanda`
+    ({producto: cantidad}). Con `vigentes_al` (una fecha) se saltan los lotes
+    vencidos a esa fecha.
+
+    Debe llamarse dentro de una transacción. Primero bloquea los productos en
+    orden de pk (ver bloquear_productos), así que dos cajas que venden lo mismo
+    se turnan en vez de leer los mismos lotes. Después lee y bloquea, en una
+    sola consulta con select_for_update, sólo los lotes que hacen falta para
+    cubrir lo pedido (ver lotes_necesarios), y todos los lotes tocados se
+    escriben con un único bulk_update, así que el costo no depende de cuántos
+    lotes tenga cada producto.
+
+    No toca Product.stock: el llamador registra la salida en el libro con
+    registrar_movimientos(movimientos_de_asignacion(...)).
+
+    Devuelve {producto_id: [(lote, cantidad_tomada), ...]}. Si algún producto
+    no alcanza, lanza StockInsuficiente sin modificar nada.
+    """
+    productos = {p.pk: p for p in demanda}
+    # Todo en milésimas exactas: restar en el bucle nunca deja residuos de redondeo
+    restante = {p.pk: redondear(c) for p, c in demanda.items()}
+    asignaciones = {pk: [] for pk in restante}
+    pendientes = {pk for pk, c in restante.items() if c > 0}
+    if pendientes:
+        bloquear_productos(pendientes)
+        lotes = (
+            ProductBatch.objects.select_for_update()
+            .filter(pk__in=lotes_necesarios({pk: restante[pk] for pk in pendientes}, vigentes_al).values("pk").order_by())
+            .order_by("producto_id", *ORDEN_FEFO)
+            .only("id", "producto_id", "cantidad")
+        )
+        for lote in lotes:
+            pk = lote.producto_id
+            tomar = min(lote.cantidad, restante[pk])
+            if tomar <= 0:
+                # Sólo con sumas de punto flotante (SQLite) puede colarse un lote de más
+                continue
+            lote.cantidad -= tomar
+            restante[pk] -= tomar
+            asignaciones[pk].append((lote, tomar))
+            if restante[pk] <= 0:
+                pendientes.discard(pk)
+
+    if pendientes:
+        pk = min(pendientes)
+        solicitado = redondear(demanda[productos[pk]])
+        raise StockInsuficiente(productos[pk], solicitado, solicitado - restante[pk])
+
+    tocados = [lote for lista in asignaciones.values() for lote, _ in lista]
+    if tocados:
+        ProductBatch.objects.bulk_update(tocados, ["cantidad"])
+    return asignaciones
+
+
+def asignar_fefo(producto, cantidad, tipo="VENTA", venta=None, vigentes_al=None):
+    """
+    Descuenta `cantidad` de los lotes de `producto` en orden FEFO y registra
+    la salida en el libro de stock.
+
+    Devuelve la lista de (lote, cantidad_tomada). Ver asignar_fefo_carrito.
+    """
+    asignaciones = asignar_fefo_carrito({producto: cantidad}, vigentes_al=vigentes_al)
+    registrar_movimientos(movimientos_de_asignacion(asignaciones, tipo=tipo, venta=venta))
+    return asignaciones[producto.pk]
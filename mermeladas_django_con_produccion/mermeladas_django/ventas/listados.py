@@ -0,0 +1,40 @@
+from django.db import connection
+
+from .paginacion import CursorPaginationMixin
+
+
+def lookup_busqueda():
+    """
+    En PostgreSQL se busca por subcadena (la cubre un índice trigram sobre
+    UPPER(nombre)); en el resto por prefijo, que sí puede usar un índice
+    B-tree (NOCASE en SQLite).
+    """
+    return "icontains" if connection.vendor == "postgresql" else "istartswith"
+
+
+class ListadoMixin(CursorPaginationMixin):
+    """
+    Base común de los listados del catálogo: paginación por cursor,
+    búsqueda por `campo_busqueda` (?q=), proyección de columnas con only()
+    y joins de los objetos relacionados que muestra la plantilla.
+    """
+    orden_cursor = ("nombre", "id")
+    campos = None
+    relacionados = ()
+    campo_busqueda = "nombre"
+    parametro_busqueda = "q"
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.relacionados:
+            queryset = queryset.select_related(*self.relacionados)
+        if self.campos:
+            queryset = queryset.only(*self.campos)
+        self.busqueda = self.request.GET.get(self.parametro_busqueda, "").strip()
+        if self.busqueda:
+            queryset = queryset.filter(**{f"{self.campo_busqueda}__{lookup_busqueda()}": self.busqueda})
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        kwargs["busqueda"] = self.busqueda
+        return super().get_context_data(**kwargs)
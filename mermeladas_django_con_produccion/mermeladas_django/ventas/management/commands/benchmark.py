@@ -0,0 +1,69 @@
+import json
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from ventas.benchmark import ESCENARIOS, comparar, correr, leer_informe
+
+
+class _Revertir(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide latencia (p50/p90/p95/p99) y consultas por escenario de venta y producción sobre los datos "
+        "de la base, sin dejar cambios. Con --comparar falla si hay regresiones respecto de una línea base."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("escenarios", nargs="*", help=f"Por defecto, todos: {', '.join(ESCENARIOS)}.")
+        parser.add_argument("--iteraciones", type=int, default=30)
+        parser.add_argument("--calentamiento", type=int, default=2)
+        parser.add_argument("--semilla", type=int, default=42)
+        parser.add_argument("--salida", help="Guarda el informe JSON en este archivo.")
+        parser.add_argument("--comparar", help="Informe JSON de línea base.")
+        parser.add_argument("--tolerancia", type=float, default=0.2, help="Aumento de p95 tolerado (0.2 = 20%%).")
+
+    def handle(self, *args, **options):
+        desconocidos = set(options["escenarios"]) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}.")
+        base = leer_informe(options["comparar"]) if options["comparar"] else None
+
+        setup_test_environment()
+        try:
+            # Los PDF van a un directorio temporal (caché en frío) y todo lo escrito en la base se revierte
+            with tempfile.TemporaryDirectory() as directorio, override_settings(COMPROBANTES_DIR=directorio):
+                try:
+                    with transaction.atomic():
+                        informe = correr(options["escenarios"], options["iteraciones"],
+                                         options["calentamiento"], options["semilla"])
+                        raise _Revertir
+                except _Revertir:
+                    pass
+        finally:
+            teardown_test_environment()
+
+        self._mostrar(informe)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                json.dump(informe, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Informe guardado en {options['salida']}.")
+        if base is not None:
+            regresiones = comparar(informe, base, options["tolerancia"])
+            if regresiones:
+                raise CommandError("Regresiones respecto de la línea base:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto de la línea base."))
+
+    def _mostrar(self, informe):
+        volumen = ", ".join(f"{k}={v}" for k, v in informe["volumen"].items())
+        self.stdout.write(f"Base {informe['motor']}: {volumen}")
+        self.stdout.write(f"{'escenario':<22}{'p50':>9}{'p95':>9}{'p99':>9}{'consultas':>11}{'errores':>9}")
+        for nombre, r in informe["escenarios"].items():
+            self.stdout.write(
+                f"{nombre:<22}{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}"
+                f"{r['consultas_max']:>11}{r['errores']:>9}"
+            )
@@ -0,0 +1,100 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ventas.benchmark import PERCENTILES
+from ventas.carga import ESCENARIOS, comparar_carga, correr_carga, leer_informe
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Throughput (req/s) y latencia de los listados, detalles y la API bajo concurrencia fija. "
+        "Levanta uvicorn con la app ASGI sobre la base configurada (o usa --url) y le pega con "
+        "--concurrencia conexiones durante --duracion segundos por escenario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("escenarios", nargs="*", help=f"Por defecto, todos: {', '.join(ESCENARIOS)}.")
+        parser.add_argument("--url", help="Servidor ya levantado (p. ej. http://127.0.0.1:8000); si no, se levanta uvicorn.")
+        parser.add_argument("--trabajadores", type=int, default=1, help="Procesos de uvicorn.")
+        parser.add_argument("--concurrencia", type=int, default=32)
+        parser.add_argument("--duracion", type=float, default=10.0, help="Segundos por escenario.")
+        parser.add_argument("--salida", help="Guarda el informe JSON en este archivo.")
+        parser.add_argument("--comparar", help="Informe JSON de línea base.")
+        parser.add_argument("--tolerancia", type=float, default=0.1, help="Empeoramiento tolerado (0.1 = 10%%).")
+
+    def handle(self, *args, **options):
+        desconocidos = set(options["escenarios"]) - set(ESCENARIOS)
+        if desconocidos:
+            raise CommandError(f"Escenarios desconocidos: {', '.join(sorted(desconocidos))}.")
+        base = leer_informe(options["comparar"]) if options["comparar"] else None
+
+        if options["url"]:
+            informe = correr_carga(options["url"].rstrip("/"), options["escenarios"], options["concurrencia"],
+                                   options["duracion"])
+        else:
+            proceso, url = self._levantar_uvicorn(options["trabajadores"])
+            try:
+                informe = correr_carga(url, options["escenarios"], options["concurrencia"], options["duracion"],
+                                       servidor=f"uvicorn ({options['trabajadores']} proceso/s)")
+            finally:
+                proceso.terminate()
+                proceso.wait(timeout=30)
+
+        self._mostrar(informe)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as f:
+                json.dump(informe, f, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Informe guardado en {options['salida']}.")
+        if base is not None:
+            regresiones = comparar_carga(informe, base, options["tolerancia"])
+            if regresiones:
+                raise CommandError("Regresiones respecto de la línea base:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto de la línea base."))
+
+    def _levantar_uvicorn(self, trabajadores):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError("Falta uvicorn (pip install uvicorn), o indique un servidor con --url.")
+        puerto = _puerto_libre()
+        proceso = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "mermeladas.asgi:application", "--host", "127.0.0.1",
+             "--port", str(puerto), "--workers", str(trabajadores), "--log-level", "warning", "--no-access-log"],
+            cwd=settings.BASE_DIR, env=os.environ.copy(),
+        )
+        url = f"http://127.0.0.1:{puerto}"
+        limite = time.monotonic() + 30
+        while time.monotonic() < limite:
+            if proceso.poll() is not None:
+                raise CommandError("uvicorn terminó al iniciar (ver el error arriba).")
+            try:
+                urllib.request.urlopen(f"{url}/api/stock/?limite=1", timeout=2).read()
+                return proceso, url
+            except OSError:
+                time.sleep(0.2)
+        proceso.terminate()
+        raise CommandError("uvicorn no respondió en 30 s.")
+
+    def _mostrar(self, informe):
+        volumen = ", ".join(f"{k}={v}" for k, v in informe["volumen"].items())
+        self.stdout.write(f"Base {informe['motor']}: {volumen}")
+        self.stdout.write(f"{informe['servidor']}, {informe['concurrencia']} conexiones, {informe['duracion_s']} s por escenario")
+        columnas = "".join(f"{f'p{p}':>9}" for p in PERCENTILES if p != 90)
+        self.stdout.write(f"{'escenario':<18}{'req/s':>9}{columnas}{'errores':>9}")
+        for nombre, r in informe["escenarios"].items():
+            latencias = "".join(f"{r.get(f'p{p}_ms', 0):>9.1f}" for p in PERCENTILES if p != 90)
+            self.stdout.write(f"{nombre:<18}{r['rps']:>9.1f}{latencias}{r['errores']:>9}")
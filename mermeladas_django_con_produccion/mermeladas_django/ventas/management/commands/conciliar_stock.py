@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from ventas.conciliacion import PRODUCTOS_POR_BLOQUE, conciliar_stock
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia Product.stock con la suma de sus lotes: informa la desviación y, con --corregir, "
+        "la ajusta con movimientos AJUSTE en el libro de stock, por bloques de productos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corregir", action="store_true", help="Ajusta el stock al saldo de los lotes.")
+        parser.add_argument("--bloque", type=int, default=PRODUCTOS_POR_BLOQUE,
+                            help=f"Productos por bloque (por defecto {PRODUCTOS_POR_BLOQUE}).")
+        parser.add_argument("--json", action="store_true", help="Imprime sólo las métricas, en JSON.")
+
+    def handle(self, *args, **options):
+        detalle = None if options["json"] else (
+            lambda pk, stock, saldo: self.stdout.write(f"{pk}: stock {stock}, lotes {saldo} ({stock - saldo:+})")
+        )
+        inicio = time.perf_counter()
+        resumen = conciliar_stock(options["corregir"], options["bloque"], informar=detalle)
+        resumen["segundos"] = round(time.perf_counter() - inicio, 2)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(resumen))
+            return
+        self.stdout.write(
+            f"{resumen['revisados']} productos revisados en {resumen['segundos']} s, "
+            f"{resumen['con_diferencia']} con diferencia (sobrante {resumen['sobrante']}, "
+            f"faltante {resumen['faltante']}, máxima {resumen['desviacion_maxima']})."
+        )
+        if options["corregir"]:
+            self.stdout.write(self.style.SUCCESS(f"{resumen['corregidos']} productos ajustados."))
@@ -0,0 +1,109 @@
+import multiprocessing
+import signal
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+
+from ventas.trabajos import TAREAS, encolar, ejecutar, nombre_trabajador, purgar, recuperar_abandonados, tomar
+
+# Segundos entre revisiones de la cola vacía y entre tareas de mantenimiento del supervisor
+ESPERA_COLA = 1.0
+CADA_MANTENIMIENTO = 60
+
+
+def _trabajador(parar, espera):
+    """ Proceso trabajador: toma y ejecuta trabajos hasta que el supervisor pida parar. """
+    # Ctrl+C llega a todo el grupo de procesos: sólo el supervisor lo atiende y avisa con `parar`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    # Con fork ya está configurado; con spawn (macOS, Windows) el hijo arranca de cero
+    django.setup()
+    nombre = nombre_trabajador()
+    while not parar.is_set():
+        close_old_connections()
+        try:
+            trabajo = tomar(nombre)
+        except OperationalError:
+            # Base ocupada (p. ej. SQLite bloqueada por otra escritura): se reintenta en un momento
+            trabajo = None
+        if trabajo is None:
+            parar.wait(espera)
+        else:
+            ejecutar(trabajo)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta la cola de trabajos en segundo plano (comprobantes, exportaciones, saldos de stock, "
+        "resumen del panel) con --procesos procesos trabajadores, hasta recibir Ctrl+C o SIGTERM. "
+        "Con --una-vez vacía la cola en este proceso y termina; con --encolar agrega un trabajo (para cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procesos", type=int, default=settings.TRABAJOS_PROCESOS)
+        parser.add_argument("--una-vez", action="store_true", help="Ejecuta los trabajos disponibles y termina.")
+        parser.add_argument("--encolar", metavar="TAREA", help=f"Encola una tarea sin argumentos: {', '.join(sorted(TAREAS))}.")
+
+    def handle(self, *args, **options):
+        if options["encolar"]:
+            if options["encolar"] not in TAREAS:
+                raise CommandError(f"Tarea desconocida: {options['encolar']}.")
+            # Clave = nombre de la tarea: si cron la vuelve a encolar antes de que corra, no se duplica
+            trabajo = encolar(options["encolar"], clave=options["encolar"])
+            self.stdout.write(self.style.SUCCESS(f"Encolado: {trabajo}"))
+            return
+        if options["una_vez"]:
+            self._una_vez()
+            return
+        if options["procesos"] < 1:
+            raise CommandError("--procesos debe ser al menos 1.")
+        self._supervisar(options["procesos"])
+
+    def _una_vez(self):
+        recuperar_abandonados()
+        nombre, hechos = nombre_trabajador(), {}
+        while (trabajo := tomar(nombre)) is not None:
+            ejecutar(trabajo)
+            hechos[trabajo.estado] = hechos.get(trabajo.estado, 0) + 1
+            self.stdout.write(f"{trabajo}")
+        resumen = ", ".join(f"{n} {estado.lower()}" for estado, n in sorted(hechos.items())) or "cola vacía"
+        self.stdout.write(self.style.SUCCESS(f"Trabajos ejecutados: {resumen}."))
+
+    def _supervisar(self, procesos):
+        parar = multiprocessing.Event()
+        # El manejador sólo anota la señal: parar.set() toma un lock que el bucle puede tener tomado
+        senales = []
+        signal.signal(signal.SIGINT, lambda numero, _: senales.append(numero))
+        signal.signal(signal.SIGTERM, lambda numero, _: senales.append(numero))
+        # Los hijos no deben heredar la conexión abierta del padre
+        connections.close_all()
+        trabajadores = []
+        proximo_mantenimiento = 0.0
+        self.stdout.write(f"Corriendo trabajos con {procesos} procesos (Ctrl+C para terminar).")
+        while not senales:
+            trabajadores = [t for t in trabajadores if t.is_alive()]
+            while len(trabajadores) < procesos:
+                # Reemplaza a los que murieron (p. ej. por falta de memoria): la cola no se detiene
+                trabajador = multiprocessing.Process(target=_trabajador, args=(parar, ESPERA_COLA))
+                trabajador.start()
+                trabajadores.append(trabajador)
+            if time.monotonic() >= proximo_mantenimiento:
+                try:
+                    recuperados, purgados = recuperar_abandonados(), purgar()
+                except OperationalError:
+                    recuperados = purgados = 0
+                if recuperados or purgados:
+                    self.stdout.write(f"{recuperados} trabajos abandonados devueltos a la cola, {purgados} purgados.")
+                connections.close_all()
+                proximo_mantenimiento = time.monotonic() + CADA_MANTENIMIENTO
+            time.sleep(ESPERA_COLA)
+
+        parar.set()
+        self.stdout.write("Esperando que terminen los trabajos en curso...")
+        for trabajador in trabajadores:
+            trabajador.join()
+        self.stdout.write(self.style.SUCCESS("Trabajadores detenidos."))
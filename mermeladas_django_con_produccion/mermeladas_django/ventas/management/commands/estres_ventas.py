@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Min, Sum
+from django.utils import timezone
+
+from ventas.checkout import en_transaccion_con_reintentos, preparar_lineas, registrar_venta
+from ventas.inventario import StockInsuficiente, registrar_movimientos
+from ventas.models import Product, ProductBatch, Sale, SaleItem, StockMovement
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de estrés del checkout: varios hilos venden a la vez los mismos productos (con más demanda "
+        "que stock) y al final se verifica que no se vendió de más y que lotes, stock y libro cuadran."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=8)
+        parser.add_argument("--ventas-por-hilo", type=int, default=25)
+        parser.add_argument("--productos", type=int, default=2, help="Productos en disputa.")
+        parser.add_argument("--stock", type=int, default=60, help="Unidades iniciales de cada producto.")
+        parser.add_argument("--lotes", type=int, default=4, help="Lotes en que se reparte el stock.")
+        parser.add_argument("--conservar", action="store_true", help="No borra los productos ni las ventas de la prueba.")
+
+    def handle(self, *args, **options):
+        if connection.vendor == "sqlite" and connection.settings_dict["NAME"] in ("", ":memory:"):
+            raise CommandError("Con SQLite la prueba necesita una base en archivo (los hilos abren sus propias conexiones).")
+        productos = self._preparar(options)
+        ids = [p.pk for p in productos]
+        self.resultados = {"ventas": 0, "sin_stock": 0, "agotados": 0, "errores": []}
+        self.lock = threading.Lock()
+
+        barrera = threading.Barrier(options["hilos"])
+        hilos = [
+            threading.Thread(target=self._cajero, args=(ids, options["ventas_por_hilo"], barrera, semilla))
+            for semilla in range(options["hilos"])
+        ]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        r = self.resultados
+        self.stdout.write(
+            f"{connection.vendor}: {options['hilos']} hilos en {duracion:.2f} s -> {r['ventas']} ventas, "
+            f"{r['sin_stock']} rechazadas por stock, {r['agotados']} sin completar tras reintentos."
+        )
+        problemas = [f"Error inesperado: {e!r}" for e in r["errores"]] + self._verificar(ids, options["stock"])
+        if not options["conservar"]:
+            self._limpiar(ids)
+        if problemas:
+            raise CommandError("Inconsistencias:\n  " + "\n  ".join(problemas))
+        self.stdout.write(self.style.SUCCESS("Sin sobreventa: lotes, stock y libro de movimientos cuadran."))
+
+    @transaction.atomic
+    def _preparar(self, options):
+        marca = timezone.now().strftime("%Y%m%d%H%M%S")
+        hoy = timezone.localdate()
+        productos = Product.objects.bulk_create([
+            Product(nombre=f"Estrés checkout {marca} #{i + 1}", precio_unitario=1000)
+            for i in range(options["productos"])
+        ])
+        lotes = []
+        for producto in productos:
+            restante = options["stock"]
+            for n in range(options["lotes"]):
+                cantidad = restante if n == options["lotes"] - 1 else restante // (options["lotes"] - n)
+                restante -= cantidad
+                lotes.append(ProductBatch(
+                    producto=producto, codigo_lote=f"E{producto.pk}-{n + 1}", fecha_produccion=hoy,
+                    fecha_vencimiento=hoy + timedelta(days=30 + n), cantidad=Decimal(cantidad),
+                ))
+        ProductBatch.objects.bulk_create(lotes)
+        registrar_movimientos([
+            StockMovement(producto_id=lote.producto_id, lote=lote, tipo="PRODUCCION", cantidad=lote.cantidad,
+                          detalle="Prueba de estrés")
+            for lote in lotes
+        ])
+        return productos
+
+    def _cajero(self, ids, ventas, barrera, semilla):
+        azar = random.Random(semilla)
+        try:
+            barrera.wait()
+            for _ in range(ventas):
+                carrito = azar.sample(ids, k=azar.randint(1, len(ids)))
+                try:
+                    en_transaccion_con_reintentos(self._vender, carrito, azar)
+                    resultado = "ventas"
+                except StockInsuficiente:
+                    resultado = "sin_stock"
+                except OperationalError:
+                    resultado = "agotados"
+                with self.lock:
+                    self.resultados[resultado] += 1
+        except Exception as e:
+            with self.lock:
+                self.resultados["errores"].append(e)
+        finally:
+            connection.close()
+
+    def _vender(self, carrito, azar):
+        productos = Product.objects.in_bulk(carrito)
+        items = preparar_lineas([(productos[pk], azar.randint(1, 3), None) for pk in carrito])
+        return registrar_venta(Sale(metodo_pago="TRANSFERENCIA"), items)
+
+    def _verificar(self, ids, stock_inicial):
+        problemas = []
+        for producto in Product.objects.filter(pk__in=ids).order_by("pk"):
+            vendido = SaleItem.objects.filter(producto=producto).aggregate(s=Sum("cantidad"))["s"] or 0
+            lotes = ProductBatch.objects.filter(producto=producto).aggregate(s=Sum("cantidad"), m=Min("cantidad"))
+            libro = StockMovement.objects.filter(producto=producto).aggregate(s=Sum("cantidad"))["s"] or 0
+            self.stdout.write(f"  {producto.nombre}: vendido {vendido} de {stock_inicial}, stock {producto.stock}")
+            if vendido > stock_inicial:
+                problemas.append(f"{producto.nombre}: se vendieron {vendido} con stock {stock_inicial}")
+            if lotes["m"] is not None and lotes["m"] < 0:
+                problemas.append(f"{producto.nombre}: hay lotes con cantidad negativa")
+            if (lotes["s"] or 0) + vendido != stock_inicial:
+                problemas.append(f"{producto.nombre}: lotes ({lotes['s']}) + vendido ({vendido}) != {stock_inicial}")
+            if producto.stock != libro or producto.stock != stock_inicial - vendido:
+                problemas.append(f"{producto.nombre}: stock {producto.stock}, libro {libro}, esperado "
+                                 f"{stock_inicial - vendido}")
+        return problemas
+
+    @transaction.atomic
+    def _limpiar(self, ids):
+        for venta in Sale.objects.filter(items__producto_id__in=ids).distinct():
+            venta.delete()
+        Product.objects.filter(pk__in=ids).delete()
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ventas.comprobantes import pdf_unico_de_ventas, zip_de_ventas
+from ventas.forms import SaleFilterForm
+from ventas.models import Sale
+
+
+class Command(BaseCommand):
+    help = "Exporta los comprobantes PDF de un rango de ventas a un ZIP (o a un único PDF con --pdf-unico)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("salida", help="Archivo de destino (.zip o .pdf).")
+        parser.add_argument("--desde", help="AAAA-MM-DD")
+        parser.add_argument("--hasta", help="AAAA-MM-DD")
+        parser.add_argument("--metodo-pago", default="")
+        parser.add_argument("--pdf-unico", action="store_true", help="Un solo PDF con una página por venta.")
+        parser.add_argument("--procesos", type=int, help="Procesos para generar los PDF (por defecto, COMPROBANTES_PROCESOS).")
+
+    def handle(self, *args, **options):
+        filtros = SaleFilterForm({
+            "desde": options["desde"] or "", "hasta": options["hasta"] or "", "metodo_pago": options["metodo_pago"],
+        })
+        if not filtros.is_valid():
+            raise CommandError(filtros.errors.as_text())
+        ventas = filtros.filtrar(Sale.objects.order_by("fecha", "id"))
+
+        with open(options["salida"], "wb") as destino:
+            if options["pdf_unico"]:
+                pdf_unico_de_ventas(ventas, destino)
+            else:
+                for parte in zip_de_ventas(ventas, options["procesos"]):
+                    destino.write(parte)
+        self.stdout.write(self.style.SUCCESS(f"Comprobantes exportados en {options['salida']}."))
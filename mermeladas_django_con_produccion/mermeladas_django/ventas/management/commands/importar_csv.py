@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ventas.importacion import IMPORTADORES, importar_csv
+
+
+class Command(BaseCommand):
+    help = "Importa productos, materias primas, clientes o recetas desde un CSV con encabezado."
+
+    def add_arguments(self, parser):
+        parser.add_argument("tipo", choices=sorted(IMPORTADORES))
+        parser.add_argument("archivo")
+        parser.add_argument("--simular", action="store_true", help="Valida y muestra el resultado sin guardar.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["archivo"], encoding="utf-8-sig", newline="") as archivo:
+                resultado = importar_csv(options["tipo"], archivo, simular=options["simular"])
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+
+        for linea, texto in resultado.errores:
+            self.stderr.write(f"Línea {linea}: {texto}")
+        if resultado.total_errores > len(resultado.errores):
+            self.stderr.write(f"... y {resultado.total_errores - len(resultado.errores)} errores más.")
+        estilo = self.style.WARNING if options["simular"] or resultado.total_errores else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"{'Simulación' if options['simular'] else 'Importación'}: {resultado.filas} filas, "
+            f"{resultado.creados} creados, {resultado.actualizados} actualizados, "
+            f"{resultado.total_errores} con errores."
+        ))
@@ -0,0 +1,83 @@
+import csv
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ventas.models import Recipe
+from ventas.produccion import MateriasInsuficientes, PlanInvalido, producir_plan
+
+
+def _fecha(valor):
+    try:
+        return date.fromisoformat(valor)
+    except ValueError:
+        raise CommandError(f"Fecha inválida: {valor} (use AAAA-MM-DD).")
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta un plan de producción (varias recetas con su multiplicador) en una sola "
+        "transacción. Las recetas se indican por id o nombre: receta=multiplicador."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("filas", nargs="*", metavar="receta=multiplicador")
+        parser.add_argument("--archivo", help="CSV con columnas receta,multiplicador (con encabezado).")
+        parser.add_argument("--vence", required=True, type=_fecha, help="Fecha de vencimiento de los lotes.")
+        parser.add_argument("--fecha", type=_fecha, help="Fecha de producción (por defecto, hoy).")
+        parser.add_argument("--simular", action="store_true",
+                            help="Verifica el plan y muestra los lotes sin guardar nada.")
+
+    def _leer_filas(self, options):
+        filas = []
+        for texto in options["filas"]:
+            receta, sep, mult = texto.rpartition("=")
+            if not sep:
+                raise CommandError(f"Fila inválida: {texto} (use receta=multiplicador).")
+            filas.append((receta.strip(), mult.strip()))
+        if options["archivo"]:
+            with open(options["archivo"], newline="", encoding="utf-8") as f:
+                filas.extend((r["receta"].strip(), r["multiplicador"].strip()) for r in csv.DictReader(f))
+        if not filas:
+            raise CommandError("Indique al menos una receta.")
+        return filas
+
+    def _resolver(self, filas):
+        """ Traduce ids/nombres a recetas con una sola consulta. """
+        claves = {receta for receta, _ in filas}
+        ids = {int(c) for c in claves if c.isdigit()}
+        recetas = Recipe.objects.filter(Q(pk__in=ids) | Q(nombre__in=claves))
+        por_clave = {}
+        for receta in recetas:
+            por_clave[str(receta.pk)] = receta
+            por_clave[receta.nombre] = receta
+        faltan = sorted(c for c in claves if c not in por_clave)
+        if faltan:
+            raise CommandError("Recetas inexistentes: " + ", ".join(faltan))
+        return [(por_clave[receta], mult) for receta, mult in filas]
+
+    def handle(self, *args, **options):
+        plan = self._resolver(self._leer_filas(options))
+        fecha = options["fecha"] or timezone.localdate()
+        try:
+            with transaction.atomic():
+                lotes = producir_plan(plan, fecha, options["vence"])
+                if options["simular"]:
+                    transaction.set_rollback(True)
+        except MateriasInsuficientes as e:
+            for mp, requerido, disponible in e.faltantes:
+                self.stderr.write(f"Falta {mp.nombre}: requiere {requerido}, disponible {disponible}")
+            raise CommandError("Materia prima insuficiente; no se produjo nada.")
+        except (PlanInvalido, ArithmeticError) as e:
+            raise CommandError(str(e))
+
+        for lote in lotes:
+            self.stdout.write(f"{lote.codigo_lote}: +{lote.cantidad} (producto {lote.producto_id})")
+        resumen = f"{len(lotes)} lotes"
+        if options["simular"]:
+            self.stdout.write(self.style.WARNING(f"Simulación: {resumen}, sin cambios guardados."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Plan registrado: {resumen}."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ventas.cache import invalidar
+from ventas.resumen import reconstruir_resumen
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el resumen diario de ventas (panel) a partir de los ítems de venta."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", help="Sólo desde esta fecha (AAAA-MM-DD); por defecto, todo.")
+
+    def handle(self, *args, **options):
+        filas = reconstruir_resumen(desde=options["desde"])
+        invalidar("ventas")
+        self.stdout.write(self.style.SUCCESS(f"Resumen diario reconstruido: {filas} filas."))
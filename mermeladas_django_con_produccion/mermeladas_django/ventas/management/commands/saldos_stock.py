@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from ventas.cache import invalidar
+from ventas.cantidades import redondear
+from ventas.models import Product, StockMovement, nueva_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifica (o reconstruye con --reconstruir) Product.stock a partir del libro "
+        "de movimientos, recorriendo los productos por bloques."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reconstruir", action="store_true",
+                            help="Corrige Product.stock con el saldo del libro.")
+        parser.add_argument("--bloque", type=int, default=1000,
+                            help="Productos por bloque (por defecto 1000).")
+
+    def handle(self, *args, **options):
+        bloque = options["bloque"]
+        reconstruir = options["reconstruir"]
+        revisados = diferencias = 0
+        ultimo = 0
+
+        while True:
+            with transaction.atomic():
+                productos = Product.objects.filter(pk__gt=ultimo).order_by("pk").only("id", "nombre", "stock")
+                if reconstruir:
+                    # Bloquea el bloque para no pisar ventas concurrentes al corregir
+                    productos = productos.select_for_update()
+                productos = list(productos[:bloque])
+                if not productos:
+                    break
+                ultimo = productos[-1].pk
+
+                saldos = dict(
+                    StockMovement.objects.filter(producto_id__in=[p.pk for p in productos])
+                    .values_list("producto_id")
+                    .annotate(saldo=Sum("cantidad"))
+                    .order_by()
+                )
+                corregir = []
+                for p in productos:
+                    # SUM en SQLite se calcula en punto flotante: se lleva a milésimas antes de comparar
+                    saldo = redondear(saldos.get(p.pk))
+                    if p.stock != saldo:
+                        diferencias += 1
+                        self.stdout.write(f"{p.pk} {p.nombre}: stock {p.stock}, libro {saldo}")
+                        p.stock = saldo
+                        p.version = nueva_version()
+                        corregir.append(p)
+                if reconstruir and corregir:
+                    Product.objects.bulk_update(corregir, ["stock", "version"])
+                    invalidar("inventario")
+            revisados += len(productos)
+
+        accion = "corregidos" if reconstruir else "con diferencias"
+        self.stdout.write(self.style.SUCCESS(f"{revisados} productos revisados, {diferencias} {accion}."))
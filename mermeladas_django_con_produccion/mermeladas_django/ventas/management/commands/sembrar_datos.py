@@ -0,0 +1,188 @@
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ventas.inventario import registrar_movimientos
+from ventas.models import (
+    Category, Client, PAYMENT_CHOICES, Product, ProductBatch, RawMaterial, Recipe, RecipeItem, Sale, SaleItem,
+    StockMovement, calcular_subtotal,
+)
+from ventas.resumen import reconstruir_resumen
+
+FRUTAS = (
+    "Frutilla", "Frambuesa", "Mora", "Arándano", "Damasco", "Durazno", "Ciruela", "Membrillo", "Naranja",
+    "Limón", "Higo", "Cereza", "Maqui", "Murta", "Calafate", "Rosa Mosqueta", "Manzana", "Pera", "Kiwi", "Piña",
+)
+PRESENTACIONES = (("250 g", 2490), ("400 g", 3490), ("1 kg", 7990), ("Sachet 30 g", 490), ("Pote 5 kg", 32990))
+INSUMOS = ("Azúcar", "Pectina", "Ácido cítrico", "Frasco", "Tapa", "Etiqueta", "Jugo de limón", "Stevia")
+NOMBRES = ("Ana", "Luis", "Carla", "Pedro", "Sofía", "Diego", "Valentina", "Tomás", "Camila", "Matías")
+APELLIDOS = ("González", "Muñoz", "Rojas", "Díaz", "Pérez", "Soto", "Contreras", "Silva", "Martínez", "Sepúlveda")
+BLOQUE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        "Llena una base vacía con datos sintéticos realistas (catálogo, lotes con vencimientos "
+        "repartidos, clientes y años de ventas) para pruebas de carga y el comando benchmark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--productos", type=int, default=2000)
+        parser.add_argument("--materias", type=int, default=150)
+        parser.add_argument("--recetas", type=int, default=300)
+        parser.add_argument("--clientes", type=int, default=5000)
+        parser.add_argument("--lotes-por-producto", type=int, default=4)
+        parser.add_argument("--dias", type=int, default=730, help="Días de historia de ventas (por defecto, 2 años).")
+        parser.add_argument("--ventas-por-dia", type=int, default=60)
+        parser.add_argument("--semilla", type=int, default=42)
+
+    def handle(self, *args, **options):
+        if Product.objects.exists() or RawMaterial.objects.exists() or Sale.objects.exists():
+            raise CommandError("La base ya tiene datos: sembrar_datos sólo trabaja sobre una base vacía.")
+        self.azar = random.Random(options["semilla"])
+        self.hoy = timezone.localdate()
+
+        with transaction.atomic():
+            productos = self._catalogo(options)
+            self._recetas(options, productos)
+            self._lotes(options, productos)
+            clientes = self._clientes(options)
+        self._ventas(options, productos, clientes)
+        filas = reconstruir_resumen()
+        self.stdout.write(self.style.SUCCESS(f"Datos sembrados ({filas} filas de resumen diario)."))
+
+    def _catalogo(self, options):
+        categorias = Category.objects.bulk_create([Category(nombre=f"Mermeladas de {f}") for f in FRUTAS])
+        productos = []
+        for i in range(options["productos"]):
+            fruta = FRUTAS[i % len(FRUTAS)]
+            presentacion, precio = PRESENTACIONES[(i // len(FRUTAS)) % len(PRESENTACIONES)]
+            productos.append(Product(
+                nombre=f"Mermelada de {fruta} {presentacion} #{i + 1:05d}",
+                categoria=categorias[i % len(FRUTAS)],
+                unidad="un",
+                precio_unitario=precio + self.azar.randrange(-300, 300, 10),
+                activo=self.azar.random() > 0.03,
+            ))
+        productos = Product.objects.bulk_create(productos, batch_size=BLOQUE)
+        self.stdout.write(f"{len(productos)} productos en {len(categorias)} categorías.")
+        return productos
+
+    def _recetas(self, options, productos):
+        materias = [
+            RawMaterial(
+                nombre=f"{(FRUTAS + INSUMOS)[i % len(FRUTAS + INSUMOS)]} #{i + 1:04d}",
+                unidad="un" if i % len(FRUTAS + INSUMOS) >= len(FRUTAS) + 3 else "g",
+                costo_unitario=self.azar.randint(1, 12),
+                stock=Decimal(self.azar.randint(50_000, 500_000)),
+            )
+            for i in range(options["materias"])
+        ]
+        materias = RawMaterial.objects.bulk_create(materias, batch_size=BLOQUE)
+        recetas = Recipe.objects.bulk_create([
+            Recipe(
+                nombre=f"Receta {productos[i % len(productos)].nombre}",
+                producto_final=productos[i % len(productos)],
+                rendimiento_unidades=Decimal(self.azar.choice((12, 24, 36, 48))),
+            )
+            for i in range(min(options["recetas"], len(productos)))
+        ], batch_size=BLOQUE)
+        items = []
+        for receta in recetas:
+            for materia in self.azar.sample(materias, k=min(len(materias), self.azar.randint(3, 8))):
+                cantidad = Decimal(self.azar.randint(5, 2000)) / 10
+                items.append(RecipeItem(receta=receta, materia_prima=materia, cantidad=cantidad,
+                                        unidad=materia.unidad, cantidad_base=cantidad))
+        RecipeItem.objects.bulk_create(items, batch_size=BLOQUE)
+        self.stdout.write(f"{len(materias)} materias primas, {len(recetas)} recetas ({len(items)} ingredientes).")
+
+    def _lotes(self, options, productos):
+        """ Lotes con vencimientos repartidos (algunos ya vencidos); su stock entra por el libro. """
+        lotes = []
+        for producto in productos:
+            for n in range(options["lotes_por_producto"]):
+                produccion = self.hoy - timedelta(days=self.azar.randint(1, 240))
+                lotes.append(ProductBatch(
+                    producto=producto,
+                    codigo_lote=f"L{producto.pk}-{n + 1:02d}",
+                    fecha_produccion=produccion,
+                    fecha_vencimiento=self.hoy + timedelta(days=self.azar.randint(-30, 365)),
+                    cantidad=Decimal(self.azar.randint(5, 120)),
+                ))
+        lotes = ProductBatch.objects.bulk_create(lotes, batch_size=BLOQUE)
+        for inicio in range(0, len(lotes), BLOQUE):
+            registrar_movimientos([
+                StockMovement(producto_id=lote.producto_id, lote=lote, tipo="PRODUCCION", cantidad=lote.cantidad,
+                              detalle="Datos sintéticos")
+                for lote in lotes[inicio:inicio + BLOQUE]
+            ])
+        self.stdout.write(f"{len(lotes)} lotes.")
+
+    def _clientes(self, options):
+        clientes = Client.objects.bulk_create([
+            Client(
+                nombre=f"{self.azar.choice(NOMBRES)} {self.azar.choice(APELLIDOS)} {i + 1:05d}",
+                email=f"cliente{i + 1}@example.com" if self.azar.random() > 0.3 else None,
+                direccion=f"Calle {self.azar.randint(1, 999)} #{self.azar.randint(1, 9999)}",
+            )
+            for i in range(options["clientes"])
+        ], batch_size=BLOQUE)
+        self.stdout.write(f"{len(clientes)} clientes.")
+        return clientes
+
+    def _ventas(self, options, productos, clientes):
+        """ Ventas diarias con horario de tienda; pocos productos concentran la mayoría de las ventas. """
+        zona = timezone.get_current_timezone()
+        pesos = [1 / (i + 1) for i in range(len(productos))]
+        metodos = [clave for clave, _ in PAYMENT_CHOICES]
+        total_ventas = total_items = 0
+        ventas, lineas = [], []
+
+        for dia in range(options["dias"], 0, -1):
+            fecha = self.hoy - timedelta(days=dia)
+            por_dia = max(0, int(self.azar.gauss(options["ventas_por_dia"], options["ventas_por_dia"] / 4)))
+            for _ in range(por_dia):
+                momento = datetime.combine(fecha, time(9), zona) + timedelta(seconds=self.azar.randint(0, 11 * 3600))
+                elegidos = self.azar.choices(productos, weights=pesos, k=self.azar.randint(1, 5))
+                items = []
+                for producto in dict.fromkeys(elegidos):
+                    cantidad = Decimal(self.azar.randint(1, 6))
+                    items.append(SaleItem(producto=producto, cantidad=cantidad, precio_unitario=producto.precio_unitario,
+                                          subtotal=calcular_subtotal(producto.precio_unitario, cantidad)))
+                total = sum(item.subtotal for item in items)
+                metodo = self.azar.choice(metodos)
+                pagado = -(-total // 1000) * 1000 if metodo == "EFECTIVO" else None
+                ventas.append(Sale(
+                    cliente=self.azar.choice(clientes) if clientes and self.azar.random() > 0.25 else None,
+                    fecha=momento, total=total, metodo_pago=metodo, monto_pagado=pagado,
+                    cambio=(pagado - total) if pagado else 0,
+                ))
+                lineas.append(items)
+            if len(ventas) >= BLOQUE:
+                total_items += self._guardar_ventas(ventas, lineas)
+                total_ventas += len(ventas)
+                ventas, lineas = [], []
+        if ventas:
+            total_items += self._guardar_ventas(ventas, lineas)
+            total_ventas += len(ventas)
+        self.stdout.write(f"{total_ventas} ventas con {total_items} ítems.")
+
+    @transaction.atomic
+    def _guardar_ventas(self, ventas, lineas):
+        fechas = [venta.fecha for venta in ventas]
+        ventas = Sale.objects.bulk_create(ventas)
+        # fecha es auto_now_add: bulk_create la pisa con la hora actual, se restaura con un UPDATE
+        for venta, fecha in zip(ventas, fechas):
+            venta.fecha = fecha
+        Sale.objects.bulk_update(ventas, ["fecha"])
+        items = []
+        for venta, items_venta in zip(ventas, lineas):
+            for item in items_venta:
+                item.venta = venta
+                items.append(item)
+        SaleItem.objects.bulk_create(items, batch_size=BLOQUE)
+        return len(items)
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+
+from ventas.vencimientos import LOTES_POR_BARRIDO, lotes_vencidos, vencer_lotes
+
+
+class Command(BaseCommand):
+    help = (
+        "Da de baja los lotes vencidos con saldo (movimiento VENCIMIENTO en el libro de stock). "
+        "Pensado para correr a diario desde cron o el programador de tareas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fecha", help="Vencidos a esta fecha (AAAA-MM-DD); por defecto, hoy.")
+        parser.add_argument("--bloque", type=int, default=LOTES_POR_BARRIDO, help="Lotes por transacción.")
+        parser.add_argument("--simular", action="store_true", help="Sólo informa lo que se daría de baja.")
+
+    def handle(self, *args, **options):
+        try:
+            fecha = date.fromisoformat(options["fecha"]) if options["fecha"] else None
+        except ValueError:
+            raise CommandError("--fecha debe tener el formato AAAA-MM-DD.")
+
+        if options["simular"]:
+            resumen = lotes_vencidos(fecha).aggregate(lotes=Count("id"), unidades=Sum("cantidad"))
+            self.stdout.write(f"Se darían de baja {resumen['lotes']} lotes ({resumen['unidades'] or 0} unidades).")
+            return
+        lotes, unidades = vencer_lotes(fecha, options["bloque"])
+        self.stdout.write(self.style.SUCCESS(f"Lotes vencidos dados de baja: {lotes} ({unidades} unidades)."))
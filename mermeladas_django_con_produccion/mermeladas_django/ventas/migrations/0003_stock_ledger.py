@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def saldos_iniciales(apps, schema_editor):
+    """ Abre el libro con un movimiento de ajuste por el stock actual de cada producto. """
+    Product = apps.get_model("ventas", "Product")
+    StockMovement = apps.get_model("ventas", "StockMovement")
+    StockMovement.objects.bulk_create(
+        StockMovement(producto_id=pk, tipo="AJUSTE", cantidad=stock, detalle="Saldo inicial")
+        for pk, stock in Product.objects.exclude(stock=0).values_list("pk", "stock").iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0002_alter_product_stock_alter_rawmaterial_stock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='product',
+            name='stock',
+            field=models.DecimalField(decimal_places=3, default=0, help_text='Saldo del libro de movimientos (se mantiene con StockMovement)', max_digits=12),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('PRODUCCION', 'Producción'), ('VENTA', 'Venta'), ('AJUSTE', 'Ajuste'), ('VENCIMIENTO', 'Vencimiento')], max_length=12)),
+                ('cantidad', models.DecimalField(decimal_places=3, help_text='Positivo entra, negativo sale', max_digits=12)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('detalle', models.CharField(blank=True, max_length=200)),
+                ('lote', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='ventas.productbatch')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='ventas.product')),
+                ('venta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos', to='ventas.sale')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'ordering': ['-fecha', '-id'],
+            },
+        ),
+        migrations.RunPython(saldos_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0003_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['stock'], name='producto_activo_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productbatch',
+            index=models.Index(condition=models.Q(('cantidad__gt', 0)), fields=['producto', 'fecha_vencimiento', 'fecha_produccion', 'id'], name='lote_fefo_disponible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['cliente', '-fecha'], name='venta_cliente_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0004_indices_hot_paths'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['-fecha', '-id'], name='venta_fecha_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['metodo_pago', '-fecha', '-id'], name='venta_metodo_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:16
+
+from django.db import migrations, models
+
+# Tablas con búsqueda por nombre en los listados
+TABLAS_BUSQUEDA = ["ventas_product", "ventas_client", "ventas_rawmaterial", "ventas_recipe"]
+
+
+def crear_indices_busqueda(apps, schema_editor):
+    """ Índice de búsqueda según el motor: trigram en PostgreSQL, NOCASE en SQLite. """
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for tabla in TABLAS_BUSQUEDA:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{tabla}_nombre_trgm" ON "{tabla}" '
+                f'USING gin (UPPER("nombre"::text) gin_trgm_ops)'
+            )
+    elif vendor == "sqlite":
+        for tabla in TABLAS_BUSQUEDA:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS "{tabla}_nombre_nocase" ON "{tabla}" ("nombre" COLLATE NOCASE)'
+            )
+
+
+def borrar_indices_busqueda(apps, schema_editor):
+    sufijo = {"postgresql": "trgm", "sqlite": "nocase"}.get(schema_editor.connection.vendor)
+    if sufijo:
+        for tabla in TABLAS_BUSQUEDA:
+            schema_editor.execute(f'DROP INDEX IF EXISTS "{tabla}_nombre_{sufijo}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0005_indices_listado_ventas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['nombre', 'id'], name='cliente_nombre_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['nombre', 'id'], name='producto_nombre_id_idx'),
+        ),
+        migrations.RunPython(crear_indices_busqueda, borrar_indices_busqueda),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0006_indices_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('metodo_pago', models.CharField(choices=[('EFECTIVO', 'Efectivo'), ('TRANSFERENCIA', 'Transferencia'), ('DEBITO', 'Débito'), ('CREDITO', 'Crédito')], max_length=20)),
+                ('unidades', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('monto', models.BigIntegerField(default=0, help_text='Suma de subtotales (CLP entero)')),
+                ('lineas', models.IntegerField(default=0, help_text='Cantidad de ítems de venta')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='ventas.product')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Ventas',
+                'verbose_name_plural': 'Resúmenes Diarios de Ventas',
+                'constraints': [models.UniqueConstraint(fields=('fecha', 'producto', 'metodo_pago'), name='resumen_dia_producto_metodo_uniq')],
+            },
+        ),
+    ]
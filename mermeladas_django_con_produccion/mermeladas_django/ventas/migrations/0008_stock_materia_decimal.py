@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:20
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0007_resumen_diario_ventas'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='rawmaterial',
+            name='stock',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), help_text='Stock disponible en la unidad de la materia prima', max_digits=14),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0008_stock_materia_decimal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='productbatch',
+            index=models.Index(condition=models.Q(('cantidad__gt', 0)), fields=['fecha_vencimiento', 'id'], name='lote_vencimiento_idx'),
+        ),
+    ]
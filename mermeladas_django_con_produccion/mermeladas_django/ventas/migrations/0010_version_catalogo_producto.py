@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:44
+
+import ventas.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0009_indice_vencimiento_lotes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='version',
+            field=models.BigIntegerField(default=ventas.models.nueva_version, editable=False, help_text='Versión del último cambio de datos o de stock (API de catálogo)'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['version'], name='producto_version_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-17 18:57
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0010_version_catalogo_producto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tarea', models.CharField(max_length=100)),
+                ('argumentos', models.JSONField(blank=True, default=dict)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('EN_CURSO', 'En curso'), ('HECHO', 'Hecho'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=10)),
+                ('prioridad', models.SmallIntegerField(default=0, help_text='Se toman primero los de mayor prioridad')),
+                ('clave', models.CharField(blank=True, help_text='Deduplicación: un solo trabajo pendiente o en curso por clave', max_length=200, null=True)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField(default=3)),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now, help_text='No se toma antes (espera entre reintentos)')),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('iniciado', models.DateTimeField(blank=True, null=True)),
+                ('terminado', models.DateTimeField(blank=True, null=True)),
+                ('trabajador', models.CharField(blank=True, max_length=100)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name': 'Trabajo',
+                'verbose_name_plural': 'Trabajos',
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['-prioridad', 'disponible_desde', 'id'], name='job_pendientes_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('estado__in', ['PENDIENTE', 'EN_CURSO'])), fields=('clave',), name='job_clave_activa_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:14
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def cantidades_base(apps, schema_editor):
+    """ Los ingredientes existentes estaban en la unidad de su materia prima: la toman y cantidad_base = cantidad. """
+    RawMaterial = apps.get_model("ventas", "RawMaterial")
+    RecipeItem = apps.get_model("ventas", "RecipeItem")
+    RecipeItem.objects.update(
+        unidad=models.Subquery(RawMaterial.objects.filter(pk=models.OuterRef("materia_prima_id")).values("unidad")[:1]),
+        cantidad_base=models.F("cantidad"),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0011_cola_trabajos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeitem',
+            name='cantidad_base',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), editable=False, help_text='Cantidad en la unidad de la materia prima (costos, producción y MRP)', max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='recipeitem',
+            name='unidad',
+            field=models.CharField(blank=True, choices=[('g', 'Gramos (g)'), ('kg', 'Kilogramos (kg)'), ('ml', 'Mililitros (ml)'), ('l', 'Litros (L)'), ('un', 'Unidad (un)')], help_text='Unidad de la cantidad (vacía: la de la materia prima)', max_length=2),
+        ),
+        migrations.RunPython(cantidades_base, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+FILAS_POR_BLOQUE = 2000
+
+
+def reconstruir_resumen(apps, schema_editor):
+    """
+    Arma el resumen diario con las ventas que ya había (0007 creó la tabla
+    vacía): lo mismo que resumen.reconstruir_resumen(), con los modelos de la
+    migración.
+    """
+    DailySalesSummary = apps.get_model("ventas", "DailySalesSummary")
+    SaleItem = apps.get_model("ventas", "SaleItem")
+    DailySalesSummary.objects.all().delete()
+    filas = (
+        SaleItem.objects.annotate(dia=TruncDate("venta__fecha", tzinfo=timezone.get_current_timezone()))
+        .values("dia", "producto_id", "venta__metodo_pago")
+        .annotate(unidades=Sum("cantidad"), monto=Sum("subtotal"), lineas=Count("id"))
+        .order_by()
+    )
+    bloque = []
+    for fila in filas.iterator(chunk_size=FILAS_POR_BLOQUE):
+        bloque.append(DailySalesSummary(
+            fecha=fila["dia"], producto_id=fila["producto_id"], metodo_pago=fila["venta__metodo_pago"],
+            unidades=fila["unidades"], monto=fila["monto"], lineas=fila["lineas"],
+        ))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            DailySalesSummary.objects.bulk_create(bloque)
+            bloque = []
+    DailySalesSummary.objects.bulk_create(bloque)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0012_unidades_ingredientes'),
+    ]
+
+    operations = [
+        migrations.RunPython(reconstruir_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-17 19:24
+
+import time
+
+from django.db import migrations, models
+
+
+def versiones_iniciales(apps, schema_editor):
+    """ Los grupos arrancan en una versión basada en el reloj, como las que creaba la caché. """
+    CacheVersion = apps.get_model("ventas", "CacheVersion")
+    version = time.time_ns() // 1000
+    CacheVersion.objects.bulk_create(
+        CacheVersion(grupo=grupo, version=version)
+        for grupo in ("clientes", "inventario", "materias", "productos", "recetas", "ventas")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0013_resumen_ventas_existentes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo', models.CharField(max_length=50, unique=True)),
+                ('version', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Versión de Caché',
+                'verbose_name_plural': 'Versiones de Caché',
+            },
+        ),
+        migrations.RunPython(versiones_iniciales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-17 21:05
+
+from django.db import migrations
+
+# Tablas con búsqueda por nombre en los listados (las mismas de 0006)
+TABLAS_BUSQUEDA = ["ventas_product", "ventas_client", "ventas_rawmaterial", "ventas_recipe"]
+
+
+def recrear_indices_nocase(apps, schema_editor):
+    """
+    En SQLite, AlterField/AddField rehacen la tabla copiándola y sólo
+    conservan los índices que conoce el estado de los modelos: 0008 y 0010
+    se llevaron los índices NOCASE creados con SQL en 0006.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for tabla in TABLAS_BUSQUEDA:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{tabla}_nombre_nocase" ON "{tabla}" ("nombre" COLLATE NOCASE)'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ventas', '0014_versiones_cache'),
+    ]
+
+    operations = [
+        migrations.RunPython(recrear_indices_nocase, migrations.RunPython.noop),
+    ]
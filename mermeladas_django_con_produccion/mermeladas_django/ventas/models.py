@@ -1,6 +1,15 @@
+import time
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 from django.core.validators import MinValueValidator
+from django.db.models.functions import Coalesce, NullIf
+
+from .cantidades import subtotal
+from .unidades import UnidadesIncompatibles, convertir
 
 class Category(models.Model):
     nombre = models.CharField(max_length=100, unique=True)
@@ -20,17 +29,32 @@ UNIT_CHOICES = [
     ("un", "Unidad (un)"),
 ]
 
+def nueva_version():
+    """ Versión de catálogo basada en el reloj (microsegundos): crece con cada cambio, sin contador compartido. """
+    return time.time_ns() // 1000
+
 class Product(models.Model):
     nombre = models.CharField(max_length=150)
     categoria = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
     unidad = models.CharField(max_length=2, choices=UNIT_CHOICES, default="un")
     precio_unitario = models.IntegerField(validators=[MinValueValidator(0)], help_text="Precio de venta por unidad (CLP entero)")
-    stock = models.IntegerField(default=0, help_text="Stock disponible en unidades enteras")
+    stock = models.DecimalField(max_digits=12, decimal_places=3, default=0,
+                                help_text="Saldo del libro de movimientos (se mantiene con StockMovement)")
     activo = models.BooleanField(default=True)
+    version = models.BigIntegerField(default=nueva_version, editable=False,
+                                     help_text="Versión del último cambio de datos o de stock (API de catálogo)")
 
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
+        indexes = [
+            # Cambios del catálogo desde una versión (API /api/productos/cambios/)
+            models.Index(fields=["version"], name="producto_version_idx"),
+            # Catálogo de venta: activo=True y stock > 0 (parcial, así también lo usa SQLite)
+            models.Index(fields=["stock"], condition=models.Q(activo=True), name="producto_activo_stock_idx"),
+            # Listado paginado por cursor (nombre, id)
+            models.Index(fields=["nombre", "id"], name="producto_nombre_id_idx"),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -38,11 +62,18 @@ class Product(models.Model):
     def get_absolute_url(self):
         return reverse('productos_list')
 
+    def save(self, *args, **kwargs):
+        self.version = nueva_version()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
+
 class RawMaterial(models.Model):
     nombre = models.CharField(max_length=150, unique=True)
     unidad = models.CharField(max_length=2, choices=UNIT_CHOICES, default="g")
     costo_unitario = models.IntegerField(default=0, validators=[MinValueValidator(0)], help_text="Costo por unidad (CLP entero)")
-    stock = models.IntegerField(default=0, help_text="Stock disponible en unidades enteras")
+    stock = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal("0"),
+                                help_text="Stock disponible en la unidad de la materia prima")
 
     class Meta:
         verbose_name = "Materia Prima"
@@ -51,29 +82,84 @@ class RawMaterial(models.Model):
     def __str__(self):
         return self.nombre
 
+class ClientQuerySet(models.QuerySet):
+    def with_spending(self):
+        """
+        Anota `gasto_total`, `num_compras`, `ultima_compra` y `ticket_promedio`
+        agrupando sus ventas en la misma consulta (LEFT JOIN + GROUP BY), sin
+        un aggregate por cliente.
+        """
+        return self.annotate(
+            gasto_total=Coalesce(models.Sum("sale__total"), 0),
+            num_compras=models.Count("sale"),
+            ultima_compra=models.Max("sale__fecha"),
+        ).annotate(
+            ticket_promedio=models.ExpressionWrapper(
+                models.F("gasto_total") / NullIf("num_compras", 0), output_field=models.IntegerField()
+            ),
+        )
+
+
 class Client(models.Model):
     nombre = models.CharField(max_length=150)
     email = models.EmailField(blank=True, null=True)
     telefono = models.CharField(max_length=30, blank=True, null=True)
     direccion = models.CharField(max_length=200, blank=True, null=True)
 
+    objects = ClientQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Cliente"
         verbose_name_plural = "Clientes"
+        indexes = [
+            # Listado paginado por cursor (nombre, id)
+            models.Index(fields=["nombre", "id"], name="cliente_nombre_id_idx"),
+        ]
 
     def __str__(self):
         return self.nombre
 
     def total_gastado(self):
-        from django.db.models import Sum
-        # Cambiamos venta_set -> sale_set (nombre real del modelo)
-        return self.sale_set.aggregate(total=Sum('total'))['total'] or 0
+        # Anotado por Client.objects.with_spending(); si no, un aggregate sobre sus ventas
+        if hasattr(self, "gasto_total"):
+            return self.gasto_total
+        return self.sale_set.aggregate(total=models.Sum('total'))['total'] or 0
+
+COSTO_FIELD = models.DecimalField(max_digits=18, decimal_places=3)
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_costs(self):
+        """
+        Anota `costo` (suma de cantidad_base x costo unitario de sus insumos) y
+        `costo_por_unidad` (costo / rendimiento) con una subconsulta agregada
+        sobre RecipeItem y RawMaterial, sin recorrer los ítems en Python.
+        """
+        costo_item = models.ExpressionWrapper(
+            models.F("cantidad_base") * models.F("materia_prima__costo_unitario"), output_field=COSTO_FIELD
+        )
+        por_receta = (
+            RecipeItem.objects.filter(receta=models.OuterRef("pk"))
+            .order_by().values("receta")
+            .annotate(total=models.Sum(costo_item)).values("total")
+        )
+        costo = Coalesce(models.Subquery(por_receta, output_field=COSTO_FIELD), models.Value(Decimal("0")),
+                         output_field=COSTO_FIELD)
+        return self.annotate(
+            costo=costo,
+            costo_por_unidad=models.ExpressionWrapper(
+                costo / NullIf("rendimiento_unidades", models.Value(Decimal("0"))), output_field=COSTO_FIELD
+            ),
+        )
+
 
 class Recipe(models.Model):
     nombre = models.CharField(max_length=150, unique=True)
     producto_final = models.ForeignKey(Product, on_delete=models.SET_NULL, null=True, blank=True)
     rendimiento_unidades = models.DecimalField(max_digits=12, decimal_places=3, default=1)
 
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Receta"
         verbose_name_plural = "Recetas"
@@ -82,19 +168,71 @@ class Recipe(models.Model):
         return self.nombre
 
     def costo_estandar(self):
-        return sum(item.cantidad * item.materia_prima.costo_unitario for item in self.items.all())
+        # Anotado por Recipe.objects.with_costs(); si no, desde la caché de costos
+        if hasattr(self, "costo"):
+            return self.costo
+        from .costos import costos_recetas
+        return costos_recetas().get(self.pk, {}).get("costo", Decimal("0"))
+
+class RecipeItemQuerySet(models.QuerySet):
+    def recalcular_base(self):
+        """
+        Vuelve a calcular cantidad_base desde la cantidad y su unidad (tras
+        cambiar la unidad de la materia prima) y guarda sólo los que cambiaron.
+        Devuelve cuántos se actualizaron.
+        """
+        cambiados = []
+        for item in self.select_related("materia_prima").only("cantidad", "unidad", "cantidad_base",
+                                                               "materia_prima__unidad"):
+            anterior = (item.unidad, item.cantidad_base)
+            item.cantidad_base = item.calcular_base()
+            if (item.unidad, item.cantidad_base) != anterior:
+                cambiados.append(item)
+        self.model.objects.bulk_update(cambiados, ["unidad", "cantidad_base"], batch_size=1000)
+        return len(cambiados)
+
 
 class RecipeItem(models.Model):
     receta = models.ForeignKey(Recipe, related_name="items", on_delete=models.CASCADE)
     materia_prima = models.ForeignKey(RawMaterial, on_delete=models.PROTECT)
     cantidad = models.DecimalField(max_digits=12, decimal_places=3)
+    unidad = models.CharField(max_length=2, choices=UNIT_CHOICES, blank=True,
+                              help_text="Unidad de la cantidad (vacía: la de la materia prima)")
+    cantidad_base = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal("0"), editable=False,
+                                        help_text="Cantidad en la unidad de la materia prima (costos, producción y MRP)")
+
+    objects = RecipeItemQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Ingrediente de Receta"
         verbose_name_plural = "Ingredientes de Receta"
 
     def __str__(self):
-        return f"{self.materia_prima} ({self.cantidad})"
+        return f"{self.materia_prima} ({self.cantidad} {self.unidad or self.materia_prima.unidad})"
+
+    def calcular_base(self):
+        """ Cantidad en la unidad de la materia prima; sin unidad propia, toma la de la materia. """
+        self.unidad = self.unidad or self.materia_prima.unidad
+        return convertir(self.cantidad, self.unidad, self.materia_prima.unidad)
+
+    def clean(self):
+        # El importador valida la cantidad antes de resolver la materia prima por nombre
+        if self.materia_prima_id is None or self.cantidad is None:
+            return
+        try:
+            base = self.calcular_base()
+        except UnidadesIncompatibles:
+            raise ValidationError({"unidad": f"{self.materia_prima} se mide en {self.materia_prima.unidad}: "
+                                             f"no se puede expresar en {self.unidad}."})
+        if self.cantidad > 0 and base == 0:
+            raise ValidationError({"cantidad": f"Es menos de una milésima de {self.materia_prima.unidad}."})
+
+    def save(self, *args, **kwargs):
+        # Convertida una vez al guardar: los cálculos multiplican cantidad_base sin conversión
+        self.cantidad_base = self.calcular_base()
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "unidad", "cantidad_base"}
+        super().save(*args, **kwargs)
 
 class ProductBatch(models.Model):
     producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="lotes")
@@ -107,6 +245,20 @@ class ProductBatch(models.Model):
         verbose_name = "Lote de Producto"
         verbose_name_plural = "Lotes de Producto"
         ordering = ["fecha_vencimiento", "fecha_produccion", "id"]
+        indexes = [
+            # FEFO: lotes con saldo de un producto, en orden de vencimiento
+            models.Index(
+                fields=["producto", "fecha_vencimiento", "fecha_produccion", "id"],
+                condition=models.Q(cantidad__gt=0),
+                name="lote_fefo_disponible_idx",
+            ),
+            # Barrido de vencidos e informe de lotes por vencer (sólo lotes con saldo)
+            models.Index(
+                fields=["fecha_vencimiento", "id"],
+                condition=models.Q(cantidad__gt=0),
+                name="lote_vencimiento_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.producto} | Lote {self.codigo_lote} | vence {self.fecha_vencimiento}"
@@ -136,6 +288,13 @@ class Sale(models.Model):
         verbose_name = "Venta"
         verbose_name_plural = "Ventas"
         ordering = ["-fecha"]
+        indexes = [
+            # Historial de compras de un cliente
+            models.Index(fields=["cliente", "-fecha"], name="venta_cliente_fecha_idx"),
+            # Listado de ventas paginado por cursor (-fecha, -id), con y sin filtro de método de pago
+            models.Index(fields=["-fecha", "-id"], name="venta_fecha_id_idx"),
+            models.Index(fields=["metodo_pago", "-fecha", "-id"], name="venta_metodo_fecha_idx"),
+        ]
 
     def __str__(self):
         return f"Venta #{self.pk} - {self.cliente or 'Sin cliente'}"
@@ -144,6 +303,10 @@ class Sale(models.Model):
         self.total = sum(int(item.subtotal) for item in self.items.all())
         return self.total
 
+def calcular_subtotal(precio_unitario, cantidad):
+    """ Subtotal en CLP entero de una línea de venta (aritmética entera en milésimas, ver cantidades.py). """
+    return subtotal(precio_unitario, cantidad)
+
 class SaleItem(models.Model):
     venta = models.ForeignKey(Sale, related_name="items", on_delete=models.CASCADE)
     producto = models.ForeignKey(Product, on_delete=models.PROTECT)
@@ -156,6 +319,117 @@ class SaleItem(models.Model):
         verbose_name_plural = "Ítems de Venta"
 
     def save(self, *args, **kwargs):
-        self.subtotal = int((self.precio_unitario or 0) * float(self.cantidad or 0))
+        self.subtotal = calcular_subtotal(self.precio_unitario, self.cantidad)
         super().save(*args, **kwargs)
 
+MOVEMENT_CHOICES = [
+    ("PRODUCCION", "Producción"),
+    ("VENTA", "Venta"),
+    ("AJUSTE", "Ajuste"),
+    ("VENCIMIENTO", "Vencimiento"),
+]
+
+class StockMovement(models.Model):
+    """
+    Libro de movimientos de stock (sólo se agregan filas, nunca se editan).
+    Product.stock es el saldo acumulado de este libro y se actualiza con un
+    delta F() en la misma operación que inserta el movimiento.
+    """
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="movimientos")
+    tipo = models.CharField(max_length=12, choices=MOVEMENT_CHOICES)
+    cantidad = models.DecimalField(max_digits=12, decimal_places=3, help_text="Positivo entra, negativo sale")
+    lote = models.ForeignKey(ProductBatch, on_delete=models.SET_NULL, null=True, blank=True, related_name="movimientos")
+    venta = models.ForeignKey(Sale, on_delete=models.SET_NULL, null=True, blank=True, related_name="movimientos")
+    fecha = models.DateTimeField(auto_now_add=True)
+    detalle = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        ordering = ["-fecha", "-id"]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad} | {self.producto}"
+
+class DailySalesSummary(models.Model):
+    """
+    Resumen materializado de ventas por día, producto y método de pago.
+    Se acumula en cada venta (ver ventas/resumen.py) para que el panel no
+    tenga que recorrer SaleItem.
+    """
+    fecha = models.DateField()
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="resumenes")
+    metodo_pago = models.CharField(max_length=20, choices=PAYMENT_CHOICES)
+    unidades = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    monto = models.BigIntegerField(default=0, help_text="Suma de subtotales (CLP entero)")
+    lineas = models.IntegerField(default=0, help_text="Cantidad de ítems de venta")
+
+    class Meta:
+        verbose_name = "Resumen Diario de Ventas"
+        verbose_name_plural = "Resúmenes Diarios de Ventas"
+        constraints = [
+            models.UniqueConstraint(fields=["fecha", "producto", "metodo_pago"], name="resumen_dia_producto_metodo_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} | {self.producto} | {self.metodo_pago}"
+
+JOB_STATUS_CHOICES = [
+    ("PENDIENTE", "Pendiente"),
+    ("EN_CURSO", "En curso"),
+    ("HECHO", "Hecho"),
+    ("FALLIDO", "Fallido"),
+]
+
+class Job(models.Model):
+    """
+    Trabajo en segundo plano (ver ventas/trabajos.py): una tarea registrada
+    con sus argumentos JSON, que ejecuta el comando correr_trabajos.
+    """
+    tarea = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict, blank=True)
+    estado = models.CharField(max_length=10, choices=JOB_STATUS_CHOICES, default="PENDIENTE")
+    prioridad = models.SmallIntegerField(default=0, help_text="Se toman primero los de mayor prioridad")
+    clave = models.CharField(max_length=200, null=True, blank=True,
+                             help_text="Deduplicación: un solo trabajo pendiente o en curso por clave")
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField(default=3)
+    disponible_desde = models.DateTimeField(default=timezone.now, help_text="No se toma antes (espera entre reintentos)")
+    creado = models.DateTimeField(auto_now_add=True)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+    trabajador = models.CharField(max_length=100, blank=True)
+    resultado = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        verbose_name = "Trabajo"
+        verbose_name_plural = "Trabajos"
+        constraints = [
+            models.UniqueConstraint(fields=["clave"], condition=models.Q(estado__in=["PENDIENTE", "EN_CURSO"]),
+                                    name="job_clave_activa_uniq"),
+        ]
+        indexes = [
+            # Cola: sólo los pendientes, en el orden en que se toman
+            models.Index(fields=["-prioridad", "disponible_desde", "id"], condition=models.Q(estado="PENDIENTE"),
+                         name="job_pendientes_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.tarea} ({self.get_estado_display()})"
+
+class CacheVersion(models.Model):
+    """
+    Versión de un grupo de datos de la caché versionada (ver ventas/cache.py).
+    Va en la base y no en la caché: así la ven igual todos los procesos (web,
+    comandos, trabajadores de la cola), con cualquier backend de caché.
+    """
+    grupo = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField()
+
+    class Meta:
+        verbose_name = "Versión de Caché"
+        verbose_name_plural = "Versiones de Caché"
+
+    def __str__(self):
+        return f"{self.grupo}: {self.version}"
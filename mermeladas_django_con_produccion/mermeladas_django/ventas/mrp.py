@@ -0,0 +1,186 @@
+"""
+Planificación de requerimientos de materia prima (MRP).
+
+La matriz receta x materia prima (consumo por multiplicador) se arma una vez
+y queda en la caché hasta que cambian recetas, costos o precios; el stock se
+lee aparte en cada cálculo porque cambia con cada producción.
+"""
+from decimal import ROUND_DOWN, Decimal
+
+from .cache import cacheado
+from .cantidades import multiplicar, redondear
+from .models import RawMaterial, Recipe, RecipeItem
+
+GRUPOS = ("recetas", "productos")
+OBJETIVOS = {
+    "margen": "Margen (precio de venta - costo)",
+    "unidades": "Unidades producidas",
+}
+EPSILON = 1e-9
+PIVOTES_DEGENERADOS = 50
+
+
+def _redondear(valor):
+    """ Redondea hacia abajo a milésimas: nunca propone más de lo que alcanza. """
+    return redondear(valor, ROUND_DOWN)
+
+
+def calcular_matriz():
+    """
+    Recetas con producto final y su consumo por multiplicador (en la unidad de
+    cada materia prima), en dos consultas.
+    """
+    recetas = [
+        {
+            "id": r.pk,
+            "nombre": r.nombre,
+            "producto": r.producto_final.nombre,
+            "rendimiento": r.rendimiento_unidades,
+            "precio": r.producto_final.precio_unitario,
+            "costo": r.costo,
+        }
+        for r in Recipe.objects.filter(producto_final__isnull=False)
+        .select_related("producto_final").with_costs().order_by("nombre")
+    ]
+    consumo = {r["id"]: {} for r in recetas}
+    filas = RecipeItem.objects.filter(receta_id__in=consumo).values_list("receta_id", "materia_prima_id", "cantidad_base")
+    for receta_id, mp_id, cantidad in filas:
+        consumo[receta_id][mp_id] = consumo[receta_id].get(mp_id, Decimal("0")) + cantidad
+    materias = sorted({mp_id for fila in consumo.values() for mp_id in fila})
+    return {"recetas": recetas, "materias": materias, "consumo": consumo}
+
+
+def matriz_recetas():
+    """ Matriz receta x materia prima desde la caché versionada. """
+    return cacheado("mrp:matriz", GRUPOS, calcular_matriz)
+
+
+def maximo_por_receta(consumo, stock):
+    """
+    Máximo multiplicador de una receta con el stock actual si se produjera
+    sola: min(stock / consumo) sobre sus insumos. None si no usa insumos.
+    """
+    limites = [stock.get(mp_id, Decimal("0")) / cantidad for mp_id, cantidad in consumo.items() if cantidad > 0]
+    if not limites:
+        return None
+    return redondear(max(min(limites), Decimal("0")), ROUND_DOWN)
+
+
+def maximizar(valores, restricciones, limites):
+    """
+    Programa lineal: maximiza sum(valores[j] * x[j]) sujeto a
+    sum(restricciones[i][j] * x[j]) <= limites[i] y x >= 0, con limites >= 0.
+
+    Simplex de tabla con la base inicial de holguras. Entra la columna de
+    costo reducido más negativo (Dantzig); tras varios pivotes degenerados
+    seguidos pasa a la regla de Bland, que no cicla. Devuelve la lista x.
+    """
+    n, m = len(valores), len(restricciones)
+    tabla = [
+        [float(a) for a in fila] + [1.0 if i == k else 0.0 for k in range(m)] + [float(limites[i])]
+        for i, fila in enumerate(restricciones)
+    ]
+    objetivo = [-float(v) for v in valores] + [0.0] * (m + 1)
+    base = [n + i for i in range(m)]
+    degenerados = 0
+
+    while True:
+        if degenerados < PIVOTES_DEGENERADOS:
+            entra = min(range(n + m), key=objetivo.__getitem__)
+            entra = entra if objetivo[entra] < -EPSILON else None
+        else:
+            entra = next((j for j in range(n + m) if objetivo[j] < -EPSILON), None)
+        if entra is None:
+            break
+        sale = None
+        for i in range(m):
+            if tabla[i][entra] > EPSILON:
+                razon = tabla[i][-1] / tabla[i][entra]
+                if sale is None or razon < mejor - EPSILON or (razon <= mejor + EPSILON and base[i] < base[sale]):
+                    sale, mejor = i, razon
+        if sale is None:
+            raise ValueError("El problema no está acotado.")
+        degenerados = degenerados + 1 if mejor <= EPSILON else 0
+
+        pivote = tabla[sale][entra]
+        tabla[sale] = [v / pivote for v in tabla[sale]]
+        for i in range(m):
+            if i != sale and tabla[i][entra]:
+                factor = tabla[i][entra]
+                tabla[i] = [v - factor * p for v, p in zip(tabla[i], tabla[sale])]
+        factor = objetivo[entra]
+        objetivo = [v - factor * p for v, p in zip(objetivo, tabla[sale])]
+        base[sale] = entra
+
+    x = [0.0] * n
+    for i, variable in enumerate(base):
+        if variable < n:
+            x[variable] = max(tabla[i][-1], 0.0)
+    return x
+
+
+def _valor(receta, objetivo):
+    """ Aporte al objetivo de un multiplicador de la receta. """
+    if objetivo == "unidades":
+        return receta["rendimiento"]
+    return receta["precio"] * receta["rendimiento"] - receta["costo"]
+
+
+def planificar(objetivo="margen"):
+    """
+    Máximo producible por receta y mezcla óptima de producción bajo el stock
+    compartido de materias primas (una consulta de stock más la matriz en caché).
+    """
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f"Objetivo desconocido: {objetivo}")
+    matriz = matriz_recetas()
+    materias = {
+        mp.pk: mp for mp in RawMaterial.objects.filter(pk__in=matriz["materias"]).only("id", "nombre", "unidad", "stock")
+    }
+    stock = {pk: max(mp.stock, Decimal("0")) for pk, mp in materias.items()}
+
+    # Sólo entran al LP las recetas que aportan y consumen algo (las demás no están acotadas)
+    candidatas = [
+        r for r in matriz["recetas"]
+        if _valor(r, objetivo) > 0 and any(c > 0 for c in matriz["consumo"][r["id"]].values())
+    ]
+    columnas = sorted(materias)
+    x = maximizar(
+        [_valor(r, objetivo) for r in candidatas],
+        [[matriz["consumo"][r["id"]].get(mp_id, 0) for r in candidatas] for mp_id in columnas],
+        [stock[mp_id] for mp_id in columnas],
+    ) if candidatas and columnas else []
+    plan = {r["id"]: _redondear(v) for r, v in zip(candidatas, x)}
+
+    recetas, usado, total = [], {}, Decimal("0")
+    for r in matriz["recetas"]:
+        mult = plan.get(r["id"], Decimal("0"))
+        for mp_id, cantidad in matriz["consumo"][r["id"]].items():
+            usado[mp_id] = usado.get(mp_id, Decimal("0")) + multiplicar(cantidad, mult)
+        valor = redondear(_valor(r, objetivo) * mult)
+        total += valor
+        recetas.append({
+            "id": r["id"],
+            "nombre": r["nombre"],
+            "producto": r["producto"],
+            "maximo": maximo_por_receta(matriz["consumo"][r["id"]], stock),
+            "plan": mult,
+            "unidades": multiplicar(r["rendimiento"], mult),
+            "valor": valor,
+        })
+    return {
+        "objetivo": objetivo,
+        "recetas": recetas,
+        "materias": [
+            {
+                "id": mp.pk,
+                "nombre": mp.nombre,
+                "unidad": mp.unidad,
+                "stock": mp.stock,
+                "consumo": usado.get(mp.pk, Decimal("0")),
+                "restante": mp.stock - usado.get(mp.pk, Decimal("0")),
+            }
+            for mp in sorted(materias.values(), key=lambda mp: mp.nombre)
+        ],
+        "valor_total": total,
+    }
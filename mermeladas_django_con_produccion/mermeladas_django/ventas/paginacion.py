@@ -0,0 +1,111 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _serializar(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return None if valor is None else str(valor)
+
+
+def codificar_cursor(valores):
+    """ Codifica los valores de la última fila de una página en un token opaco para la URL. """
+    texto = json.dumps([_serializar(v) for v in valores], separators=(",", ":"))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(token, campos):
+    """ Devuelve los valores del cursor convertidos al tipo de cada campo, o None si no es válido. """
+    try:
+        relleno = "=" * (-len(token) % 4)
+        crudos = json.loads(base64.urlsafe_b64decode(token + relleno))
+        if not isinstance(crudos, list) or len(crudos) != len(campos):
+            return None
+        return [campo.to_python(v) for campo, v in zip(campos, crudos)]
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def filtro_posterior(orden, valores):
+    """
+    Condición de "búsqueda por clave" (keyset) para las filas que vienen
+    después de `valores` en el orden `orden`, p. ej. ("-fecha", "-id") da
+    fecha < f OR (fecha = f AND id < i). Con el índice adecuado la base salta
+    directo a la página pedida, sin OFFSET.
+    """
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(orden, valores):
+        nombre = campo.lstrip("-")
+        lookup = "lt" if campo.startswith("-") else "gt"
+        condicion |= Q(**iguales, **{f"{nombre}__{lookup}": valor})
+        iguales[nombre] = valor
+    return condicion
+
+
+class CursorPaginationMixin:
+    """
+    Paginación por cursor (keyset) para ListView.
+
+    La vista define `orden_cursor`, una tupla de campos que termina en una
+    clave única (p. ej. ("-fecha", "-id")). Cada página se obtiene con un
+    WHERE sobre la última fila de la anterior y LIMIT, así que su costo no
+    crece con el largo de la tabla. No se hace COUNT(*).
+
+    El GET es asíncrono: la página se lee con iteración asíncrona del ORM y
+    la plantilla se dibuja después, fuera del event loop (TemplateResponse).
+    Lo que la vista deba leer antes de armar el queryset va en `apreparar`.
+    """
+    orden_cursor = ("-id",)
+    tamano_pagina = 50
+    parametro_cursor = "cursor"
+
+    def _campos_cursor(self):
+        return [self.model._meta.get_field(c.lstrip("-")) for c in self.orden_cursor]
+
+    def get_queryset(self):
+        queryset = super().get_queryset().order_by(*self.orden_cursor)
+        token = self.request.GET.get(self.parametro_cursor)
+        valores = decodificar_cursor(token, self._campos_cursor()) if token else None
+        if valores is not None:
+            queryset = queryset.filter(filtro_posterior(self.orden_cursor, valores))
+        return queryset
+
+    async def apreparar(self):
+        """ Lecturas previas a get_queryset() (p. ej. el objeto del que se listan filas). """
+
+    async def get(self, request, *args, **kwargs):
+        await self.apreparar()
+        self.object_list = self.get_queryset()
+        self.filas = [fila async for fila in self.object_list[: self.tamano_pagina + 1]]
+        return self.render_to_response(self.get_context_data())
+
+    def get_context_data(self, **kwargs):
+        filas = self.filas
+        hay_mas = len(filas) > self.tamano_pagina
+        filas = filas[: self.tamano_pagina]
+
+        siguiente = None
+        if hay_mas:
+            ultimo = filas[-1]
+            params = self.request.GET.copy()
+            params[self.parametro_cursor] = codificar_cursor(
+                [getattr(ultimo, c.attname) for c in self._campos_cursor()]
+            )
+            siguiente = params.urlencode()
+
+        primera = self.request.GET.copy()
+        primera.pop(self.parametro_cursor, None)
+
+        kwargs.update({
+            "hay_mas": hay_mas,
+            "querystring_siguiente": siguiente,
+            "querystring_primera": primera.urlencode(),
+            "es_primera_pagina": self.parametro_cursor not in self.request.GET,
+        })
+        return super().get_context_data(object_list=filas, **kwargs)
@@ -0,0 +1,119 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cantidades import multiplicar, redondear
+from .inventario import registrar_movimientos
+from .models import ProductBatch, RawMaterial, Recipe, RecipeItem, StockMovement
+
+
+class PlanInvalido(Exception):
+    """ El plan de producción no se puede ejecutar tal como viene (receta inexistente o sin producto). """
+
+
+class MateriasInsuficientes(Exception):
+    """ El plan completo necesita más materia prima de la disponible. """
+
+    def __init__(self, faltantes):
+        # faltantes: [(materia_prima, requerido, disponible)]
+        self.faltantes = faltantes
+        super().__init__("Stock insuficiente: " + "; ".join(
+            f"{mp.nombre} (requiere {requerido}, disponible {disponible})"
+            for mp, requerido, disponible in faltantes
+        ))
+
+
+def normalizar_plan(plan):
+    """ Junta las filas repetidas de una misma receta: {receta_id: multiplicador}. """
+    multiplicadores = {}
+    for receta, mult in plan:
+        pk = getattr(receta, "pk", receta)
+        mult = redondear(mult)
+        if mult <= 0:
+            raise PlanInvalido(f"El multiplicador de la receta {receta} debe ser mayor que cero.")
+        multiplicadores[pk] = multiplicadores.get(pk, Decimal("0")) + mult
+    return multiplicadores
+
+
+def demanda_de_materias(multiplicadores):
+    """
+    Materia prima total que consume el plan: {materia_prima_id: cantidad}, en
+    la unidad de cada materia y en una consulta. Se suma exacto y se redondea una vez por materia, así el
+    delta de stock no arrastra el redondeo de cada ítem.
+    """
+    demanda = {}
+    filas = RecipeItem.objects.filter(receta_id__in=multiplicadores).values_list(
+        "receta_id", "materia_prima_id", "cantidad_base"
+    )
+    for receta_id, mp_id, cantidad in filas:
+        demanda[mp_id] = demanda.get(mp_id, Decimal("0")) + cantidad * multiplicadores[receta_id]
+    return {mp_id: redondear(total) for mp_id, total in demanda.items()}
+
+
+def _codigos_de_lote(recetas, ahora):
+    """ L{ID_PRODUCTO}-{FECHA_HORA_MINUTO}, con sufijo si el plan repite producto. """
+    base = ahora.strftime("%d%m%y%H%M")
+    usados = {}
+    codigos = {}
+    for receta in recetas:
+        codigo = f"L{receta.producto_final_id}-{base}"
+        usados[codigo] = usados.get(codigo, 0) + 1
+        codigos[receta.pk] = codigo if usados[codigo] == 1 else f"{codigo}-{usados[codigo]}"
+    return codigos
+
+
+@transaction.atomic
+def producir_plan(plan, fecha_produccion, fecha_vencimiento):
+    """
+    Ejecuta un plan de producción [(receta, multiplicador)] en una transacción.
+
+    Suma la demanda de materia prima de todo el plan, bloquea esas materias en
+    una sola consulta y, si algo falta, lanza MateriasInsuficientes con el
+    detalle por materia antes de escribir nada. Si alcanza: un bulk_update con
+    deltas F() sobre el stock de materias, un bulk_create de los lotes y los
+    movimientos PRODUCCION en el libro de stock. Devuelve los lotes creados.
+    """
+    multiplicadores = normalizar_plan(plan)
+    if not multiplicadores:
+        raise PlanInvalido("El plan de producción está vacío.")
+
+    recetas = Recipe.objects.select_related("producto_final").in_bulk(list(multiplicadores))
+    for pk in multiplicadores:
+        receta = recetas.get(pk)
+        if receta is None:
+            raise PlanInvalido(f"La receta {pk} no existe.")
+        if receta.producto_final_id is None:
+            raise PlanInvalido(f"La receta {receta.nombre} no tiene producto final asignado.")
+
+    demanda = demanda_de_materias(multiplicadores)
+    materias = list(
+        RawMaterial.objects.select_for_update().filter(pk__in=demanda).order_by("pk").only("id", "nombre", "stock")
+    )
+    faltantes = [(mp, demanda[mp.pk], mp.stock) for mp in materias if mp.stock < demanda[mp.pk]]
+    if faltantes:
+        raise MateriasInsuficientes(faltantes)
+
+    for mp in materias:
+        mp.stock = F("stock") - demanda[mp.pk]
+    RawMaterial.objects.bulk_update(materias, ["stock"])
+
+    orden = [recetas[pk] for pk in multiplicadores]
+    codigos = _codigos_de_lote(orden, timezone.now())
+    lotes = ProductBatch.objects.bulk_create([
+        ProductBatch(
+            producto_id=receta.producto_final_id,
+            codigo_lote=codigos[receta.pk],
+            fecha_produccion=fecha_produccion,
+            fecha_vencimiento=fecha_vencimiento,
+            cantidad=multiplicar(receta.rendimiento_unidades, multiplicadores[receta.pk]),
+        )
+        for receta in orden
+    ])
+    registrar_movimientos([
+        StockMovement(producto_id=lote.producto_id, lote=lote, tipo="PRODUCCION", cantidad=lote.cantidad,
+                      detalle=f"Receta {receta.nombre}")
+        for receta, lote in zip(orden, lotes)
+    ])
+    return lotes
@@ -0,0 +1,93 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySalesSummary, SaleItem
+
+FILAS_POR_BLOQUE = 2000
+
+
+def acumular_venta(venta, items, signo=1):
+    """
+    Suma una venta recién guardada al resumen diario (día local, producto,
+    método de pago): un SELECT de las filas del día, un bulk_update con
+    deltas F() y un bulk_create de las que faltan. Con signo=-1 la descuenta
+    (venta borrada) y sólo toca las filas que existen: una venta que no está
+    en el resumen no deja filas negativas.
+
+    Debe llamarse en la transacción de la venta; las ventas concurrentes de
+    un mismo producto ya quedan serializadas por el bloqueo de sus lotes.
+    """
+    fecha = timezone.localdate(venta.fecha)
+    por_producto = {}
+    for item in items:
+        unidades, monto, lineas = por_producto.get(item.producto_id, (Decimal("0"), 0, 0))
+        por_producto[item.producto_id] = (
+            unidades + signo * item.cantidad, monto + signo * item.subtotal, lineas + signo
+        )
+
+    existentes = {
+        fila.producto_id: fila
+        for fila in DailySalesSummary.objects.select_for_update().filter(
+            fecha=fecha, metodo_pago=venta.metodo_pago, producto_id__in=por_producto
+        )
+    }
+    actualizar, crear = [], []
+    for producto_id, (unidades, monto, lineas) in por_producto.items():
+        fila = existentes.get(producto_id)
+        if fila is None:
+            if signo < 0:
+                continue
+            crear.append(DailySalesSummary(
+                fecha=fecha, producto_id=producto_id, metodo_pago=venta.metodo_pago,
+                unidades=unidades, monto=monto, lineas=lineas,
+            ))
+        else:
+            fila.unidades = F("unidades") + unidades
+            fila.monto = F("monto") + monto
+            fila.lineas = F("lineas") + lineas
+            actualizar.append(fila)
+    if actualizar:
+        DailySalesSummary.objects.bulk_update(actualizar, ["unidades", "monto", "lineas"])
+    if crear:
+        DailySalesSummary.objects.bulk_create(crear)
+
+
+@transaction.atomic
+def reconstruir_resumen(desde=None):
+    """
+    Vuelve a calcular el resumen diario a partir de SaleItem (desde la fecha
+    `desde`, o completo) con una sola consulta agrupada, insertando por bloques.
+    Devuelve la cantidad de filas generadas.
+    """
+    zona = timezone.get_current_timezone()
+    items = SaleItem.objects.annotate(dia=TruncDate("venta__fecha", tzinfo=zona))
+    resumenes = DailySalesSummary.objects.all()
+    if desde:
+        items = items.filter(dia__gte=desde)
+        resumenes = resumenes.filter(fecha__gte=desde)
+    resumenes.delete()
+
+    filas = (
+        items.values("dia", "producto_id", "venta__metodo_pago")
+        .annotate(unidades=Sum("cantidad"), monto=Sum("subtotal"), lineas=Count("id"))
+        .order_by()
+    )
+    total = 0
+    bloque = []
+    for fila in filas.iterator(chunk_size=FILAS_POR_BLOQUE):
+        bloque.append(DailySalesSummary(
+            fecha=fila["dia"], producto_id=fila["producto_id"], metodo_pago=fila["venta__metodo_pago"],
+            unidades=fila["unidades"], monto=fila["monto"], lineas=fila["lineas"],
+        ))
+        if len(bloque) >= FILAS_POR_BLOQUE:
+            DailySalesSummary.objects.bulk_create(bloque)
+            total += len(bloque)
+            bloque = []
+    if bloque:
+        DailySalesSummary.objects.bulk_create(bloque)
+        total += len(bloque)
+    return total
@@ -0,0 +1,106 @@
+"""
+Segmentación RFM de clientes (recencia, frecuencia, monto).
+
+Los puntajes se calculan en la base con una sola consulta: las compras de
+cada cliente se agrupan (Client.objects.with_spending) y Ntile(5) reparte a
+los clientes en quintiles por fecha de última compra, cantidad de compras y
+gasto total (5 = mejor). Python sólo recorre el resultado una vez para
+asignar el segmento y acumular los totales de cada uno.
+"""
+import heapq
+
+from django.db.models import F, Window
+from django.db.models.functions import Ntile
+from django.utils import timezone
+
+from .cache import cacheado
+from .models import Client
+
+GRUPOS = ("ventas", "clientes")
+QUINTILES = 5
+CLIENTES_POR_SEGMENTO = 20
+
+# (nombre, descripción), en el orden en que se muestran
+SEGMENTOS = (
+    ("Campeones", "Compraron hace poco, compran seguido y gastan mucho."),
+    ("Leales", "Compran seguido, aunque no sea lo más reciente."),
+    ("Potenciales", "Compras recientes con frecuencia media."),
+    ("Nuevos", "Compraron hace poco, pocas veces."),
+    ("En riesgo", "Compraban seguido pero hace tiempo que no vuelven."),
+    ("Necesitan atención", "Valores intermedios en recencia y frecuencia."),
+    ("Perdidos", "Hace mucho que no compran y compraron poco."),
+)
+
+
+def segmento(r, f, m):
+    """ Segmento de un cliente según sus puntajes (1 a 5). """
+    if r >= 4 and f >= 4:
+        return "Campeones"
+    if f >= 4:
+        return "Leales" if r >= 3 else "En riesgo"
+    if r >= 4:
+        return "Nuevos" if f <= 1 else "Potenciales"
+    if r <= 2 and f >= 3:
+        return "En riesgo"
+    if r <= 2 and f <= 2:
+        return "Perdidos"
+    return "Necesitan atención"
+
+
+def puntajes():
+    """ Clientes con compras, con sus métricas y sus puntajes r, f y m (una consulta). """
+    def quintil(campo):
+        return Window(expression=Ntile(QUINTILES), order_by=[F(campo).asc(), F("pk").asc()])
+
+    return (
+        Client.objects.with_spending().filter(num_compras__gt=0)
+        .annotate(r=quintil("ultima_compra"), f=quintil("num_compras"), m=quintil("gasto_total"))
+        .values_list("pk", "nombre", "ultima_compra", "num_compras", "gasto_total", "r", "f", "m")
+        .order_by()
+    )
+
+
+def calcular_rfm(hoy, por_segmento=CLIENTES_POR_SEGMENTO):
+    """
+    Resumen por segmento (clientes, gasto, promedios) y los `por_segmento`
+    clientes de mayor gasto de cada uno.
+    """
+    zona = timezone.get_current_timezone()
+    acumulado = {nombre: {"clientes": 0, "gasto": 0, "compras": 0, "dias": 0, "top": []} for nombre, _ in SEGMENTOS}
+    for pk, nombre, ultima, compras, gasto, r, f, m in puntajes().iterator(chunk_size=2000):
+        s = acumulado[segmento(r, f, m)]
+        dias = (hoy - ultima.astimezone(zona).date()).days
+        s["clientes"] += 1
+        s["gasto"] += gasto
+        s["compras"] += compras
+        s["dias"] += dias
+        fila = (gasto, -pk, {"id": pk, "nombre": nombre, "compras": compras, "gasto": gasto, "dias": dias,
+                             "rfm": f"{r}{f}{m}"})
+        if len(s["top"]) < por_segmento:
+            heapq.heappush(s["top"], fila)
+        else:
+            heapq.heappushpop(s["top"], fila)
+
+    total = sum(s["clientes"] for s in acumulado.values())
+    segmentos = []
+    for nombre, descripcion in SEGMENTOS:
+        s = acumulado[nombre]
+        n = s["clientes"] or 1
+        segmentos.append({
+            "nombre": nombre,
+            "descripcion": descripcion,
+            "clientes": s["clientes"],
+            "porcentaje": round(100 * s["clientes"] / total, 1) if total else 0,
+            "gasto_total": s["gasto"],
+            "ticket_promedio": s["gasto"] // max(s["compras"], 1),
+            "compras_promedio": round(s["compras"] / n, 1),
+            "dias_promedio": round(s["dias"] / n),
+            "top": [fila for _, _, fila in sorted(s["top"], reverse=True)],
+        })
+    return {"total_clientes": total, "segmentos": segmentos}
+
+
+def datos_rfm():
+    """ Segmentación RFM servida desde la caché versionada (se recalcula al cambiar ventas o clientes). """
+    hoy = timezone.localdate()
+    return cacheado(f"rfm:{hoy.isoformat()}", GRUPOS, lambda: calcular_rfm(hoy))
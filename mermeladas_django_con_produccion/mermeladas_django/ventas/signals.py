@@ -0,0 +1,58 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import invalidar
+from .models import Client, Product, ProductBatch, RawMaterial, Recipe, RecipeItem, Sale
+from .resumen import acumular_venta
+
+
+@receiver([post_save, post_delete], sender=Sale)
+def invalidar_ventas(sender, **kwargs):
+    invalidar("ventas")
+
+
+@receiver(pre_delete, sender=Sale)
+def descontar_resumen(sender, instance, **kwargs):
+    # Antes del borrado en cascada de los ítems, que el resumen necesita
+    items = list(instance.items.only("producto_id", "cantidad", "subtotal"))
+    if items:
+        acumular_venta(instance, items, signo=-1)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidar_productos(sender, **kwargs):
+    invalidar("productos")
+
+
+@receiver([post_save, post_delete], sender=ProductBatch)
+def invalidar_lotes(sender, **kwargs):
+    # Los lotes que cambian por ventas o vencimientos pasan por registrar_movimientos (bulk, sin señales)
+    invalidar("inventario")
+
+
+@receiver([post_save, post_delete], sender=Client)
+def invalidar_clientes(sender, **kwargs):
+    invalidar("clientes")
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeItem)
+def invalidar_recetas(sender, **kwargs):
+    invalidar("recetas")
+
+
+@receiver(post_save, sender=RawMaterial)
+def convertir_ingredientes(sender, instance, created, update_fields=None, **kwargs):
+    # Con otra unidad (de la misma dimensión: lo valida RawMaterialForm) sus ingredientes se vuelven a convertir
+    if not created and (update_fields is None or "unidad" in update_fields):
+        RecipeItem.objects.filter(materia_prima=instance).recalcular_base()
+
+
+@receiver([post_save, post_delete], sender=RawMaterial)
+def invalidar_materias(sender, update_fields=None, **kwargs):
+    # Los movimientos de stock guardan sólo "stock" y no cambian costos
+    if update_fields is None or "costo_unitario" in update_fields:
+        invalidar("recetas")
+    # El catálogo de materias (nombre y unidad) tampoco depende del stock
+    if update_fields is None or set(update_fields) - {"stock"}:
+        invalidar("materias")
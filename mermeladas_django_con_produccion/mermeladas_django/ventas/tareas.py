@@ -0,0 +1,81 @@
+"""
+Tareas de la cola de trabajos (ver trabajos.py).
+
+Cada tarea recibe el Job y los argumentos con que se encoló (JSON) y
+devuelve el resultado que queda en Job.resultado; las que generan un archivo
+devuelven {"archivo": ...} para que trabajo_archivo lo sirva. Deben poder
+repetirse sin efectos dobles: un trabajo que falla se reintenta completo.
+"""
+from io import StringIO
+
+from django.core.management import call_command
+
+from .cache import invalidar
+from .comprobantes import datos_comprobante, obtener_pdf, pdf_unico_de_ventas, ventas_para_comprobante, zip_de_ventas
+from .conciliacion import conciliar_stock
+from .exportacion import NIVELES, csv_por_partes, filas_de
+from .forms import SaleFilterForm
+from .models import Sale
+from .resumen import reconstruir_resumen
+from .trabajos import escribir_archivo, tarea
+from .vencimientos import vencer_lotes
+
+
+def _ventas_filtradas(filtros):
+    return SaleFilterForm(filtros or None).filtrar(Sale.objects.order_by("fecha", "id"))
+
+
+@tarea("comprobante_pdf")
+def comprobante_pdf(trabajo, venta):
+    """ Deja generado el PDF del comprobante para que venta_pdf lo sirva directo de disco. """
+    datos = datos_comprobante(ventas_para_comprobante(Sale.objects.all()).get(pk=venta))
+    return {"venta": venta, "pdf": obtener_pdf(datos).name}
+
+
+@tarea("comprobantes")
+def comprobantes(trabajo, filtros=None, formato="zip"):
+    """ Comprobantes de las ventas filtradas: un ZIP con un PDF por venta o un único PDF. """
+    ventas = _ventas_filtradas(filtros)
+    if formato == "pdf":
+        nombre, escribir = "comprobantes.pdf", lambda f: pdf_unico_de_ventas(ventas, f)
+    else:
+        nombre, escribir = "comprobantes.zip", lambda f: f.writelines(zip_de_ventas(ventas))
+    return {"archivo": escribir_archivo(trabajo, nombre, escribir), "nombre": nombre}
+
+
+@tarea("exportar_ventas")
+def exportar_ventas(trabajo, filtros=None, nivel="ventas"):
+    """ CSV de las ventas filtradas (una fila por venta, o por ítem con nivel=items). """
+    nivel = nivel if nivel in NIVELES else "ventas"
+    partes = csv_por_partes(NIVELES[nivel], filas_de(nivel, _ventas_filtradas(filtros)))
+    archivo = escribir_archivo(trabajo, f"{nivel}.csv", lambda f: f.writelines(p.encode("utf-8") for p in partes))
+    return {"archivo": archivo, "nombre": f"{nivel}.csv"}
+
+
+@tarea("saldos_stock")
+def saldos_stock(trabajo, reconstruir=True):
+    """ Corre saldos_stock (Product.stock contra el libro de movimientos) y guarda su informe. """
+    salida = StringIO()
+    call_command("saldos_stock", reconstruir=reconstruir, stdout=salida)
+    return {"informe": salida.getvalue()[-5000:]}
+
+
+@tarea("conciliar_stock")
+def conciliar_con_lotes(trabajo, corregir=True):
+    """ Concilia Product.stock con los lotes; el resultado son las métricas de la desviación. """
+    return conciliar_stock(corregir)
+
+
+@tarea("resumen_ventas")
+def resumen_ventas(trabajo, desde=None):
+    """ Reconstruye el resumen diario del panel. """
+    filas = reconstruir_resumen(desde=desde)
+    invalidar("ventas")
+    return {"filas": filas}
+
+
+@tarea("vencer_lotes")
+def dar_de_baja_vencidos(trabajo):
+    """ Da de baja los lotes vencidos a hoy. """
+    lotes, unidades = vencer_lotes()
+    return {"lotes": lotes, "unidades": str(unidades)}
@@ -0,0 +1,1206 @@
+import base64
+import csv
+import gzip
+import io
+import itertools
+import json
+import random
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock, skipUnless
+from decimal import ROUND_DOWN, Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import OperationalError, connection
+from django.db.models import F, Min, Sum
+from django.http import QueryDict
+from django.test import Client as ClienteHttp, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import catalogo, dashboard, rfm, vencimientos
+from .api import MARGEN_CAMBIOS
+from .cantidades import MILESIMA, de_milesimas, milesimas, multiplicar, redondear, subtotal
+from .checkout import demanda_por_producto, en_transaccion_con_reintentos, preparar_lineas, registrar_venta
+from .exportacion import COLUMNAS_ITEMS, COLUMNAS_VENTAS, csv_por_partes, filas_de
+from .forms import SaleFilterForm
+from .importacion import importar_csv
+from .instrumentacion import estadisticas, huella_sql
+from .inventario import ORDEN_FEFO, StockInsuficiente, lotes_necesarios, registrar_movimientos
+from .listados import lookup_busqueda
+from .models import (
+    Category, Client, DailySalesSummary, Job, Product, ProductBatch, RawMaterial, Recipe, RecipeItem, Sale, SaleItem, StockMovement, nueva_version,
+)
+from .mrp import maximo_por_receta
+from .paginacion import codificar_cursor, decodificar_cursor, filtro_posterior
+from .trabajos import (
+    TAREAS, ejecutar, encolar, escribir_archivo, purgar, recuperar_abandonados, ruta_archivo, tarea, tomar,
+)
+from .unidades import UnidadesIncompatibles, compatibles, convertir
+
+
+def crear_productos(cantidad, stock=10, lotes=2, precio=1000):
+    """ Productos con `stock` unidades repartidas en `lotes` lotes (con sus movimientos en el libro). """
+    hoy = timezone.localdate()
+    productos = Product.objects.bulk_create([
+        Product(nombre=f"Prueba #{i + 1}", precio_unitario=precio) for i in range(cantidad)
+    ])
+    # Lotes a milésimas (como todo lo que llega al libro); el último se lleva el resto
+    por_lote = redondear(Decimal(stock) / lotes, ROUND_DOWN)
+    cantidades = [por_lote] * (lotes - 1) + [Decimal(stock) - por_lote * (lotes - 1)]
+    nuevos = []
+    for producto in productos:
+        for n, cantidad in enumerate(cantidades):
+            nuevos.append(ProductBatch(
+                producto=producto, codigo_lote=f"P{producto.pk}-{n + 1}", fecha_produccion=hoy,
+                fecha_vencimiento=hoy + timedelta(days=30 + n), cantidad=cantidad,
+            ))
+    ProductBatch.objects.bulk_create(nuevos)
+    registrar_movimientos([
+        StockMovement(producto_id=lote.producto_id, lote=lote, tipo="PRODUCCION", cantidad=lote.cantidad)
+        for lote in nuevos
+    ])
+    return list(Product.objects.filter(pk__in=[p.pk for p in productos]).order_by("pk"))
+
+
+def datos_venta(filas, metodo_pago="TRANSFERENCIA"):
+    """ POST de venta_crear con una fila del formset por (producto, cantidad), a precio de lista. """
+    datos = {
+        "metodo_pago": metodo_pago,
+        "items-TOTAL_FORMS": str(len(filas)),
+        "items-INITIAL_FORMS": "0",
+        "items-MIN_NUM_FORMS": "0",
+        "items-MAX_NUM_FORMS": "1000",
+    }
+    for i, (producto, cantidad) in enumerate(filas):
+        datos[f"items-{i}-producto"] = str(producto.pk)
+        datos[f"items-{i}-cantidad"] = str(cantidad)
+        datos[f"items-{i}-precio_unitario"] = str(producto.precio_unitario)
+    return datos
+
+
+class CheckoutTests(TestCase):
+    # Consultas de venta_crear con el catálogo en caché (savepoints incluidos), para cualquier
+    # cantidad de líneas: productos, bloqueos, lotes, venta, ítems, libro, stock, resumen y comprobante
+    CONSULTAS_CHECKOUT = 14
+
+    def setUp(self):
+        # El catálogo del formulario se calcula una vez y queda en caché: no es parte del checkout
+        catalogo.productos()
+
+    def test_consultas_acotadas(self):
+        productos = crear_productos(20)
+        datos = datos_venta([(p, 2) for p in productos])
+        with self.assertNumQueries(self.CONSULTAS_CHECKOUT):
+            response = self.client.post(reverse("venta_create"), datos)
+        self.assertEqual(response.status_code, 302)
+        venta = Sale.objects.get()
+        self.assertEqual(venta.items.count(), 20)
+        self.assertEqual(venta.total, 20 * 2 * 1000)
+
+    def test_consultas_no_dependen_de_las_lineas(self):
+        productos = crear_productos(40)
+        datos = datos_venta([(p, 1) for p in productos])
+        with self.assertNumQueries(self.CONSULTAS_CHECKOUT):
+            self.client.post(reverse("venta_create"), datos)
+
+    def test_descuenta_stock_por_fefo(self):
+        producto, = crear_productos(1, stock=10, lotes=2)
+        self.client.post(reverse("venta_create"), datos_venta([(producto, 7)]))
+        producto.refresh_from_db()
+        self.assertEqual(producto.stock, Decimal("3"))
+        # El lote que vence antes se agota primero
+        self.assertEqual(list(producto.lotes.values_list("cantidad", flat=True)), [Decimal("0"), Decimal("3")])
+
+    def test_solo_bloquea_los_lotes_necesarios(self):
+        uno, otro = crear_productos(2, stock=10, lotes=10)
+        lotes = lotes_necesarios({uno.pk: Decimal("2.5"), otro.pk: Decimal("1")}, timezone.localdate())
+        self.assertEqual(
+            sorted(lotes.values_list("producto_id", "codigo_lote")),
+            [(uno.pk, f"P{uno.pk}-1"), (uno.pk, f"P{uno.pk}-2"), (uno.pk, f"P{uno.pk}-3"), (otro.pk, f"P{otro.pk}-1")],
+        )
+
+    def test_stock_insuficiente_es_conflicto(self):
+        producto, = crear_productos(1, stock=5)
+        response = self.client.post(reverse("venta_create"), datos_venta([(producto, 6)]))
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Sale.objects.exists())
+
+
+class IndicesTests(TestCase):
+    """ Las consultas calientes usan sus índices (EXPLAIN en SQLite y PostgreSQL). """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.productos = crear_productos(30, lotes=3)
+        cls.cliente = Client.objects.create(nombre="Cliente índices")
+        Sale.objects.bulk_create([Sale(cliente=cls.cliente, metodo_pago="EFECTIVO", total=0) for _ in range(20)])
+
+    def assertUsaIndice(self, queryset, indice):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"EXPLAIN sin verificar en {connection.vendor}")
+        if connection.vendor == "postgresql":
+            # Con tablas de prueba tan chicas el planificador prefiere recorrerlas enteras
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        plan = queryset.explain()
+        self.assertIn(indice, plan, plan)
+
+    def test_fefo(self):
+        # Los lotes que bloquea asignar_fefo_carrito (sin select_for_update: EXPLAIN no cambia)
+        necesarios = lotes_necesarios({p.pk: Decimal("1") for p in self.productos[:5]}, timezone.localdate())
+        lotes = ProductBatch.objects.filter(pk__in=necesarios.values("pk").order_by()).order_by("producto_id", *ORDEN_FEFO)
+        self.assertUsaIndice(lotes, "lote_fefo_disponible_idx")
+
+    def test_catalogo_de_venta(self):
+        # La de catalogo.stock_json() para el formulario de venta_crear
+        productos = Product.objects.filter(activo=True, stock__gt=0).values_list("pk", "stock")
+        self.assertUsaIndice(productos, "producto_activo_stock_idx")
+
+    def test_historial_de_cliente(self):
+        ventas = Sale.objects.filter(cliente=self.cliente).order_by("-fecha", "-id").only("id", "fecha", "total")
+        self.assertUsaIndice(ventas, "venta_cliente_fecha_idx")
+
+
+class CheckoutConcurrenteTests(TransactionTestCase):
+    """ Varias cajas venden a la vez los mismos productos, con más demanda que stock. """
+    HILOS = 8
+    VENTAS_POR_HILO = 15
+    STOCK = 40
+
+    def test_sin_sobreventa_y_libro_cuadrado(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("con SQLite en memoria los hilos no pueden esperar el bloqueo de escritura")
+        ids = [p.pk for p in crear_productos(2, stock=self.STOCK, lotes=4)]
+        resultados = {"ventas": 0, "sin_stock": 0, "agotados": 0}
+        errores = []
+        lock = threading.Lock()
+        barrera = threading.Barrier(self.HILOS)
+
+        def vender(carrito, azar):
+            productos = Product.objects.in_bulk(carrito)
+            items = preparar_lineas([(productos[pk], azar.randint(1, 3), None) for pk in carrito])
+            return registrar_venta(Sale(metodo_pago="TRANSFERENCIA"), items)
+
+        def cajero(semilla):
+            azar = random.Random(semilla)
+            try:
+                barrera.wait()
+                for _ in range(self.VENTAS_POR_HILO):
+                    carrito = azar.sample(ids, k=azar.randint(1, len(ids)))
+                    try:
+                        en_transaccion_con_reintentos(vender, carrito, azar)
+                        resultado = "ventas"
+                    except StockInsuficiente:
+                        resultado = "sin_stock"
+                    except OperationalError:
+                        # Reintentos agotados: la venta no se registra, no es una inconsistencia
+                        resultado = "agotados"
+                    with lock:
+                        resultados[resultado] += 1
+            except Exception as e:
+                with lock:
+                    errores.append(e)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=cajero, args=(semilla,)) for semilla in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        self.assertGreater(resultados["ventas"], 0)
+        # La demanda supera al stock: alguna venta tuvo que rechazarse
+        self.assertGreater(resultados["sin_stock"], 0)
+        for producto in Product.objects.filter(pk__in=ids):
+            vendido = SaleItem.objects.filter(producto=producto).aggregate(s=Sum("cantidad"))["s"] or 0
+            lotes = producto.lotes.aggregate(s=Sum("cantidad"), m=Min("cantidad"))
+            libro = StockMovement.objects.filter(producto=producto).aggregate(s=Sum("cantidad"))["s"]
+            with self.subTest(producto=producto.pk):
+                self.assertLessEqual(vendido, self.STOCK)
+                self.assertGreaterEqual(lotes["m"], 0)
+                self.assertEqual(lotes["s"] + vendido, self.STOCK)
+                self.assertEqual(producto.stock, self.STOCK - vendido)
+                self.assertEqual(libro, producto.stock)
+
+
+def cantidades_de_prueba(azar, n):
+    """
+    Cantidades como llegan a la aplicación: Decimal con 0 a 6 decimales,
+    floats (formularios, JSON) y enteros, incluidos los casos de empate a
+    media milésima.
+    """
+    valores = []
+    for _ in range(n):
+        tipo = azar.randrange(4)
+        if tipo == 0:
+            valores.append(Decimal(azar.randint(0, 10 ** 9)).scaleb(-azar.randint(0, 6)))
+        elif tipo == 1:
+            valores.append(round(azar.uniform(0, 1000), azar.randint(0, 6)))
+        elif tipo == 2:
+            valores.append(azar.randint(0, 1000))
+        else:
+            valores.append(Decimal(azar.randint(0, 10 ** 6)).scaleb(-3) + Decimal("0.0005"))
+    return valores
+
+
+class CantidadesTests(SimpleTestCase):
+    """ Propiedades de cantidades.py sobre una grilla completa y muestras al azar (semilla fija). """
+    MUESTRAS = 20000
+
+    def setUp(self):
+        self.azar = random.Random(24)
+
+    def test_redondear_es_idempotente_y_queda_a_milesimas(self):
+        for valor in cantidades_de_prueba(self.azar, self.MUESTRAS):
+            r = redondear(valor)
+            self.assertEqual(redondear(r), r, valor)
+            self.assertEqual(r, r.quantize(MILESIMA), valor)
+            self.assertLessEqual(abs(r - Decimal(repr(valor) if isinstance(valor, float) else valor)),
+                                 Decimal("0.0005"), valor)
+
+    def test_milesimas_ida_y_vuelta(self):
+        # Exhaustivo en [-5, 5] y al azar fuera de ese rango
+        enteros = list(range(-5000, 5001)) + [self.azar.randint(-10 ** 12, 10 ** 12) for _ in range(self.MUESTRAS)]
+        for entero in enteros:
+            self.assertEqual(milesimas(de_milesimas(entero)), entero)
+
+    def test_round_down_nunca_pasa_el_stock(self):
+        # El máximo multiplicador de una receta (ROUND_DOWN) nunca consume más que el stock
+        for _ in range(self.MUESTRAS):
+            consumo = de_milesimas(self.azar.randint(1, 10 ** 6))
+            stock = de_milesimas(self.azar.randint(0, 10 ** 8))
+            maximo = maximo_por_receta({1: consumo}, {1: stock})
+            self.assertLessEqual(consumo * maximo, stock, (consumo, stock))
+            self.assertLessEqual(multiplicar(consumo, maximo), stock, (consumo, stock))
+            # ... y es el mayor: una milésima más ya no alcanza
+            self.assertGreater(consumo * (maximo + MILESIMA), stock, (consumo, stock))
+        for valor in cantidades_de_prueba(self.azar, self.MUESTRAS):
+            self.assertLessEqual(redondear(valor, ROUND_DOWN), redondear(valor), valor)
+
+    def test_subtotal_es_exacto(self):
+        for valor in cantidades_de_prueba(self.azar, self.MUESTRAS):
+            precio = self.azar.randint(0, 50000)
+            cantidad = redondear(valor)
+            self.assertEqual(subtotal(precio, valor), precio * milesimas(cantidad) // 1000, (precio, valor))
+
+    def test_lineas_redondeadas_suman_la_demanda(self):
+        # Lo que descuenta el libro (la demanda por producto) es la suma exacta de las líneas guardadas
+        productos = [Product(pk=i, nombre=f"P{i}", precio_unitario=1000 + i) for i in range(1, 6)]
+        for _ in range(self.MUESTRAS // 10):
+            filas = [
+                (self.azar.choice(productos), cantidad, None)
+                for cantidad in cantidades_de_prueba(self.azar, self.azar.randint(1, 20))
+            ]
+            items = preparar_lineas(filas)
+            demanda = demanda_por_producto(items)
+            for producto, total in demanda.items():
+                lineas = [i.cantidad for i in items if i.producto is producto]
+                self.assertEqual(milesimas(total), sum(milesimas(c) for c in lineas))
+                self.assertEqual(total, redondear(total))
+            self.assertEqual(sum(i.subtotal for i in items),
+                             sum(subtotal(i.precio_unitario, i.cantidad) for i in items))
+
+
+class CantidadesLibroTests(TestCase):
+    """ Ventas al azar con cantidades fraccionarias: stock, lotes, libro y líneas coinciden a la milésima. """
+    VENTAS = 150
+
+    def test_deltas_del_libro_coinciden_con_las_lineas(self):
+        azar = random.Random(2024)
+        productos = crear_productos(4, stock=100000, lotes=3)
+        vendido = {p.pk: Decimal("0") for p in productos}
+        for _ in range(self.VENTAS):
+            filas = [
+                (azar.choice(productos), azar.choice([azar.uniform(0.001, 5), Decimal(azar.randint(1, 5000)).scaleb(-4)]), None)
+                for _ in range(azar.randint(1, 6))
+            ]
+            items = preparar_lineas(filas)
+            venta = registrar_venta(Sale(metodo_pago="EFECTIVO"), items)
+            self.assertEqual(venta.total, sum(subtotal(i.precio_unitario, i.cantidad) for i in items))
+            for item in items:
+                vendido[item.producto_id] += item.cantidad
+        for producto in Product.objects.filter(pk__in=vendido):
+            libro = StockMovement.objects.filter(producto=producto).aggregate(s=Sum("cantidad"))["s"]
+            lotes = producto.lotes.aggregate(s=Sum("cantidad"))["s"]
+            lineas = SaleItem.objects.filter(producto=producto).aggregate(s=Sum("cantidad"))["s"]
+            with self.subTest(producto=producto.pk):
+                self.assertEqual(producto.stock, Decimal(100000) - vendido[producto.pk])
+                # En SQLite SUM() suma en punto flotante: se compara a milésimas
+                self.assertEqual(redondear(libro), producto.stock)
+                self.assertEqual(redondear(lotes), producto.stock)
+                self.assertEqual(redondear(lineas), vendido[producto.pk])
+
+
+class AdminStockTests(TestCase):
+    """ El admin no puede mover el stock por fuera del libro. """
+
+    def setUp(self):
+        usuario = get_user_model().objects.create_superuser("admin", "admin@example.com", "clave")
+        self.client.force_login(usuario)
+        self.producto, = crear_productos(1, stock=10, lotes=2)
+
+    def assertLibroCuadra(self):
+        self.producto.refresh_from_db()
+        libro = StockMovement.objects.filter(producto=self.producto).aggregate(s=Sum("cantidad"))["s"]
+        lotes = ProductBatch.objects.filter(producto=self.producto).aggregate(s=Sum("cantidad"))["s"] or 0
+        self.assertEqual(redondear(libro), self.producto.stock)
+        self.assertEqual(redondear(lotes), self.producto.stock)
+
+    def test_borrar_lote_ajusta_el_libro(self):
+        lote = self.producto.lotes.first()
+        respuesta = self.client.post(
+            reverse("admin:ventas_productbatch_delete", args=[lote.pk]), {"post": "yes"},
+        )
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertLibroCuadra()
+        self.assertEqual(self.producto.stock, Decimal("5"))
+
+    def test_borrar_lotes_en_bloque_ajusta_el_libro(self):
+        lotes = self.producto.lotes.all()
+        self.client.post(reverse("admin:ventas_productbatch_changelist"), {
+            "action": "delete_selected", "post": "yes", "_selected_action": [l.pk for l in lotes],
+        })
+        self.assertFalse(ProductBatch.objects.exists())
+        self.assertLibroCuadra()
+        self.assertEqual(self.producto.stock, 0)
+
+    def test_libro_de_solo_lectura(self):
+        movimiento = StockMovement.objects.first()
+        self.assertEqual(self.client.get(reverse("admin:ventas_stockmovement_add")).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse("admin:ventas_stockmovement_delete", args=[movimiento.pk])).status_code, 403,
+        )
+        respuesta = self.client.post(
+            reverse("admin:ventas_stockmovement_change", args=[movimiento.pk]), {"cantidad": "99"},
+        )
+        self.assertEqual(respuesta.status_code, 403)
+        movimiento.refresh_from_db()
+        self.assertNotEqual(movimiento.cantidad, 99)
+
+
+@override_settings(TRABAJOS_EN_LINEA=False)
+class TrabajosTests(TestCase):
+    """ Cola de trabajos: deduplicación, prioridad, reintentos, abandonados y purga. """
+
+    def setUp(self):
+        archivos = tempfile.TemporaryDirectory(prefix="mermeladas_trabajos_")
+        self.addCleanup(archivos.cleanup)
+        ajustes = self.settings(TRABAJOS_DIR=archivos.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.llamadas = []
+
+        def anotar(trabajo, **argumentos):
+            self.llamadas.append(argumentos)
+            return {"ok": True}
+
+        def fallar(trabajo):
+            raise RuntimeError("falla de prueba")
+
+        for nombre, funcion in (("prueba", anotar), ("prueba_falla", fallar)):
+            tarea(nombre)(funcion)
+            self.addCleanup(TAREAS.pop, nombre)
+
+    def test_clave_deduplica_los_activos(self):
+        primero = encolar("prueba", {"n": 1}, clave="exportar:x")
+        # El segundo INSERT choca con el índice único parcial y devuelve el activo
+        self.assertEqual(encolar("prueba", {"n": 2}, clave="exportar:x").pk, primero.pk)
+        self.assertEqual(Job.objects.count(), 1)
+        ejecutar(tomar("prueba"))
+        # Terminado el primero, la misma clave vuelve a encolarse
+        segundo = encolar("prueba", {"n": 3}, clave="exportar:x")
+        self.assertNotEqual(segundo.pk, primero.pk)
+        self.assertEqual(self.llamadas, [{"n": 1}])
+
+    def test_tarea_desconocida(self):
+        with self.assertRaises(ValueError):
+            encolar("no_existe")
+
+    def test_toma_por_prioridad(self):
+        normal = encolar("prueba")
+        baja = encolar("prueba", prioridad=-10)
+        alta = encolar("prueba", prioridad=10)
+        orden = [tomar("prueba").pk for _ in range(3)]
+        self.assertEqual(orden, [alta.pk, normal.pk, baja.pk])
+        self.assertIsNone(tomar("prueba"))
+
+    def test_reintenta_y_queda_fallido(self):
+        trabajo = encolar("prueba_falla", max_intentos=2)
+        with self.assertLogs("ventas.trabajos", "WARNING"):
+            ejecutar(tomar("prueba"))
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.intentos), ("PENDIENTE", 1))
+        self.assertGreater(trabajo.disponible_desde, timezone.now())
+        # Durante la espera del reintento no se toma
+        self.assertIsNone(tomar("prueba"))
+        Job.objects.filter(pk=trabajo.pk).update(disponible_desde=timezone.now())
+        with self.assertLogs("ventas.trabajos", "WARNING"):
+            ejecutar(tomar("prueba"))
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.intentos), ("FALLIDO", 2))
+        self.assertIn("falla de prueba", trabajo.error)
+        self.assertIsNotNone(trabajo.terminado)
+
+    def test_recupera_abandonados(self):
+        con_intentos = encolar("prueba")
+        sin_intentos = encolar("prueba", max_intentos=1)
+        for _ in range(2):
+            tomar("prueba")
+        Job.objects.update(iniciado=timezone.now() - timedelta(hours=2))
+        self.assertEqual(recuperar_abandonados(), 2)
+        self.assertEqual(Job.objects.get(pk=con_intentos.pk).estado, "PENDIENTE")
+        self.assertEqual(Job.objects.get(pk=sin_intentos.pk).estado, "FALLIDO")
+
+    def test_purga_trabajos_viejos_y_sus_archivos(self):
+        viejo, nuevo = encolar("prueba"), encolar("prueba")
+        rutas = {}
+        for trabajo in (viejo, nuevo):
+            archivo = escribir_archivo(trabajo, "datos.csv", lambda f: f.write(b"a,b\n"))
+            rutas[trabajo.pk] = ruta_archivo(trabajo, "datos.csv")
+            Job.objects.filter(pk=trabajo.pk).update(estado="HECHO", resultado={"archivo": archivo})
+        Job.objects.filter(pk=viejo.pk).update(terminado=timezone.now() - timedelta(days=30))
+        Job.objects.filter(pk=nuevo.pk).update(terminado=timezone.now())
+        self.assertEqual(purgar(dias=7), 1)
+        self.assertFalse(rutas[viejo.pk].exists())
+        self.assertTrue(rutas[nuevo.pk].exists())
+        self.assertEqual(list(Job.objects.values_list("pk", flat=True)), [nuevo.pk])
+
+
+class UnidadesTests(SimpleTestCase):
+    """ Conversión entre unidades de una misma dimensión, a milésimas. """
+
+    def test_masa_y_volumen(self):
+        casos = [
+            ("1.5", "kg", "g", "1500"), ("250", "g", "kg", "0.25"), ("0.001", "kg", "g", "1"),
+            ("2", "l", "ml", "2000"), ("750", "ml", "l", "0.75"), ("3", "un", "un", "3"),
+        ]
+        for cantidad, origen, destino, esperado in casos:
+            with self.subTest(cantidad=cantidad, origen=origen, destino=destino):
+                self.assertEqual(convertir(Decimal(cantidad), origen, destino), Decimal(esperado))
+
+    def test_redondea_a_milesimas(self):
+        self.assertEqual(convertir(Decimal("1"), "g", "kg"), Decimal("0.001"))
+        self.assertEqual(convertir(Decimal("1.6"), "g", "kg"), Decimal("0.002"))
+        self.assertEqual(convertir(Decimal("0.4"), "ml", "l"), Decimal("0"))
+        # Los empates van al par, como en redondear()
+        self.assertEqual(convertir(Decimal("2.5"), "g", "kg"), Decimal("0.002"))
+        self.assertEqual(convertir(Decimal("3.5"), "g", "kg"), Decimal("0.004"))
+        # Ida y vuelta exacta para lo que ya está a milésimas de la unidad grande
+        for milesimas_kg in range(0, 5001, 7):
+            kg = Decimal(milesimas_kg) / 1000
+            self.assertEqual(convertir(convertir(kg, "kg", "g"), "g", "kg"), kg)
+
+    def test_rechaza_dimensiones_distintas(self):
+        for origen, destino in (("g", "ml"), ("un", "kg"), ("l", "g"), ("ml", "un")):
+            with self.subTest(origen=origen, destino=destino):
+                with self.assertRaises(UnidadesIncompatibles):
+                    convertir(Decimal("1"), origen, destino)
+        self.assertEqual(sorted(compatibles("g")), ["g", "kg"])
+        self.assertEqual(compatibles("un"), ["un"])
+
+
+class IngredientesTests(TestCase):
+    """ RecipeItem.cantidad_base queda en la unidad de su materia prima. """
+
+    def setUp(self):
+        self.azucar = RawMaterial.objects.create(nombre="Azúcar", unidad="g", costo_unitario=2)
+        self.receta = Recipe.objects.create(nombre="Mermelada de prueba")
+
+    def test_convierte_al_guardar(self):
+        en_kg = RecipeItem.objects.create(receta=self.receta, materia_prima=self.azucar, cantidad=Decimal("1.25"),
+                                          unidad="kg")
+        sin_unidad = RecipeItem.objects.create(receta=self.receta, materia_prima=self.azucar, cantidad=300)
+        self.assertEqual(en_kg.cantidad_base, Decimal("1250"))
+        self.assertEqual((sin_unidad.unidad, sin_unidad.cantidad_base), ("g", Decimal("300")))
+        self.assertEqual(Recipe.objects.with_costs().get().costo, 1550 * 2)
+
+    def test_clean_rechaza_unidad_de_otra_dimension(self):
+        item = RecipeItem(receta=self.receta, materia_prima=self.azucar, cantidad=1, unidad="l")
+        with self.assertRaises(ValidationError) as error:
+            item.full_clean()
+        self.assertIn("unidad", error.exception.message_dict)
+
+    def test_cambiar_unidad_de_la_materia_recalcula(self):
+        item = RecipeItem.objects.create(receta=self.receta, materia_prima=self.azucar, cantidad=500, unidad="g")
+        self.azucar.unidad = "kg"
+        self.azucar.save()
+        item.refresh_from_db()
+        self.assertEqual((item.cantidad, item.unidad, item.cantidad_base), (Decimal("500"), "g", Decimal("0.5")))
+        # Guardar sólo el stock (movimientos de producción) no vuelve a convertir
+        RecipeItem.objects.filter(pk=item.pk).update(cantidad_base=Decimal("9"))
+        self.azucar.stock = 10
+        self.azucar.save(update_fields=["stock"])
+        item.refresh_from_db()
+        self.assertEqual(item.cantidad_base, Decimal("9"))
+
+
+class ApiTests(TestCase):
+    """ Las terminales revalidan con If-None-Match y piden sólo lo que cambió. """
+
+    def setUp(self):
+        self.productos = crear_productos(20)
+
+    def vender(self, producto, cantidad=1):
+        # La versión de la caché se incrementa al confirmar (on_commit)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("venta_create"), datos_venta([(producto, cantidad)]))
+
+    def test_get_repetido_es_304(self):
+        primera = self.client.get(reverse("api_productos"))
+        self.assertEqual(primera.status_code, 200)
+        etag = primera["ETag"]
+        self.assertEqual(len(primera.json()["filas"]), 20)
+        # Revalidar cuesta una consulta (las versiones) y no trae cuerpo
+        with self.assertNumQueries(1):
+            segunda = self.client.get(reverse("api_productos"), headers={"If-None-Match": etag})
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda["ETag"], etag)
+        self.assertEqual(segunda.content, b"")
+
+    def test_etag_cambia_con_una_venta(self):
+        etag = self.client.get(reverse("api_stock"))["ETag"]
+        self.vender(self.productos[0])
+        respuesta = self.client.get(reverse("api_stock"), headers={"If-None-Match": etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta["ETag"], etag)
+        stock = dict(respuesta.json()["filas"])
+        self.assertEqual(Decimal(stock[self.productos[0].pk]), Decimal("9"))
+
+    def test_gzip_tiene_su_propio_etag(self):
+        plano = self.client.get(reverse("api_productos"))
+        comprimido = self.client.get(reverse("api_productos"), headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(comprimido["Content-Encoding"], "gzip")
+        self.assertEqual(comprimido["ETag"], plano["ETag"][:-1] + '-gz"')
+        self.assertEqual(json.loads(gzip.decompress(comprimido.content)), plano.json())
+        self.assertIn("Accept-Encoding", comprimido["Vary"])
+        # El ETag sin comprimir no valida la respuesta comprimida
+        revalidada = self.client.get(reverse("api_productos"),
+                                     headers={"Accept-Encoding": "gzip", "If-None-Match": plano["ETag"]})
+        self.assertEqual(revalidada.status_code, 200)
+
+    def test_cambios_trae_solo_lo_modificado(self):
+        # El catálogo cambió hace rato (fuera del margen) y la terminal ya está al día
+        Product.objects.update(version=F("version") - 10 * MARGEN_CAMBIOS)
+        desde = nueva_version()
+        vendido, editado = self.productos[3], self.productos[7]
+        self.vender(vendido)
+        editado.precio_unitario = 1500
+        editado.save()
+        respuesta = self.client.get(reverse("api_productos_cambios"), {"desde": desde, "campos": "stock,precio"})
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos["campos"], ["id", "stock", "precio"])
+        self.assertEqual(
+            sorted((fila[0], Decimal(fila[1]), fila[2]) for fila in datos["filas"]),
+            [(vendido.pk, Decimal("9"), 1000), (editado.pk, Decimal("10"), 1500)],
+        )
+        self.assertGreater(datos["version"], desde)
+        # Sin cambios nuevos, sólo vuelven los que caen en el margen
+        otra = self.client.get(reverse("api_productos_cambios"), {"desde": datos["version"] + 2 * MARGEN_CAMBIOS})
+        self.assertEqual(otra.json()["filas"], [])
+
+    def test_cambios_sin_version_es_400(self):
+        self.assertEqual(self.client.get(reverse("api_productos_cambios")).status_code, 400)
+
+
+class VencimientosTests(TestCase):
+    """ Los lotes vencidos salen del stock por el libro y no se venden. """
+
+    def setUp(self):
+        catalogo.productos()
+        self.hoy = timezone.localdate()
+        self.uno, self.otro = Product.objects.bulk_create([
+            Product(nombre="Frutilla", precio_unitario=1000), Product(nombre="Mora", precio_unitario=1000),
+        ])
+        # (producto, días hasta el vencimiento, cantidad): vencen los de días negativos
+        lotes = ProductBatch.objects.bulk_create([
+            ProductBatch(producto=producto, codigo_lote=f"L{n}", fecha_produccion=self.hoy - timedelta(days=60),
+                         fecha_vencimiento=self.hoy + timedelta(days=dias), cantidad=Decimal(cantidad))
+            for n, (producto, dias, cantidad) in enumerate([
+                (self.uno, -3, "3"), (self.uno, -1, "4.5"), (self.uno, 0, "2"), (self.uno, 10, "5"),
+                (self.otro, -2, "1.25"), (self.otro, 20, "6"),
+            ])
+        ])
+        registrar_movimientos([
+            StockMovement(producto_id=l.producto_id, lote=l, tipo="PRODUCCION", cantidad=l.cantidad) for l in lotes
+        ])
+
+    def assertSaldosCuadran(self):
+        for producto in Product.objects.all():
+            libro = producto.movimientos.aggregate(s=Sum("cantidad"))["s"]
+            lotes = producto.lotes.aggregate(s=Sum("cantidad"))["s"]
+            self.assertEqual(redondear(libro), producto.stock)
+            self.assertEqual(redondear(lotes), producto.stock)
+
+    def test_vence_lotes_y_registra_la_perdida(self):
+        self.assertEqual(vencimientos.vencer_lotes(bloque=2), (3, Decimal("8.75")))
+        vencidos = ProductBatch.objects.filter(fecha_vencimiento__lt=self.hoy)
+        self.assertEqual(set(vencidos.values_list("cantidad", flat=True)), {Decimal("0")})
+        # El día del vencimiento todavía se vende
+        self.assertEqual(ProductBatch.objects.get(codigo_lote="L2").cantidad, Decimal("2"))
+        perdidas = StockMovement.objects.filter(tipo="VENCIMIENTO")
+        self.assertEqual(perdidas.count(), 3)
+        self.assertEqual(perdidas.aggregate(s=Sum("cantidad"))["s"], Decimal("-8.75"))
+        self.assertSaldosCuadran()
+        self.assertEqual(Product.objects.get(pk=self.uno.pk).stock, Decimal("7"))
+        # Un segundo barrido no encuentra nada
+        self.assertEqual(vencimientos.vencer_lotes(bloque=2), (0, 0))
+
+    def test_bloque_incompleto_no_corta_el_barrido(self):
+        bloquear = vencimientos.bloquear_productos
+
+        def vender_entre_lectura_y_bloqueo(ids):
+            # Una venta vacía un lote ya leído antes de que el barrido lo bloquee
+            ProductBatch.objects.filter(codigo_lote="L0", cantidad__gt=0).update(cantidad=0)
+            return bloquear(ids)
+
+        with mock.patch.object(vencimientos, "bloquear_productos", vender_entre_lectura_y_bloqueo):
+            self.assertEqual(vencimientos.vencer_lotes(bloque=2), (2, Decimal("5.75")))
+        self.assertFalse(ProductBatch.objects.filter(cantidad__gt=0, fecha_vencimiento__lt=self.hoy).exists())
+
+    def test_checkout_salta_lotes_vencidos(self):
+        self.client.post(reverse("venta_create"), datos_venta([(self.uno, 3)]))
+        cantidades = dict(self.uno.lotes.values_list("codigo_lote", "cantidad"))
+        # Sin vender de L0/L1 (vencidos): sale primero el que vence hoy y después el siguiente
+        self.assertEqual(cantidades, {"L0": Decimal("3"), "L1": Decimal("4.5"), "L2": Decimal("0"), "L3": Decimal("4")})
+        # Lo vigente que queda (4) no alcanza aunque los vencidos tengan saldo
+        respuesta = self.client.post(reverse("venta_create"), datos_venta([(self.uno, 5)]))
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertSaldosCuadran()
+
+
+def csv_de(*lineas):
+    return io.StringIO("\n".join(lineas) + "\n")
+
+
+class ImportacionTests(TestCase):
+    """ Importación CSV: actualiza por nombre, crea lo nuevo e informa las filas inválidas por línea. """
+
+    def test_productos(self):
+        existente = Product.objects.create(nombre="Frutilla", precio_unitario=1000)
+        archivo = csv_de(
+            "nombre,categoria,unidad,precio_unitario,activo",
+            "Frutilla,Mermeladas,un,1200,sí",
+            "Mora,Mermeladas,un,900,sí",
+            "Mora,Mermeladas,un,950,no",
+            "Durazno,Mermeladas,un,-5,sí",
+        )
+        importador = importar_csv("productos", archivo)
+        self.assertEqual((importador.filas, importador.creados, importador.actualizados), (4, 1, 1))
+        self.assertEqual(len(importador.errores), 1)
+        linea, texto = importador.errores[0]
+        self.assertEqual(linea, 5)
+        self.assertIn("precio_unitario", texto)
+        existente.refresh_from_db()
+        self.assertEqual(existente.precio_unitario, 1200)
+        # La fila repetida: gana la última
+        mora = Product.objects.get(nombre="Mora")
+        self.assertEqual((mora.precio_unitario, mora.activo), (950, False))
+        self.assertEqual(mora.categoria, Category.objects.get(nombre="Mermeladas"))
+        self.assertFalse(Product.objects.filter(nombre="Durazno").exists())
+
+    def test_materias_con_punto_y_coma(self):
+        RawMaterial.objects.create(nombre="Azúcar", unidad="g", costo_unitario=2)
+        archivo = csv_de(
+            "nombre;unidad;costo_unitario;stock",
+            "Azúcar;g;3;1000",
+            "Pectina;g;40;250.5",
+            "Pectina;g;45;250.5",
+            "Limón;litros;10;5",
+        )
+        importador = importar_csv("materias", archivo)
+        self.assertEqual((importador.creados, importador.actualizados), (1, 1))
+        self.assertEqual([linea for linea, _ in importador.errores], [5])
+        self.assertIn("unidad", importador.errores[0][1])
+        self.assertEqual(RawMaterial.objects.get(nombre="Azúcar").costo_unitario, 3)
+        self.assertEqual(RawMaterial.objects.get(nombre="Pectina").costo_unitario, 45)
+
+    def test_clientes_actualiza_el_de_menor_id(self):
+        primero = Client.objects.create(nombre="Ana", telefono="1")
+        segundo = Client.objects.create(nombre="Ana", telefono="2")
+        archivo = csv_de(
+            "nombre,email,telefono,direccion",
+            "Ana,ana@example.com,3,",
+            "Beto,no-es-un-email,4,",
+        )
+        importador = importar_csv("clientes", archivo)
+        self.assertEqual((importador.creados, importador.actualizados), (0, 1))
+        self.assertEqual([linea for linea, _ in importador.errores], [3])
+        self.assertEqual(Client.objects.get(pk=primero.pk).telefono, "3")
+        self.assertEqual(Client.objects.get(pk=segundo.pk).telefono, "2")
+
+    def test_recetas_suman_ingredientes_repetidos(self):
+        azucar = RawMaterial.objects.create(nombre="Azúcar", unidad="g")
+        RawMaterial.objects.create(nombre="Frutilla", unidad="kg")
+        receta = Recipe.objects.create(nombre="Mermelada de frutilla")
+        RecipeItem.objects.create(receta=receta, materia_prima=azucar, cantidad=1)
+        archivo = csv_de(
+            "receta,producto_final,rendimiento_unidades,materia_prima,cantidad,unidad",
+            "Mermelada de frutilla,,10,Azúcar,500,g",
+            "Mermelada de frutilla,,10,Frutilla,1.5,",
+            "Mermelada de frutilla,,10,Azúcar,0.25,kg",
+            "Mermelada de frutilla,,10,Pectina,10,g",
+            "Mermelada de frutilla,,10,Frutilla,1,l",
+        )
+        importador = importar_csv("recetas", archivo)
+        self.assertEqual((importador.creados, importador.actualizados), (0, 1))
+        self.assertEqual([linea for linea, _ in importador.errores], [5, 6])
+        self.assertIn("no existe la materia prima Pectina", importador.errores[0][1])
+        self.assertIn("unidad", importador.errores[1][1])
+        # Los ingredientes del archivo reemplazan a los que tenía; el azúcar repetido se suma en gramos
+        self.assertEqual(
+            sorted(receta.items.values_list("materia_prima__nombre", "unidad", "cantidad_base")),
+            [("Azúcar", "g", Decimal("750")), ("Frutilla", "kg", Decimal("1.5"))],
+        )
+        receta.refresh_from_db()
+        self.assertEqual(receta.rendimiento_unidades, Decimal("10"))
+
+    def test_simular_no_guarda(self):
+        archivo = csv_de("nombre,email,telefono,direccion", "Ana,,,")
+        importador = importar_csv("clientes", archivo, simular=True)
+        self.assertEqual(importador.creados, 1)
+        self.assertFalse(Client.objects.exists())
+
+    def test_faltan_columnas(self):
+        with self.assertRaises(ValueError):
+            importar_csv("productos", csv_de("nombre,precio_unitario", "Frutilla,1000"))
+
+
+class ExportacionTests(TestCase):
+    """ CSV de ventas para contabilidad: encabezado, filtros y nivel de ítems. """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.frutilla, cls.mora = crear_productos(2, stock=100)
+        cls.ana = Client.objects.create(nombre="Ana, la del almacén")
+        cls.ventas = []
+        for cliente, metodo, filas in [
+            (cls.ana, "EFECTIVO", [(cls.frutilla, Decimal("1.5")), (cls.mora, Decimal("2"))]),
+            (None, "TRANSFERENCIA", [(cls.mora, Decimal("1"))]),
+            (cls.ana, "TRANSFERENCIA", [(cls.frutilla, Decimal("3"))]),
+        ]:
+            items = preparar_lineas([(producto, cantidad, None) for producto, cantidad in filas])
+            cls.ventas.append(registrar_venta(Sale(cliente=cliente, metodo_pago=metodo), items))
+
+    def leer(self, texto):
+        self.assertTrue(texto.startswith("\ufeff"))
+        return list(csv.reader(io.StringIO(texto[1:])))
+
+    def exportar(self, nivel, filtros=None, filas_por_parte=500):
+        ventas = SaleFilterForm(filtros).filtrar(Sale.objects.order_by("fecha", "id"))
+        partes = list(csv_por_partes({"ventas": COLUMNAS_VENTAS, "items": COLUMNAS_ITEMS}[nivel],
+                                     filas_de(nivel, ventas), filas_por_parte=filas_por_parte))
+        return partes, self.leer("".join(partes))
+
+    def test_ventas(self):
+        partes, filas = self.exportar("ventas", filas_por_parte=2)
+        # Encabezado (con BOM) aparte y las filas de a 2
+        self.assertEqual(len(partes), 3)
+        self.assertEqual(filas[0], list(COLUMNAS_VENTAS))
+        self.assertEqual([int(f[0]) for f in filas[1:]], [v.pk for v in self.ventas])
+        primera = dict(zip(COLUMNAS_VENTAS, filas[1]))
+        self.assertEqual(primera["cliente"], "Ana, la del almacén")
+        self.assertEqual(primera["total"], "3500")
+        self.assertEqual(filas[2][2:4], ["", ""])
+
+    def test_por_partes_sin_juntar_las_filas(self):
+        # Con filas sin fin, las partes igual salen: nada espera a leer el resultado completo
+        infinitas = ((n, f"fila {n}") for n in itertools.count())
+        partes = itertools.islice(csv_por_partes(("n", "texto"), infinitas, filas_por_parte=1000), 4)
+        self.assertEqual([p.count("\n") for p in partes], [1, 1000, 1000, 1000])
+
+    def test_filtros(self):
+        _, filas = self.exportar("ventas", {"cliente": self.ana.pk, "metodo_pago": "TRANSFERENCIA"})
+        self.assertEqual([int(f[0]) for f in filas[1:]], [self.ventas[2].pk])
+        hoy = timezone.localdate()
+        _, filas = self.exportar("ventas", {"desde": hoy + timedelta(days=1)})
+        self.assertEqual(filas, [list(COLUMNAS_VENTAS)])
+
+    def test_items(self):
+        _, filas = self.exportar("items", {"cliente": self.ana.pk})
+        self.assertEqual(filas[0], list(COLUMNAS_ITEMS))
+        filas = [dict(zip(COLUMNAS_ITEMS, f)) for f in filas[1:]]
+        self.assertEqual(
+            [(int(f["venta_id"]), f["producto"], Decimal(f["cantidad"]), int(f["subtotal"])) for f in filas],
+            [(self.ventas[0].pk, self.frutilla.nombre, Decimal("1.5"), 1500),
+             (self.ventas[0].pk, self.mora.nombre, Decimal("2"), 2000),
+             (self.ventas[2].pk, self.frutilla.nombre, Decimal("3"), 3000)],
+        )
+        # Fecha local, sin microsegundos
+        local = timezone.localtime(self.ventas[0].fecha).replace(microsecond=0)
+        self.assertEqual(filas[0]["fecha"], str(local))
+
+    def test_descarga_directa_y_en_cola_son_iguales(self):
+        parametros = {"cliente": self.ana.pk, "nivel": "items"}
+        respuesta = self.client.get(reverse("ventas_exportar_directo"), parametros)
+        self.assertTrue(respuesta.streaming)
+        self.assertEqual(respuesta["Content-Disposition"], 'attachment; filename="items.csv"')
+        directo = b"".join(respuesta.streaming_content)
+        _, esperado = self.exportar("items", {"cliente": self.ana.pk})
+        self.assertEqual(self.leer(directo.decode("utf-8")), esperado)
+
+        archivos = tempfile.TemporaryDirectory()
+        self.addCleanup(archivos.cleanup)
+        with self.settings(TRABAJOS_DIR=archivos.name, TRABAJOS_EN_LINEA=False):
+            respuesta = self.client.get(reverse("ventas_exportar"), parametros)
+            trabajo = Job.objects.get(tarea="exportar_ventas")
+            self.assertRedirects(respuesta, reverse("trabajo_detalle", args=[trabajo.pk]))
+            ejecutar(tomar("prueba"))
+            descarga = self.client.get(reverse("trabajo_archivo", args=[trabajo.pk]))
+            self.assertEqual(b"".join(descarga.streaming_content), directo)
+
+
+@override_settings(INSTRUMENTACION_TOKEN="secreto", INSTRUMENTACION_MUESTREO=1)
+class InstrumentacionTests(TestCase):
+    """ Muestreo y conteo de consultas del middleware, y el endpoint que los expone. """
+
+    def setUp(self):
+        estadisticas.reiniciar()
+        self.addCleanup(estadisticas.reiniciar)
+        crear_productos(3)
+
+    def test_cuenta_las_consultas_de_la_vista(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse("productos_list"))
+        self.assertIn("total;dur=", respuesta["Server-Timing"])
+        vista = estadisticas.como_dict()["productos_list"]
+        self.assertEqual(vista["solicitudes"], 1)
+        self.assertEqual(vista["consultas_max"], len(consultas))
+
+    def test_cuenta_las_consultas_de_vistas_asincronas(self):
+        self.client.get(reverse("api_productos"))
+        # El ORM corre las consultas de la vista asíncrona en otro hilo: las cuenta igual (ContextVar)
+        self.assertGreater(estadisticas.como_dict()["api_productos"]["consultas_max"], 0)
+
+    def test_muestreo(self):
+        with self.settings(INSTRUMENTACION_MUESTREO=0):
+            respuesta = self.client.get(reverse("productos_list"))
+        self.assertNotIn("Server-Timing", respuesta)
+        with self.settings(INSTRUMENTACION_MUESTREO=0.5):
+            for azar in (0.7, 0.2, 0.9, 0.4):
+                with mock.patch("ventas.instrumentacion.random.random", return_value=azar):
+                    self.client.get(reverse("productos_list"))
+        self.assertEqual(estadisticas.como_dict()["productos_list"]["solicitudes"], 2)
+
+    def test_huella_sql(self):
+        sql = "SELECT * FROM t WHERE id IN (%s, %s, %s) AND nombre = 'O''Higgins' AND n > 10"
+        self.assertEqual(huella_sql(sql), "SELECT * FROM t WHERE id IN (...) AND nombre = ? AND n > ?")
+
+    def test_reinicio_con_token_sin_csrf(self):
+        cliente = ClienteHttp(enforce_csrf_checks=True)
+        self.client.get(reverse("productos_list"))
+        respuesta = cliente.post(reverse("instrumentacion"), headers={"Authorization": "Bearer secreto"})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()["vistas"], {})
+        otro_token = cliente.post(reverse("instrumentacion"), headers={"Authorization": "Bearer otro"})
+        self.assertEqual(otro_token.status_code, 403)
+
+    def test_reinicio_con_sesion_pide_csrf(self):
+        cliente = ClienteHttp(enforce_csrf_checks=True)
+        cliente.force_login(get_user_model().objects.create_user("staff", password="clave", is_staff=True))
+        self.client.get(reverse("productos_list"))
+        self.assertEqual(cliente.post(reverse("instrumentacion")).status_code, 403)
+        self.assertIn("productos_list", estadisticas.como_dict())
+        self.assertEqual(cliente.get(reverse("instrumentacion")).status_code, 200)
+        # La cookie y el token que pone cualquier página con formulario
+        cliente.cookies["csrftoken"] = "a" * 32
+        respuesta = cliente.post(reverse("instrumentacion"), headers={"X-CSRFToken": "a" * 32})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotIn("productos_list", estadisticas.como_dict())
+
+
+def token_de(valor):
+    return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip("=")
+
+
+class PaginacionTests(TestCase):
+    """ Paginación por cursor (keyset) del historial de ventas, con empates en la fecha. """
+
+    @classmethod
+    def setUpTestData(cls):
+        Sale.objects.bulk_create([
+            Sale(metodo_pago="EFECTIVO" if n % 3 else "TRANSFERENCIA", total=n) for n in range(120)
+        ])
+        # Tres fechas repetidas 40 veces cada una: los bordes de página caen dentro de un empate
+        base = timezone.now().replace(microsecond=123456)
+        for n, pk in enumerate(Sale.objects.order_by("pk").values_list("pk", flat=True)):
+            Sale.objects.filter(pk=pk).update(fecha=base - timedelta(hours=n % 3))
+        cls.campos = [Sale._meta.get_field("fecha"), Sale._meta.get_field("id")]
+
+    def paginas(self, **filtros):
+        """ Recorre el listado siguiendo el enlace a la página siguiente. Devuelve los contextos. """
+        contextos, parametros = [], dict(filtros)
+        while True:
+            respuesta = self.client.get(reverse("ventas_list"), parametros)
+            self.assertEqual(respuesta.status_code, 200)
+            contextos.append(respuesta.context)
+            if not respuesta.context["hay_mas"]:
+                return contextos
+            parametros = QueryDict(respuesta.context["querystring_siguiente"])
+            self.assertLessEqual(len(contextos), 10)
+
+    def test_ida_y_vuelta(self):
+        fecha = datetime(2026, 3, 1, 12, 30, 15, 654321, tzinfo=dt_timezone.utc)
+        self.assertEqual(decodificar_cursor(codificar_cursor([fecha, 42]), self.campos), [fecha, 42])
+        nombre = Product._meta.get_field("nombre")
+        self.assertEqual(decodificar_cursor(codificar_cursor(["Mora, ñandú & 100%", 7]), [nombre, self.campos[1]]),
+                         ["Mora, ñandú & 100%", 7])
+        # Sin relleno "=" (va en la URL)
+        self.assertNotIn("=", codificar_cursor([fecha, 42]))
+
+    def test_token_adulterado(self):
+        for token in ["%%%", "no es base64!", token_de({"fecha": 1}), token_de(["2026-03-01T12:00:00+00:00"]),
+                      token_de(["no es una fecha", 3]), token_de(["2026-03-01T12:00:00+00:00", "x"]),
+                      token_de(["2026-03-01T12:00:00+00:00", 3, 4]), codificar_cursor([1, 2])[:-3]]:
+            with self.subTest(token=token):
+                self.assertIsNone(decodificar_cursor(token, self.campos))
+        # En la vista, un cursor inválido es la primera página y no un error
+        respuesta = self.client.get(reverse("ventas_list"), {"cursor": "%%%"})
+        self.assertEqual(respuesta.status_code, 200)
+        primera = list(Sale.objects.order_by("-fecha", "-id").values_list("pk", flat=True)[:50])
+        self.assertEqual([v.pk for v in respuesta.context["ventas"]], primera)
+
+    def test_paginas_con_empates_en_la_fecha(self):
+        contextos = self.paginas()
+        self.assertEqual([len(c["ventas"]) for c in contextos], [50, 50, 20])
+        recorridas = [v.pk for c in contextos for v in c["ventas"]]
+        # Sin repetidas ni salteadas en los bordes (que caen en medio de una misma fecha)
+        self.assertEqual(recorridas, list(Sale.objects.order_by("-fecha", "-id").values_list("pk", flat=True)))
+        self.assertEqual([c["es_primera_pagina"] for c in contextos], [True, False, False])
+
+    def test_ultima_pagina_justa_no_tiene_siguiente(self):
+        Sale.objects.filter(pk__in=Sale.objects.order_by("pk").values("pk")[:20]).delete()
+        contextos = self.paginas()
+        self.assertEqual([len(c["ventas"]) for c in contextos], [50, 50])
+        self.assertIsNone(contextos[-1]["querystring_siguiente"])
+
+    def test_filtros_se_mantienen_entre_paginas(self):
+        contextos = self.paginas(metodo_pago="EFECTIVO")
+        self.assertEqual([len(c["ventas"]) for c in contextos], [50, 30])
+        self.assertEqual({v.metodo_pago for c in contextos for v in c["ventas"]}, {"EFECTIVO"})
+        # El enlace a la primera página quita el cursor y conserva los filtros
+        self.assertEqual(QueryDict(contextos[1]["querystring_primera"]).dict(), {"metodo_pago": "EFECTIVO"})
+
+    def test_filtro_posterior(self):
+        ventas = Sale.objects.order_by("-fecha", "-id")
+        corte = ventas[49]
+        siguientes = ventas.filter(filtro_posterior(("-fecha", "-id"), [corte.fecha, corte.pk]))
+        self.assertEqual(list(siguientes.values_list("pk", flat=True)), list(ventas.values_list("pk", flat=True)[50:]))
+
+
+class ListadosTests(TestCase):
+    """ Listados del catálogo: búsqueda por nombre, cursor (nombre, id) y una consulta por página. """
+
+    @classmethod
+    def setUpTestData(cls):
+        categoria = Category.objects.create(nombre="Mermeladas")
+        nombres = ["Frutilla", "frutilla light", "FRUTILLA con chía", "Mermelada de frutilla", "Mora", "Durazno"]
+        # Nombres repetidos: el orden (nombre, id) desempata por id en los bordes de página
+        nombres += ["Ciruela"] * 60
+        Product.objects.bulk_create([Product(nombre=n, categoria=categoria, precio_unitario=1000) for n in nombres])
+        azucar = RawMaterial.objects.create(nombre="Azúcar", unidad="g", costo_unitario=2)
+        for n in range(60):
+            receta = Recipe.objects.create(nombre=f"Receta {n:02d}", producto_final=Product.objects.first())
+            RecipeItem.objects.create(receta=receta, materia_prima=azucar, cantidad=100)
+        Client.objects.bulk_create([Client(nombre=f"Cliente {n:02d}") for n in range(60)])
+        Sale.objects.bulk_create([Sale(cliente=c, metodo_pago="EFECTIVO", total=500) for c in Client.objects.all()])
+
+    def test_busqueda(self):
+        respuesta = self.client.get(reverse("productos_list"), {"q": " fruTILLA "})
+        encontrados = {p.nombre for p in respuesta.context["productos"]}
+        esperados = {"Frutilla", "frutilla light", "FRUTILLA con chía"}
+        if lookup_busqueda() == "icontains":
+            esperados.add("Mermelada de frutilla")
+        self.assertEqual(encontrados, esperados)
+        self.assertEqual(respuesta.context["busqueda"], "fruTILLA")
+
+    def test_cursor_con_nombres_repetidos(self):
+        vistos, parametros = [], {}
+        while True:
+            respuesta = self.client.get(reverse("productos_list"), parametros)
+            vistos += [p.pk for p in respuesta.context["productos"]]
+            if not respuesta.context["hay_mas"]:
+                break
+            parametros = QueryDict(respuesta.context["querystring_siguiente"])
+        self.assertEqual(vistos, list(Product.objects.order_by("nombre", "id").values_list("pk", flat=True)))
+
+    def test_busqueda_sigue_en_la_pagina_siguiente(self):
+        respuesta = self.client.get(reverse("productos_list"), {"q": "ciruela"})
+        siguiente = QueryDict(respuesta.context["querystring_siguiente"])
+        self.assertEqual(siguiente["q"], "ciruela")
+        respuesta = self.client.get(reverse("productos_list"), siguiente)
+        self.assertEqual(len(respuesta.context["productos"]), 10)
+        self.assertEqual({p.nombre for p in respuesta.context["productos"]}, {"Ciruela"})
+
+    def test_una_consulta_por_pagina(self):
+        for vista in ("productos_list", "clientes_list", "materias_list", "recetas_list"):
+            with self.subTest(vista=vista), self.assertNumQueries(1):
+                self.assertEqual(self.client.get(reverse(vista)).status_code, 200)
+
+    @skipUnless(connection.vendor == "sqlite", "índice NOCASE propio de SQLite")
+    def test_busqueda_usa_el_indice(self):
+        plan = Product.objects.filter(nombre__istartswith="fru").explain()
+        self.assertIn(f"{Product._meta.db_table}_nombre_nocase", plan)
+
+
+class GastoClientesTests(TestCase):
+    """ Client.objects.with_spending() y la segmentación RFM que se apoya en él. """
+
+    @classmethod
+    def setUpTestData(cls):
+        ahora = timezone.now()
+        cls.clientes = Client.objects.bulk_create([Client(nombre=f"Cliente {n:02d}") for n in range(20)])
+        # El cliente n compra n + 1 veces, por montos crecientes, y su última compra es más reciente
+        for n, cliente in enumerate(cls.clientes):
+            ventas = Sale.objects.bulk_create([
+                Sale(cliente=cliente, total=100 * (n + 1) + k, metodo_pago="EFECTIVO") for k in range(n + 1)
+            ])
+            for k, venta in enumerate(ventas):
+                Sale.objects.filter(pk=venta.pk).update(fecha=ahora - timedelta(days=40 - n, hours=k))
+        cls.sin_compras = Client.objects.create(nombre="Sin compras")
+        Sale.objects.create(total=999, metodo_pago="EFECTIVO")
+
+    def test_with_spending_coincide_con_total_gastado(self):
+        anotados = {c.pk: c for c in Client.objects.with_spending()}
+        self.assertEqual(len(anotados), 21)
+        for cliente in Client.objects.all():
+            with self.subTest(cliente=cliente.nombre):
+                anotado = anotados[cliente.pk]
+                ventas = cliente.sale_set.all()
+                self.assertEqual(anotado.total_gastado(), cliente.total_gastado())
+                self.assertEqual(anotado.num_compras, ventas.count())
+                self.assertEqual(anotado.ultima_compra, max((v.fecha for v in ventas), default=None))
+                if anotado.num_compras:
+                    self.assertEqual(anotado.ticket_promedio, anotado.gasto_total // anotado.num_compras)
+                else:
+                    self.assertIsNone(anotado.ticket_promedio)
+        self.assertEqual(anotados[self.sin_compras.pk].gasto_total, 0)
+        self.assertEqual(
+            sum(c.gasto_total for c in anotados.values()),
+            Sale.objects.filter(cliente__isnull=False).aggregate(total=Sum("total"))["total"],
+        )
+
+    def test_segmento(self):
+        self.assertEqual(rfm.segmento(5, 5, 5), "Campeones")
+        self.assertEqual(rfm.segmento(3, 4, 2), "Leales")
+        self.assertEqual(rfm.segmento(2, 5, 5), "En riesgo")
+        self.assertEqual(rfm.segmento(5, 1, 1), "Nuevos")
+        self.assertEqual(rfm.segmento(4, 3, 3), "Potenciales")
+        self.assertEqual(rfm.segmento(1, 1, 5), "Perdidos")
+        self.assertEqual(rfm.segmento(3, 3, 3), "Necesitan atención")
+
+    def test_calcular_rfm(self):
+        resumen = rfm.calcular_rfm(timezone.localdate(), por_segmento=3)
+        segmentos = {s["nombre"]: s for s in resumen["segmentos"]}
+        self.assertEqual(resumen["total_clientes"], 20)
+        self.assertEqual(sum(s["clientes"] for s in segmentos.values()), 20)
+        self.assertEqual(sum(s["gasto_total"] for s in segmentos.values()),
+                         Sale.objects.filter(cliente__isnull=False).aggregate(total=Sum("total"))["total"])
+        # Recencia, frecuencia y monto crecen juntos: los quintiles coinciden de a cuatro clientes
+        campeones = segmentos["Campeones"]
+        self.assertEqual(campeones["top"][0]["id"], self.clientes[-1].pk)
+        self.assertEqual(campeones["top"][0]["rfm"], "555")
+        self.assertLessEqual(len(campeones["top"]), 3)
+        self.assertEqual(campeones["top"], sorted(campeones["top"], key=lambda fila: -fila["gasto"]))
+        self.assertEqual(campeones["clientes"], 8)
+        self.assertEqual(segmentos["Necesitan atención"]["clientes"], 4)
+        self.assertEqual(segmentos["Perdidos"]["clientes"], 8)
+        self.assertEqual([fila["id"] for fila in segmentos["Perdidos"]["top"]],
+                         [c.pk for c in reversed(self.clientes[5:8])])
+
+    def test_vista(self):
+        respuesta = self.client.get(reverse("clientes_rfm"))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context["total_clientes"], 20)
+
+
+class VistasAsincronasTests(TestCase):
+    """ Panel, detalle de venta y listados por cursor servidos por vistas async (cliente ASGI y WSGI). """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoy = timezone.localdate()
+        cls.frutilla, cls.mora, cls.durazno = crear_productos(3, stock=50)
+        cls.ana = Client.objects.create(nombre="Ana")
+        cls.ventas = []
+        for cliente, filas in [
+            (cls.ana, [(cls.frutilla, Decimal("2")), (cls.mora, Decimal("1"))]),
+            (None, [(cls.frutilla, Decimal("1"))]),
+        ] + [(cls.ana, [(cls.durazno, Decimal("1"))])] * 24:
+            items = preparar_lineas([(producto, cantidad, None) for producto, cantidad in filas])
+            cls.ventas.append(registrar_venta(Sale(cliente=cliente, metodo_pago="EFECTIVO"), items))
+        # Fuera de los 14 días de ingresos, dentro de los 30 del ranking de productos
+        DailySalesSummary.objects.create(fecha=cls.hoy - timedelta(days=20), producto=cls.mora,
+                                         metodo_pago="EFECTIVO", unidades=100, monto=100000, lineas=1)
+        cls.lote = ProductBatch.objects.create(producto=cls.mora, codigo_lote="M-PRONTO", fecha_produccion=cls.hoy,
+                                               fecha_vencimiento=cls.hoy + timedelta(days=3), cantidad=5)
+
+    def setUp(self):
+        # Las versiones de la caché vuelven a su valor inicial con cada rollback: que no se lean datos de otra prueba
+        cache.clear()
+
+    async def test_calcular_dashboard(self):
+        datos = await dashboard.calcular_dashboard(self.hoy)
+        self.assertEqual((datos["total_productos"], datos["total_clientes"], datos["total_ventas"]), (3, 1, 26))
+        self.assertEqual(len(datos["ingresos"]), dashboard.DIAS_INGRESOS)
+        self.assertEqual(datos["ingresos"][-1]["fecha"], self.hoy)
+        self.assertEqual(datos["ingresos"][-1]["porcentaje"], 100)
+        self.assertEqual(datos["ingresos_total"], sum(v.total for v in self.ventas))
+        self.assertEqual(datos["top_productos"][0]["producto__nombre"], self.mora.nombre)
+        self.assertEqual(datos["top_productos"][0]["monto"], 100000 + 1000)
+        self.assertEqual([l["codigo_lote"] for l in datos["por_vencer"]], ["M-PRONTO"])
+
+    async def test_home(self):
+        respuesta = await self.async_client.get(reverse("home"))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context["total_ventas"], 26)
+
+    def test_home_por_wsgi(self):
+        # Bajo WSGI Django corre la vista async con async_to_sync
+        respuesta = self.client.get(reverse("home"))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context["total_ventas"], 26)
+        # Una venta nueva invalida el panel guardado en la caché
+        with self.captureOnCommitCallbacks(execute=True):
+            registrar_venta(Sale(metodo_pago="EFECTIVO"), preparar_lineas([(self.mora, Decimal("1"), None)]))
+        self.assertEqual(self.client.get(reverse("home")).context["total_ventas"], 27)
+
+    def test_venta_detalle(self):
+        venta = self.ventas[0]
+        # Venta con su cliente, ítems y sus productos: sin una consulta por ítem (assertNumQueries es síncrono)
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(reverse("venta_detail", args=[venta.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.context["venta"].cliente, self.ana)
+        self.assertContains(respuesta, self.mora.nombre)
+        respuesta = self.client.get(reverse("venta_detail", args=[0]))
+        self.assertEqual(respuesta.status_code, 404)
+
+    async def test_listados(self):
+        respuesta = await self.async_client.get(reverse("productos_list"))
+        self.assertEqual([p.nombre for p in respuesta.context["productos"]],
+                         sorted(p.nombre for p in (self.frutilla, self.mora, self.durazno)))
+        respuesta = await self.async_client.get(reverse("lotes_por_vencer"), {"dias": 7})
+        self.assertEqual([l.codigo_lote for l in respuesta.context["lotes"]], ["M-PRONTO"])
+
+    async def test_cliente_detalle_paginado(self):
+        url = reverse("cliente_detalle", args=[self.ana.pk])
+        respuesta = await self.async_client.get(url)
+        self.assertEqual(respuesta.context["cliente"].num_compras, 25)
+        self.assertTrue(respuesta.context["hay_mas"])
+        vistas = [v.pk for v in respuesta.context["ventas"]]
+        respuesta = await self.async_client.get(url, QueryDict(respuesta.context["querystring_siguiente"]))
+        self.assertFalse(respuesta.context["hay_mas"])
+        vistas += [v.pk for v in respuesta.context["ventas"]]
+        self.assertEqual(vistas, [v.pk for v in sorted(
+            (v for v in self.ventas if v.cliente_id == self.ana.pk), key=lambda v: (v.fecha, v.pk), reverse=True
+        )])
+        respuesta = await self.async_client.get(reverse("cliente_detalle", args=[0]))
+        self.assertEqual(respuesta.status_code, 404)
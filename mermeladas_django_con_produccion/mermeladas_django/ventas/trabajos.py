@@ -0,0 +1,188 @@
+"""
+Cola de trabajos en la base (modelo Job).
+
+Lo lento que no hace falta para responder (comprobantes PDF, exportaciones,
+conciliación de stock, reconstrucción del resumen diario) se encola con
+`encolar()` y lo ejecuta el comando correr_trabajos en varios procesos.
+
+- Prioridad: se toman primero los de mayor prioridad y, entre iguales, los
+  que están disponibles hace más tiempo.
+- Clave: si ya hay un trabajo pendiente o en curso con la misma clave,
+  encolar devuelve ése en vez de crear otro (un índice único parcial lo
+  garantiza aun con solicitudes simultáneas).
+- Reintentos: si la tarea lanza una excepción vuelve a la cola con espera
+  exponencial, hasta max_intentos; después queda FALLIDO con el error.
+
+Para tomar un trabajo se usa select_for_update(skip_locked=True) en
+PostgreSQL (los procesos no se esperan entre sí); en SQLite la transacción
+IMMEDIATE ya los turna. Si un proceso muere con un trabajo EN_CURSO, pasado
+TIEMPO_MAXIMO el trabajo vuelve a quedar pendiente.
+"""
+import logging
+import os
+import socket
+import tempfile
+import traceback
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+PRIORIDAD_ALTA = 10
+PRIORIDAD_NORMAL = 0
+PRIORIDAD_BAJA = -10
+MAX_INTENTOS = 3
+# Espera antes del primer reintento, en segundos (se duplica en cada intento)
+ESPERA_REINTENTO = 30
+# Un trabajo EN_CURSO por más tiempo que esto se da por abandonado (su proceso murió)
+TIEMPO_MAXIMO = timedelta(hours=1)
+ACTIVOS = ("PENDIENTE", "EN_CURSO")
+
+# nombre -> función(trabajo, **argumentos); ver ventas/tareas.py
+TAREAS = {}
+
+
+def tarea(nombre):
+    """ Registra la función como tarea `nombre`. Recibe el Job y sus argumentos; devuelve un resultado JSON. """
+    def registrar(funcion):
+        TAREAS[nombre] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(nombre, argumentos=None, *, prioridad=PRIORIDAD_NORMAL, clave=None, max_intentos=MAX_INTENTOS):
+    """
+    Encola la tarea `nombre` (se hace visible al confirmar la transacción en
+    curso). Con `clave`, devuelve el trabajo activo con esa clave si lo hay.
+    """
+    if nombre not in TAREAS:
+        raise ValueError(f"Tarea desconocida: {nombre}")
+    trabajo = Job(tarea=nombre, argumentos=argumentos or {}, prioridad=prioridad, clave=clave,
+                  max_intentos=max_intentos)
+    if clave is None:
+        trabajo.save()
+    else:
+        try:
+            with transaction.atomic():
+                trabajo.save()
+        except IntegrityError:
+            existente = Job.objects.filter(clave=clave, estado__in=ACTIVOS).first()
+            if existente is not None:
+                return existente
+            # Terminó entre el INSERT y la consulta: ya no hay conflicto
+            trabajo.save()
+    if getattr(settings, "TRABAJOS_EN_LINEA", False):
+        transaction.on_commit(lambda: _en_linea(trabajo.pk))
+    return trabajo
+
+
+def _en_linea(pk):
+    trabajo = tomar("en-linea", pk=pk)
+    if trabajo is not None:
+        ejecutar(trabajo)
+
+
+def nombre_trabajador():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def tomar(trabajador, pk=None):
+    """ Marca EN_CURSO y devuelve el próximo trabajo disponible (o el `pk` pedido), o None. """
+    ahora = timezone.now()
+    with transaction.atomic():
+        pendientes = Job.objects.filter(estado="PENDIENTE", disponible_desde__lte=ahora)
+        if pk is not None:
+            pendientes = pendientes.filter(pk=pk)
+        if connection.features.has_select_for_update_skip_locked:
+            pendientes = pendientes.select_for_update(skip_locked=True)
+        trabajo = pendientes.order_by("-prioridad", "disponible_desde", "id").first()
+        if trabajo is None:
+            return None
+        trabajo.estado = "EN_CURSO"
+        trabajo.intentos += 1
+        trabajo.iniciado = ahora
+        trabajo.trabajador = trabajador
+        trabajo.save(update_fields=["estado", "intentos", "iniciado", "trabajador"])
+    return trabajo
+
+
+def ejecutar(trabajo):
+    """ Corre la tarea del trabajo y registra el resultado, el reintento o la falla. """
+    funcion = TAREAS.get(trabajo.tarea)
+    try:
+        if funcion is None:
+            raise LookupError(f"Tarea desconocida: {trabajo.tarea}")
+        resultado = funcion(trabajo, **trabajo.argumentos)
+    except Exception:
+        error = traceback.format_exc()
+        reintentar = trabajo.intentos < trabajo.max_intentos
+        logger.warning("Trabajo %s (%s) falló en el intento %d%s:\n%s", trabajo.pk, trabajo.tarea, trabajo.intentos,
+                       "; se reintentará" if reintentar else "", error)
+        cambios = {"error": error}
+        if reintentar:
+            espera = ESPERA_REINTENTO * 2 ** (trabajo.intentos - 1)
+            cambios.update(estado="PENDIENTE", disponible_desde=timezone.now() + timedelta(seconds=espera))
+        else:
+            cambios.update(estado="FALLIDO", terminado=timezone.now())
+    else:
+        cambios = {"estado": "HECHO", "resultado": resultado, "error": "", "terminado": timezone.now()}
+    # Sólo si sigue siendo nuestro (no se dio por abandonado y lo tomó otro proceso)
+    Job.objects.filter(pk=trabajo.pk, estado="EN_CURSO", trabajador=trabajo.trabajador).update(**cambios)
+    for campo, valor in cambios.items():
+        setattr(trabajo, campo, valor)
+    return trabajo
+
+
+def recuperar_abandonados(tiempo_maximo=TIEMPO_MAXIMO):
+    """ Devuelve a la cola (o da por fallidos, si no quedan intentos) los trabajos EN_CURSO hace demasiado. """
+    limite = timezone.now() - tiempo_maximo
+    abandonados = Job.objects.filter(estado="EN_CURSO", iniciado__lt=limite)
+    fallidos = abandonados.filter(intentos__gte=F("max_intentos")).update(
+        estado="FALLIDO", terminado=timezone.now(), error="Abandonado: el proceso que lo corría no terminó."
+    )
+    return abandonados.update(estado="PENDIENTE", disponible_desde=timezone.now()) + fallidos
+
+
+def directorio():
+    ruta = Path(settings.TRABAJOS_DIR)
+    ruta.mkdir(parents=True, exist_ok=True)
+    return ruta
+
+
+def ruta_archivo(trabajo, nombre):
+    return directorio() / f"{trabajo.pk}_{nombre}"
+
+
+def escribir_archivo(trabajo, nombre, escribir):
+    """
+    Crea el archivo del trabajo con escribir(f) (f abierto en binario), de
+    forma atómica: quien lo descarga nunca ve uno a medio escribir. Devuelve
+    el nombre del archivo.
+    """
+    ruta = ruta_archivo(trabajo, nombre)
+    fd, temporal = tempfile.mkstemp(dir=ruta.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            escribir(f)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    return ruta.name
+
+
+def purgar(dias=None):
+    """ Borra los trabajos terminados hace más de `dias` días y sus archivos. """
+    dias = settings.TRABAJOS_RETENCION_DIAS if dias is None else dias
+    viejos = Job.objects.filter(estado__in=("HECHO", "FALLIDO"), terminado__lt=timezone.now() - timedelta(days=dias))
+    for resultado in viejos.exclude(resultado=None).values_list("resultado", flat=True).iterator():
+        if isinstance(resultado, dict) and resultado.get("archivo"):
+            (directorio() / resultado["archivo"]).unlink(missing_ok=True)
+    return viejos.delete()[0]
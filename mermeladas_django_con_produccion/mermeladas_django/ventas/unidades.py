@@ -0,0 +1,56 @@
+"""
+Conversión de unidades de medida (UNIT_CHOICES) entre recetas y materias primas.
+
+Cada unidad pertenece a una dimensión (masa, volumen, conteo) con un factor
+respecto de la unidad más chica de la dimensión. La tabla CONVERSION tiene,
+ya calculado, el factor de cada par de unidades compatibles, así convertir
+es buscar un factor y multiplicar una vez.
+
+La conversión se hace al escribir: un ingrediente guarda la cantidad en la
+unidad en que se ingresó y, además, en la unidad de su materia prima
+(RecipeItem.cantidad_base). Costos, producción y MRP leen sólo la segunda y
+multiplican directo contra el stock y el costo unitario de la materia.
+"""
+from decimal import Decimal
+
+from .cantidades import redondear
+
+# unidad -> (dimensión, cantidad de la unidad base de la dimensión)
+DIMENSIONES = {
+    "g": ("masa", 1),
+    "kg": ("masa", 1000),
+    "ml": ("volumen", 1),
+    "l": ("volumen", 1000),
+    "un": ("conteo", 1),
+}
+
+# (origen, destino) -> factor, sólo para unidades de la misma dimensión
+CONVERSION = {
+    (origen, destino): Decimal(factor_origen) / Decimal(factor_destino)
+    for origen, (dimension_origen, factor_origen) in DIMENSIONES.items()
+    for destino, (dimension_destino, factor_destino) in DIMENSIONES.items()
+    if dimension_origen == dimension_destino
+}
+
+
+class UnidadesIncompatibles(Exception):
+    """ Las unidades son de dimensiones distintas (p. ej. gramos y litros). """
+
+    def __init__(self, origen, destino):
+        self.origen = origen
+        self.destino = destino
+        super().__init__(f"No se puede convertir de {origen} a {destino}: miden cosas distintas.")
+
+
+def compatibles(unidad):
+    """ Unidades a las que se puede convertir `unidad` (incluida ella misma). """
+    return [destino for origen, destino in CONVERSION if origen == unidad]
+
+
+def convertir(cantidad, origen, destino):
+    """ `cantidad` en `origen` expresada en `destino`, a milésimas. """
+    try:
+        factor = CONVERSION[origen, destino]
+    except KeyError:
+        raise UnidadesIncompatibles(origen, destino) from None
+    return redondear(redondear(cantidad) * factor)
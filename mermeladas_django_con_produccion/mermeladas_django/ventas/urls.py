@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -15,13 +15,17 @@ urlpatterns = [
     path('clientes/nuevo/', views.ClientCreateView.as_view(), name='cliente_create'),
     path('clientes/<int:pk>/editar/', views.ClientUpdateView.as_view(), name='cliente_update'),
     path('clientes/<int:pk>/eliminar/', views.ClientDeleteView.as_view(), name='cliente_delete'),
-    path('clientes/<int:pk>/', views.cliente_detalle, name='cliente_detalle'),
+    path('clientes/<int:pk>/', views.ClienteDetalleView.as_view(), name='cliente_detalle'),
+    path('clientes/rfm/', views.clientes_rfm, name='clientes_rfm'),
 
     # Ventas
     path('ventas/', views.SaleListView.as_view(), name='ventas_list'),
     path('ventas/nueva/', views.venta_crear, name='venta_create'),
     path('ventas/<int:pk>/', views.venta_detalle, name='venta_detail'),
     path('ventas/<int:pk>/pdf/', views.venta_pdf, name='venta_pdf'),
+    path('ventas/comprobantes/', views.ventas_comprobantes, name='ventas_comprobantes'),
+    path('ventas/exportar/', views.ventas_exportar, name='ventas_exportar'),
+    path('ventas/exportar/directo/', views.ventas_exportar_directo, name='ventas_exportar_directo'),
 
     # Materias primas
     path('materias/', views.RawMaterialListView.as_view(), name='materias_list'),
@@ -29,10 +33,34 @@ urlpatterns = [
     path('materias/<int:pk>/editar/', views.RawMaterialUpdateView.as_view(), name='materia_update'),
     path('materias/<int:pk>/eliminar/', views.RawMaterialDeleteView.as_view(), name='materia_delete'),
 
+    # Lotes
+    path('lotes/por-vencer/', views.LotesPorVencerView.as_view(), name='lotes_por_vencer'),
+
     # Recetas
     path('recetas/', views.RecipeListView.as_view(), name='recetas_list'),
     path('recetas/nueva/', views.receta_crear, name='receta_create'),
     path('recetas/<int:pk>/', views.receta_detalle, name='receta_detail'),
     path('recetas/<int:pk>/editar/', views.receta_editar, name='receta_update'),
     path('recetas/<int:pk>/producir/', views.receta_producir, name='receta_producir'),
+    path('recetas/produccion/', views.produccion_plan, name='produccion_plan'),
+    path('recetas/mrp/', views.mrp_planificador, name='mrp'),
+    path('recetas/mrp.json', views.mrp_json, name='mrp_json'),
+
+    # Trabajos en segundo plano
+    path('trabajos/', views.TrabajosListView.as_view(), name='trabajos_list'),
+    path('trabajos/<int:pk>/', views.trabajo_detalle, name='trabajo_detalle'),
+    path('trabajos/<int:pk>/archivo/', views.trabajo_archivo, name='trabajo_archivo'),
+
+    # Importación masiva
+    path('importar/', views.importar, name='importar'),
+
+    # Instrumentación (staff o token)
+    path('instrumentacion/', views.instrumentacion, name='instrumentacion'),
+    path('metricas', views.metricas, name='metricas'),
+
+    # API para terminales de venta (sólo lectura)
+    path('api/productos/', api.productos, name='api_productos'),
+    path('api/productos/cambios/', api.productos_cambios, name='api_productos_cambios'),
+    path('api/stock/', api.stock, name='api_stock'),
+    path('api/lotes/', api.lotes, name='api_lotes'),
 ]
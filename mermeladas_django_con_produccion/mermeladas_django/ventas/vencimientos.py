@@ -0,0 +1,71 @@
+"""
+Vencimiento de lotes.
+
+Un lote vence al terminar su fecha_vencimiento: el día del vencimiento
+todavía se vende. Los lotes vencidos con saldo se dan de baja por bloques
+(`vencer_lotes`): su cantidad pasa a 0 y la pérdida queda en el libro de
+stock como movimiento VENCIMIENTO. Tanto el barrido como el informe de
+lotes por vencer recorren el índice parcial lote_vencimiento_idx (lotes
+con saldo, por fecha de vencimiento), así que su costo depende de los lotes
+que vencen y no del total de lotes.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .inventario import bloquear_productos, registrar_movimientos
+from .models import ProductBatch, StockMovement
+
+LOTES_POR_BARRIDO = 1000
+
+
+def lotes_vencidos(fecha=None):
+    """ Lotes con saldo cuya fecha de vencimiento ya pasó, en orden de vencimiento. """
+    fecha = fecha or timezone.localdate()
+    return ProductBatch.objects.filter(cantidad__gt=0, fecha_vencimiento__lt=fecha).order_by("fecha_vencimiento", "id")
+
+
+@transaction.atomic
+def _vencer_bloque(fecha, bloque):
+    """
+    Da de baja hasta `bloque` lotes vencidos. Devuelve (lotes, unidades), o
+    None si ya no quedan lotes vencidos con saldo.
+    """
+    ids = list(lotes_vencidos(fecha).values_list("id", "producto_id")[:bloque])
+    if not ids:
+        return None
+    # Mismo orden de bloqueo que una venta (productos por pk, luego lotes) para no cruzarse con el checkout
+    bloquear_productos({producto_id for _, producto_id in ids})
+    # Vuelve a filtrar con el bloqueo tomado: una venta pudo vaciar alguno después de leer los ids
+    lotes = list(
+        lotes_vencidos(fecha).select_for_update()
+        .filter(pk__in=[pk for pk, _ in ids])
+        .order_by("producto_id", "fecha_vencimiento", "id")
+        .only("id", "producto_id", "cantidad", "fecha_vencimiento")
+    )
+    movimientos = [
+        StockMovement(producto_id=lote.producto_id, lote=lote, tipo="VENCIMIENTO", cantidad=-lote.cantidad,
+                      detalle=f"Lote vencido el {lote.fecha_vencimiento:%d-%m-%Y}")
+        for lote in lotes
+    ]
+    for lote in lotes:
+        lote.cantidad = 0
+    ProductBatch.objects.bulk_update(lotes, ["cantidad"])
+    registrar_movimientos(movimientos)
+    return len(lotes), -sum(m.cantidad for m in movimientos)
+
+
+def vencer_lotes(fecha=None, bloque=LOTES_POR_BARRIDO):
+    """
+    Da de baja todos los lotes vencidos a `fecha` (hoy por defecto), de a
+    `bloque` lotes por transacción para no retener bloqueos mucho tiempo.
+    Sigue hasta que no queda ninguno: un bloque puede volver incompleto si
+    una venta vació lotes entre la lectura y el bloqueo. Devuelve (lotes,
+    unidades) dados de baja.
+    """
+    fecha = fecha or timezone.localdate()
+    total_lotes = total_unidades = 0
+    while (resultado := _vencer_bloque(fecha, bloque)) is not None:
+        lotes, unidades = resultado
+        total_lotes += lotes
+        total_unidades += unidades
+    return total_lotes, total_unidades
@@ -1,41 +1,63 @@
 # --- Importaciones ---
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import aget_object_or_404, render, get_object_or_404, redirect
+from django.template.response import TemplateResponse
 from django.urls import reverse_lazy
 from django.contrib import messages
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-from django.db import transaction
-from django.http import HttpResponse
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import cm
+from django.db import OperationalError, transaction
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_http_methods
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.db.models.deletion import ProtectedError
+import hashlib
+import io
 import json
+from urllib.parse import urlencode
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 # Importar modelos y formularios
-from .models import Product, Client, RawMaterial, Recipe, RecipeItem, Sale, SaleItem, ProductBatch
+from .models import Product, Client, RawMaterial, Recipe, RecipeItem, Sale, SaleItem, ProductBatch, Job
 from .forms import ProductForm, ClientForm, RawMaterialForm, RecipeForm, RecipeItemFormSet, SaleForm, SaleItemFormSet, \
-    ProductionForm
+    ProductionForm, ProductionPlanForm, SaleFilterForm, ImportForm
+from .inventario import asignar_fefo, StockInsuficiente
+from .checkout import preparar_lineas, demanda_por_producto, registrar_venta, en_transaccion_con_reintentos
+from . import catalogo
+from .paginacion import CursorPaginationMixin
+from .listados import ListadoMixin
+from .dashboard import datos_dashboard
+from .produccion import producir_plan, MateriasInsuficientes, PlanInvalido
+from .mrp import planificar, OBJETIVOS
+from .importacion import IMPORTADORES, importar_csv
+from .exportacion import NIVELES, csv_por_partes, filas_de
+from .instrumentacion import estadisticas
+from .rfm import datos_rfm
+from .comprobantes import datos_comprobante, huella, obtener_pdf, ventas_para_comprobante
+from .trabajos import ACTIVOS, PRIORIDAD_ALTA, PRIORIDAD_BAJA, encolar, ruta_archivo
+from .unidades import DIMENSIONES, compatibles
 
 
 # --- Vistas Principales ---
 
-def home(request):
-    """ Vista principal (Dashboard). """
-    datos = {
-        "total_productos": Product.objects.count(),
-        "total_clientes": Client.objects.count(),
-        "total_ventas": Sale.objects.count(),
-    }
-    return render(request, "home.html", datos)
+async def home(request):
+    """ Vista principal (Dashboard), servida desde la caché versionada. """
+    return TemplateResponse(request, "home.html", await datos_dashboard())
 
 
 # --- Sección: Productos ---
 
-class ProductListView(ListView):
+class ProductListView(ListadoMixin, ListView):
     model = Product
     template_name = "productos/list.html"
     context_object_name = "productos"
+    relacionados = ("categoria",)
+    campos = ("id", "nombre", "categoria__nombre", "unidad", "precio_unitario", "stock")
 
 
 class ProductCreateView(CreateView):
@@ -71,10 +93,15 @@ class ProductDeleteView(DeleteView):
 
 # --- Sección: Clientes ---
 
-class ClientListView(ListView):
+class ClientListView(ListadoMixin, ListView):
     model = Client
     template_name = "clientes/list.html"
     context_object_name = "clientes"
+    campos = ("id", "nombre", "email", "telefono")
+
+    def get_queryset(self):
+        # Gasto, compras y última compra de cada cliente de la página, agrupados en la misma consulta
+        return super().get_queryset().with_spending()
 
 
 class ClientCreateView(CreateView):
@@ -107,20 +134,37 @@ class ClientDeleteView(DeleteView):
             return redirect(self.success_url)
 
 
-def cliente_detalle(request, pk):
-    cliente = get_object_or_404(Client, pk=pk)
-    from django.db.models import Sum
-    cliente.total_gastado = Sale.objects.filter(cliente=cliente).aggregate(total=Sum('total'))['total'] or 0
-    ventas = Sale.objects.filter(cliente=cliente).prefetch_related("items", "items__producto")
-    return render(request, "clientes/detail.html", {"cliente": cliente, "ventas": ventas})
+class ClienteDetalleView(CursorPaginationMixin, ListView):
+    """ Ficha del cliente con sus totales (una consulta agrupada) y su historial de compras paginado por cursor. """
+    model = Sale
+    template_name = "clientes/detail.html"
+    context_object_name = "ventas"
+    orden_cursor = ("-fecha", "-id")
+    tamano_pagina = 20
+
+    async def apreparar(self):
+        self.cliente = await aget_object_or_404(Client.objects.with_spending(), pk=self.kwargs["pk"])
+
+    def get_queryset(self):
+        return super().get_queryset().filter(cliente=self.cliente).only("id", "fecha", "total")
+
+    def get_context_data(self, **kwargs):
+        kwargs["cliente"] = self.cliente
+        return super().get_context_data(**kwargs)
+
+
+def clientes_rfm(request):
+    """ Segmentación RFM (recencia, frecuencia, monto) de todos los clientes con compras. """
+    return render(request, "clientes/rfm.html", datos_rfm())
 
 
 # --- Sección: Materias Primas ---
 
-class RawMaterialListView(ListView):
+class RawMaterialListView(ListadoMixin, ListView):
     model = RawMaterial
     template_name = "materias/list.html"
     context_object_name = "materias"
+    campos = ("id", "nombre", "unidad", "costo_unitario", "stock")
 
 
 class RawMaterialCreateView(CreateView):
@@ -155,10 +199,41 @@ class RawMaterialDeleteView(DeleteView):
 
 # --- Sección: Recetas ---
 
-class RecipeListView(ListView):
+class RecipeListView(ListadoMixin, ListView):
     model = Recipe
     template_name = "recetas/list.html"
     context_object_name = "recetas"
+    relacionados = ("producto_final",)
+    campos = ("id", "nombre", "rendimiento_unidades", "producto_final__nombre")
+
+    def get_queryset(self):
+        items = RecipeItem.objects.filter(receta=OuterRef("pk")).values("receta")
+        return super().get_queryset().with_costs().annotate(
+            num_items=Coalesce(Subquery(items.annotate(n=Count("id")).values("n")), 0)
+        )
+
+
+def _opciones_receta():
+    return {"producto_final": catalogo.productos()["opciones"]}
+
+
+def _formset_receta(*args, **kwargs):
+    """ Formset de ingredientes con las opciones de materia prima del catálogo en caché. """
+    opciones = {"materia_prima": catalogo.materias()["opciones"]}
+    return RecipeItemFormSet(*args, form_kwargs={"opciones": opciones}, **kwargs)
+
+
+# Unidades en que se puede ingresar un ingrediente, según la unidad de su materia prima (para el JS)
+UNIDADES_COMPATIBLES = json.dumps({unidad: compatibles(unidad) for unidad in DIMENSIONES})
+
+
+def _render_receta(request, form, formset):
+    return render(request, "recetas/form.html", {
+        "form": form,
+        "formset": formset,
+        "unidades": catalogo.materias()["unidades"],
+        "compatibles": UNIDADES_COMPATIBLES,
+    })
 
 
 @transaction.atomic
@@ -167,11 +242,9 @@ def receta_crear(request):
     Vista para CREAR una nueva receta con sus ingredientes.
     Esta es la función que te faltaba y causaba el error.
     """
-    unidades = {m.pk: m.unidad for m in RawMaterial.objects.all()}
-
     if request.method == "POST":
-        form = RecipeForm(request.POST)
-        formset = RecipeItemFormSet(request.POST)
+        form = RecipeForm(request.POST, opciones=_opciones_receta())
+        formset = _formset_receta(request.POST)
 
         if form.is_valid() and formset.is_valid():
             receta = form.save()  # Guarda primero la cabecera para tener ID
@@ -182,25 +255,20 @@ def receta_crear(request):
         else:
             messages.error(request, "Error al crear la receta. Revise los datos.")
     else:
-        form = RecipeForm()
-        formset = RecipeItemFormSet()
+        form = RecipeForm(opciones=_opciones_receta())
+        formset = _formset_receta()
 
-    return render(request, "recetas/form.html", {
-        "form": form,
-        "formset": formset,
-        "unidades": json.dumps(unidades)
-    })
+    return _render_receta(request, form, formset)
 
 
 @transaction.atomic
 def receta_editar(request, pk):
     """ Vista para editar Receta y sus ingredientes. """
     receta = get_object_or_404(Recipe, pk=pk)
-    unidades = {m.pk: m.unidad for m in RawMaterial.objects.all()}
 
     if request.method == "POST":
-        form = RecipeForm(request.POST, instance=receta)
-        formset = RecipeItemFormSet(request.POST, instance=receta)
+        form = RecipeForm(request.POST, instance=receta, opciones=_opciones_receta())
+        formset = _formset_receta(request.POST, instance=receta)
 
         if form.is_valid() and formset.is_valid():
             form.save()
@@ -210,14 +278,10 @@ def receta_editar(request, pk):
         else:
             messages.error(request, "Error al actualizar la receta.")
     else:
-        form = RecipeForm(instance=receta)
-        formset = RecipeItemFormSet(instance=receta)
+        form = RecipeForm(instance=receta, opciones=_opciones_receta())
+        formset = _formset_receta(instance=receta)
 
-    return render(request, "recetas/form.html", {
-        "form": form,
-        "formset": formset,
-        "unidades": json.dumps(unidades)
-    })
+    return _render_receta(request, form, formset)
 
 
 @transaction.atomic
@@ -226,7 +290,7 @@ def receta_producir(request, pk):
     Vista para "producir" una receta.
     Genera el CODIGO DE LOTE automáticamente e ignora el input manual.
     """
-    receta = get_object_or_404(Recipe, pk=pk)
+    receta = get_object_or_404(Recipe.objects.with_costs(), pk=pk)
     if not receta.producto_final:
         messages.error(request, "Esta receta no tiene producto final asignado.")
         return redirect("receta_detail", pk=pk)
@@ -240,47 +304,16 @@ def receta_producir(request, pk):
             fprod = form.cleaned_data["fecha_produccion"]
             fven = form.cleaned_data["fecha_vencimiento"]
 
-            # --- GENERACIÓN AUTOMÁTICA DEL CÓDIGO ---
-            # Formato: L{ID_PRODUCTO}-{FECHA_HORA_MINUTO}
-            ahora = timezone.now()
-            cod = f"L{receta.producto_final.id}-{ahora.strftime('%d%m%y%H%M')}"
-            # ----------------------------------------
-
-            # 1. Verificar stock de materias primas
-            faltantes = []
-            for item in receta.items.select_related("materia_prima"):
-                req = item.cantidad * mult
-                if item.materia_prima.stock < req:
-                    faltantes.append(
-                        f"{item.materia_prima.nombre} (requiere {req}, disponible {item.materia_prima.stock})")
-
-            if faltantes:
-                messages.error(request, "Stock insuficiente: " + "; ".join(faltantes))
+            # Plan de una sola receta: verifica y descuenta materias, crea el lote
+            # (código L{ID_PRODUCTO}-{FECHA_HORA_MINUTO}) y registra la entrada de stock
+            try:
+                lote, = producir_plan([(receta, mult)], fprod, fven)
+            except MateriasInsuficientes as e:
+                messages.error(request, str(e))
                 return redirect("receta_detail", pk=pk)
 
-            # 2. Descontar stock de materias primas
-            for item in receta.items.select_related("materia_prima"):
-                req = item.cantidad * mult
-                mp = item.materia_prima
-                mp.stock = mp.stock - req
-                mp.save()
-
-            # 3. Crear el Lote con el CÓDIGO AUTOMÁTICO
-            unidades = receta.rendimiento_unidades * mult
-            ProductBatch.objects.create(
-                producto=receta.producto_final,
-                codigo_lote=cod,
-                fecha_produccion=fprod,
-                fecha_vencimiento=fven,
-                cantidad=unidades
-            )
-
-            # 4. Actualizar el stock total
-            producto = receta.producto_final
-            producto.stock = sum(lote.cantidad for lote in producto.lotes.filter(cantidad__gt=0))
-            producto.save()
-
-            messages.success(request, f"Producción registrada: +{unidades} {producto.unidad}. Lote generado: {cod}")
+            messages.success(request, f"Producción registrada: +{lote.cantidad} {receta.producto_final.unidad}. "
+                                      f"Lote generado: {lote.codigo_lote}")
             return redirect("receta_detail", pk=pk)
     else:
         form = ProductionForm()
@@ -288,65 +321,162 @@ def receta_producir(request, pk):
     return render(request, "recetas/produccion_form.html", {"form": form, "receta": receta})
 
 
+def produccion_plan(request):
+    """
+    Plan de producción: varias recetas con su multiplicador, ejecutadas en
+    una sola transacción (todo o nada).
+    """
+    recetas = (
+        Recipe.objects.filter(producto_final__isnull=False)
+        .select_related("producto_final").with_costs().order_by("nombre")
+    )
+    # ?receta_<pk>=<multiplicador> precarga el plan (p. ej. la mezcla propuesta por el MRP)
+    inicial = {k: v for k, v in request.GET.items() if k.startswith("receta_")}
+    form = ProductionPlanForm(request.POST or None, recetas=recetas, initial=inicial)
+    if request.method == "POST" and form.is_valid():
+        try:
+            lotes = producir_plan(form.cleaned_data["plan"], form.cleaned_data["fecha_produccion"],
+                                  form.cleaned_data["fecha_vencimiento"])
+        except MateriasInsuficientes as e:
+            for mp, requerido, disponible in e.faltantes:
+                messages.error(request, f"Falta {mp.nombre}: requiere {requerido}, disponible {disponible}.")
+        except PlanInvalido as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f"Plan registrado: {len(lotes)} lotes generados "
+                                      f"({', '.join(l.codigo_lote for l in lotes)}).")
+            return redirect("recetas_list")
+    return render(request, "recetas/plan.html", {"form": form})
+
+
+def _objetivo_mrp(request):
+    objetivo = request.GET.get("objetivo", "margen")
+    return objetivo if objetivo in OBJETIVOS else "margen"
+
+
+def mrp_planificador(request):
+    """ Máximo producible por receta y mezcla óptima con el stock actual de materias primas. """
+    resultado = planificar(_objetivo_mrp(request))
+    plan = {f"receta_{r['id']}": r["plan"] for r in resultado["recetas"] if r["plan"]}
+    return render(request, "recetas/mrp.html", {
+        **resultado,
+        "objetivos": OBJETIVOS,
+        "querystring_plan": urlencode(plan),
+    })
+
+
+def mrp_json(request):
+    """ Mismo cálculo que mrp_planificador, en JSON (Decimal como texto). """
+    return JsonResponse(planificar(_objetivo_mrp(request)))
+
+
 def receta_detalle(request, pk):
-    """ Muestra el detalle de una receta. """
-    receta = get_object_or_404(Recipe, pk=pk)
+    """ Muestra el detalle de una receta (con su costo calculado en SQL). """
+    receta = get_object_or_404(Recipe.objects.with_costs(), pk=pk)
     return render(request, "recetas/detail.html", {"receta": receta})
 
 
 # --- Helper de FEFO (First Expiring, First Out) ---
 
 def _descontar_por_FEFO(producto, cantidad):
-    """ Descuenta stock empezando por los lotes que vencen antes. """
-    restante = float(cantidad)
-    lotes = list(producto.lotes.filter(cantidad__gt=0).order_by("fecha_vencimiento", "fecha_produccion", "id"))
-
-    stock_en_lotes = sum(l.cantidad for l in lotes)
-    if stock_en_lotes < restante:
-        producto.stock = stock_en_lotes
-        producto.save()
+    """ Descuenta stock empezando por los lotes que vencen antes (sin tocar los ya vencidos). """
+    try:
+        asignar_fefo(producto, cantidad, vigentes_al=timezone.localdate())
+    except StockInsuficiente:
         return False
+    return True
 
-    for lote in lotes:
-        if restante <= 0:
-            break
-        disp = float(lote.cantidad)
-        tomar = min(disp, restante)
-        lote.cantidad = disp - tomar
-        lote.save()
-        restante -= tomar
 
-    producto.stock = sum(l.cantidad for l in producto.lotes.filter(cantidad__gt=0))
-    producto.save()
+# --- Sección: Lotes ---
 
-    return restante <= 0.0001
+class LotesPorVencerView(CursorPaginationMixin, ListView):
+    """ Lotes con saldo que vencen en los próximos ?dias= días (30 por defecto), incluidos los ya vencidos. """
+    model = ProductBatch
+    template_name = "lotes/por_vencer.html"
+    context_object_name = "lotes"
+    orden_cursor = ("fecha_vencimiento", "id")
+
+    def get_queryset(self):
+        try:
+            self.dias = min(max(int(self.request.GET.get("dias", 30)), 0), 365)
+        except ValueError:
+            self.dias = 30
+        self.hoy = timezone.localdate()
+        # Mismo filtro que el índice parcial lote_vencimiento_idx (lotes con saldo, por vencimiento)
+        return super().get_queryset().filter(
+            cantidad__gt=0, fecha_vencimiento__lte=self.hoy + timedelta(days=self.dias)
+        ).select_related("producto")
+
+    def get_context_data(self, **kwargs):
+        kwargs.update({"dias": self.dias, "hoy": self.hoy})
+        return super().get_context_data(**kwargs)
 
 
 # --- Sección: Ventas ---
 
-class SaleListView(ListView):
+class SaleListView(CursorPaginationMixin, ListView):
+    """ Historial de ventas paginado por cursor sobre (-fecha, -id), con filtros por fecha y método de pago. """
     model = Sale
     template_name = "ventas/list.html"
     context_object_name = "ventas"
+    orden_cursor = ("-fecha", "-id")
+
+    def get_queryset(self):
+        self.filtros = SaleFilterForm(self.request.GET or None)
+        items = SaleItem.objects.filter(venta=OuterRef("pk")).values("venta")
+        queryset = super().get_queryset().select_related("cliente").annotate(
+            # Subconsultas correlacionadas: sólo se evalúan para las filas de la página
+            num_items=Coalesce(Subquery(items.annotate(n=Count("id")).values("n")), 0),
+            unidades=Coalesce(Subquery(items.annotate(u=Sum("cantidad")).values("u")), Decimal("0")),
+        )
+        return self.filtros.filtrar(queryset)
+
+    def get_context_data(self, **kwargs):
+        kwargs["filtros"] = self.filtros
+        return super().get_context_data(**kwargs)
+
+
+def _formset_venta(*args, **kwargs):
+    """ Formset de ítems con las opciones de producto del catálogo en caché. """
+    opciones = {"producto": catalogo.productos()["opciones"]}
+    return SaleItemFormSet(*args, form_kwargs={"opciones": opciones}, **kwargs)
+
+
+def _render_venta_form(request, form, formset, status=200):
+    # Mapas ya serializados del catálogo en caché: dibujar el formulario no consulta productos
+    return render(request, "ventas/form.html", {
+        "form": form,
+        "formset": formset,
+        "precios": catalogo.productos()["precios"],
+        "stock_map": catalogo.stock_json()
+    }, status=status)
 
 
-@transaction.atomic
 def venta_crear(request):
-    """ Vista para crear una nueva Venta (con validación de stock y FEFO). """
+    """
+    Vista para crear una nueva Venta (con validación de stock y FEFO).
+    Corre en una transacción que se reintenta si la base la aborta por
+    bloqueos; si aun así no se puede, responde 503 sin registrar nada.
+    """
+    try:
+        return en_transaccion_con_reintentos(_venta_crear, request)
+    except OperationalError:
+        messages.error(request, "Hay demasiadas ventas en curso en este momento. Intenta registrar la venta de nuevo.")
+        return _render_venta_form(request, SaleForm(request.POST), _formset_venta(request.POST, instance=Sale()),
+                                  status=503)
+
+
+def _venta_crear(request):
     venta = Sale()
-    productos = Product.objects.filter(activo=True, stock__gt=0)
-    precios = {p.id: int(p.precio_unitario) for p in productos}
-    stock_map = {p.id: float(p.stock) for p in productos}
 
     if request.method == "POST":
         form = SaleForm(request.POST, instance=venta)
-        formset = SaleItemFormSet(request.POST, instance=venta)
+        formset = _formset_venta(request.POST, instance=venta)
 
         if form.is_valid() and formset.is_valid():
-            total_provisional = 0
-            productos_a_descontar = {}
+            filas = []
 
-            # 1. Validar ítems
+            # 1. Validar ítems (los productos ya vienen precargados por el formset)
             for f in formset.forms:
                 if not f.cleaned_data or f.cleaned_data.get("DELETE"):
                     continue
@@ -356,59 +486,44 @@ def venta_crear(request):
 
                 if not producto or not cantidad:
                     messages.error(request, "Se detectó una fila vacía. Complétela o bórrela.")
-                    return render(request, "ventas/form.html", {"form": form, "formset": formset, "precios": precios,
-                                                                "stock_map": json.dumps(stock_map)})
+                    return _render_venta_form(request, form, formset)
 
-                productos_a_descontar[producto] = productos_a_descontar.get(producto, 0) + cantidad
-                precio = f.cleaned_data.get("precio_unitario") or int(producto.precio_unitario)
-                total_provisional += int(precio) * float(cantidad)
+                filas.append((producto, cantidad, f.cleaned_data.get("precio_unitario")))
 
-            if not productos_a_descontar:
+            if not filas:
                 messages.error(request, "No se puede registrar una venta sin productos.")
-                return render(request, "ventas/form.html", {"form": form, "formset": formset, "precios": precios,
-                                                            "stock_map": json.dumps(stock_map)})
+                return _render_venta_form(request, form, formset)
+
+            items = preparar_lineas(filas)
+            total = sum(item.subtotal for item in items)
 
-            # 2. Validar stock total
-            for producto, cantidad_total in productos_a_descontar.items():
+            # 2. Validar stock total (lectura sin bloqueo: la verificación definitiva la hace
+            #    registrar_venta con los productos y lotes bloqueados)
+            for producto, cantidad_total in demanda_por_producto(items).items():
                 if cantidad_total > producto.stock:
                     messages.error(request,
                                    f"Stock insuficiente para {producto.nombre}. Solicitado: {cantidad_total}, Disponible: {producto.stock}.")
-                    return render(request, "ventas/form.html", {"form": form, "formset": formset, "precios": precios,
-                                                                "stock_map": json.dumps(stock_map)})
+                    return _render_venta_form(request, form, formset, status=409)
 
             # 3. Validar pago
             metodo = form.cleaned_data.get("metodo_pago")
             pagado = form.cleaned_data.get("monto_pagado") or 0
-            if metodo == "EFECTIVO" and int(pagado) < int(total_provisional):
-                messages.error(request, f"Monto pagado insuficiente. Total: ${int(total_provisional)}.")
-                return render(request, "ventas/form.html", {"form": form, "formset": formset, "precios": precios,
-                                                            "stock_map": json.dumps(stock_map)})
+            if metodo == "EFECTIVO" and int(pagado) < total:
+                messages.error(request, f"Monto pagado insuficiente. Total: ${total}.")
+                return _render_venta_form(request, form, formset)
 
-            # 4. Guardar Venta
+            # 4. Guardar venta, ítems (bulk) y descontar stock (FEFO) de todo el carrito
             venta = form.save(commit=False)
-            venta.total = int(total_provisional)
-            venta.cambio = int(pagado) - int(venta.total) if metodo == "EFECTIVO" else 0
-            venta.save()
-
-            # 5. Guardar Ítems
-            formset.instance = venta
-            items = formset.save(commit=False)
-            for item in items:
-                if not item.precio_unitario or int(item.precio_unitario) == 0:
-                    item.precio_unitario = int(item.producto.precio_unitario)
-                item.save()
-            for del_form in formset.deleted_forms:
-                if del_form.instance.pk:
-                    del_form.instance.delete()
-            formset.save_m2m()
-
-            # 6. Descontar Stock (FEFO)
-            for producto, cantidad_total in productos_a_descontar.items():
-                ok = _descontar_por_FEFO(producto, cantidad_total)
-                if not ok:
-                    messages.error(request, f"Error de stock (FEFO) en {producto.nombre}.")
-                    raise ValueError("Stock inconsistente FEFO")
-
+            venta.cambio = int(pagado) - total if metodo == "EFECTIVO" else 0
+            try:
+                registrar_venta(venta, items)
+            except StockInsuficiente as e:
+                # Otra caja vendió el stock entre la validación y el bloqueo: conflicto, no error del servidor
+                messages.error(request, str(e))
+                return _render_venta_form(request, form, formset, status=409)
+
+            # El comprobante se genera fuera del checkout (un INSERT en la misma transacción)
+            encolar("comprobante_pdf", {"venta": venta.pk}, prioridad=PRIORIDAD_BAJA)
             messages.success(request, "Venta registrada correctamente.")
             return redirect("venta_detail", pk=venta.pk)
 
@@ -417,75 +532,172 @@ def venta_crear(request):
 
     else:
         form = SaleForm(instance=venta)
-        formset = SaleItemFormSet(instance=venta)
+        formset = _formset_venta(instance=venta)
 
-    return render(request, "ventas/form.html", {
-        "form": form,
-        "formset": formset,
-        "precios": precios,
-        "stock_map": json.dumps(stock_map)
-    })
+    return _render_venta_form(request, form, formset)
 
 
-def venta_detalle(request, pk):
-    venta = get_object_or_404(Sale, pk=pk)
-    return render(request, "ventas/detail.html", {"venta": venta})
+async def venta_detalle(request, pk):
+    # Ítems y sus productos precargados: la instrumentación marcaba un SELECT de producto por ítem
+    venta = await aget_object_or_404(Sale.objects.select_related("cliente").prefetch_related("items__producto"), pk=pk)
+    return TemplateResponse(request, "ventas/detail.html", {"venta": venta})
 
 
 def venta_pdf(request, pk):
-    """ Genera PDF de la venta. """
-    venta = get_object_or_404(Sale, pk=pk)
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="venta_{venta.pk}.pdf"'
-
-    c = canvas.Canvas(response, pagesize=A4)
-    width, height = A4
-    x_margin, y_margin = 2 * cm, 2 * cm
-    y = height - y_margin
-
-    c.setFont("Helvetica-Bold", 14)
-    c.drawString(x_margin, y, "Comprobante de Venta")
-    y -= 1.2 * cm
-
-    c.setFont("Helvetica", 11)
-    c.drawString(x_margin, y, f"Venta #{venta.pk}  |  Fecha: {venta.fecha.strftime('%d-%m-%Y %H:%M')}")
-    y -= 0.6 * cm
-    c.drawString(x_margin, y, f"Cliente: {venta.cliente.nombre}")
-    y -= 0.4 * cm
-    if venta.cliente.direccion:
-        c.drawString(x_margin, y, f"Dirección: {venta.cliente.direccion}")
-        y -= 0.4 * cm
-    y -= 0.4 * cm
-
-    c.setFont("Helvetica-Bold", 10)
-    c.drawString(x_margin, y, "Producto")
-    c.drawString(x_margin + 8 * cm, y, "Cant.")
-    c.drawString(x_margin + 11 * cm, y, "P. Unit.")
-    c.drawString(x_margin + 14 * cm, y, "Subtotal")
-    y -= 0.5 * cm
-    c.line(x_margin, y, width - x_margin, y)
-    y -= 0.3 * cm
-
-    c.setFont("Helvetica", 10)
-    for item in venta.items.select_related("producto").all():
-        if y < 3 * cm:
-            c.showPage()
-            y = height - y_margin
-            c.setFont("Helvetica", 10)
-
-        c.drawString(x_margin, y, item.producto.nombre[:40])
-        c.drawRightString(x_margin + 10 * cm, y, f"{float(item.cantidad):.3f}")
-        c.drawRightString(x_margin + 13 * cm, y, f"${item.precio_unitario:,}".replace(",", "."))
-        c.drawRightString(width - x_margin, y, f"${int(item.subtotal):,}".replace(",", "."))
-        y -= 0.45 * cm
-
-    y -= 0.2 * cm
-    c.line(x_margin, y, width - x_margin, y)
-    y -= 0.6 * cm
-    c.setFont("Helvetica-Bold", 12)
-    c.drawRightString(width - x_margin, y, f"TOTAL: ${int(venta.total):,}".replace(",", "."))
-
-    c.showPage()
-    c.save()
+    """ Comprobante PDF de la venta: se genera una vez, se sirve desde disco y admite GET condicional (ETag). """
+    venta = get_object_or_404(ventas_para_comprobante(Sale.objects.all()), pk=pk)
+    datos = datos_comprobante(venta)
+    etag = huella(datos)
+    no_modificado = get_conditional_response(request, etag=f'"{etag}"')
+    if no_modificado is not None:
+        return no_modificado
+
+    response = FileResponse(open(obtener_pdf(datos, etag), "rb"), content_type="application/pdf",
+                            filename=f"venta_{venta.pk}.pdf")
+    response["ETag"] = f'"{etag}"'
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _encolar_exportacion(request, tarea, argumentos):
+    """
+    Encola la exportación de las ventas filtradas y redirige a su trabajo. La
+    clave es la de los filtros: pedir dos veces lo mismo no genera dos archivos.
+    """
+    filtros = {campo: request.GET[campo] for campo in SaleFilterForm.base_fields if request.GET.get(campo)}
+    argumentos = {"filtros": filtros, **argumentos}
+    clave = f"{tarea}:{hashlib.sha256(urlencode(sorted(argumentos.items())).encode()).hexdigest()[:32]}"
+    trabajo = encolar(tarea, argumentos, prioridad=PRIORIDAD_ALTA, clave=clave)
+    return redirect("trabajo_detalle", pk=trabajo.pk)
+
+
+def ventas_comprobantes(request):
+    """
+    Exporta en segundo plano los comprobantes de las ventas filtradas (mismos
+    filtros que el listado): un ZIP, o con ?formato=pdf un único PDF con una
+    página por venta.
+    """
+    formato = "pdf" if request.GET.get("formato") == "pdf" else "zip"
+    return _encolar_exportacion(request, "comprobantes", {"formato": formato})
+
+
+def ventas_exportar(request):
+    """
+    CSV de las ventas filtradas (mismos filtros que el listado, más ?cliente=),
+    generado en segundo plano (ventas_exportar_directo lo transmite en la
+    respuesta). ?nivel=items exporta una fila por ítem vendido.
+    """
+    nivel = request.GET.get("nivel") if request.GET.get("nivel") in NIVELES else "ventas"
+    return _encolar_exportacion(request, "exportar_ventas", {"nivel": nivel})
+
+
+def ventas_exportar_directo(request):
+    """
+    El mismo CSV de ventas_exportar transmitido por partes en la respuesta
+    (StreamingHttpResponse), sin pasar por la cola: para los scripts de
+    contabilidad que lo bajan directo. La memoria no depende de la cantidad
+    de filas (ver exportacion.py).
+    """
+    nivel = request.GET.get("nivel") if request.GET.get("nivel") in NIVELES else "ventas"
+    ventas = SaleFilterForm(request.GET or None).filtrar(Sale.objects.order_by("fecha", "id"))
+    response = StreamingHttpResponse(
+        csv_por_partes(NIVELES[nivel], filas_de(nivel, ventas)), content_type="text/csv; charset=utf-8"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{nivel}.csv"'
     return response
+
+
+# --- Trabajos en segundo plano ---
+
+class TrabajosListView(CursorPaginationMixin, ListView):
+    """ Últimos trabajos de la cola, del más reciente al más antiguo. """
+    model = Job
+    template_name = "trabajos/list.html"
+    context_object_name = "trabajos"
+    orden_cursor = ("-id",)
+
+    def get_queryset(self):
+        return super().get_queryset().defer("argumentos", "resultado", "error")
+
+
+def trabajo_detalle(request, pk):
+    """ Estado de un trabajo; mientras está pendiente o en curso la página se recarga sola. """
+    trabajo = get_object_or_404(Job, pk=pk)
+    return render(request, "trabajos/detalle.html", {"trabajo": trabajo, "activo": trabajo.estado in ACTIVOS})
+
+
+def trabajo_archivo(request, pk):
+    """ Descarga el archivo generado por un trabajo terminado. """
+    trabajo = get_object_or_404(Job, pk=pk, estado="HECHO")
+    resultado = trabajo.resultado or {}
+    if not resultado.get("archivo"):
+        raise Http404("El trabajo no generó un archivo.")
+    try:
+        archivo = open(ruta_archivo(trabajo, resultado["nombre"]), "rb")
+    except FileNotFoundError:
+        raise Http404("El archivo ya no está disponible (se purgó).")
+    return FileResponse(archivo, as_attachment=True, filename=resultado["nombre"])
+
+
+# --- Importación masiva ---
+
+def importar(request):
+    """ Importa productos, materias primas, clientes o recetas desde un CSV. """
+    form = ImportForm(request.POST or None, request.FILES or None)
+    resultado = None
+    if request.method == "POST" and form.is_valid():
+        archivo = io.TextIOWrapper(form.cleaned_data["archivo"].file, encoding="utf-8-sig", newline="")
+        try:
+            resultado = importar_csv(form.cleaned_data["tipo"], archivo, simular=form.cleaned_data["simular"])
+        except (ValueError, UnicodeDecodeError) as e:
+            messages.error(request, f"No se pudo leer el archivo: {e}")
+        else:
+            accion = "Simulación" if form.cleaned_data["simular"] else "Importación"
+            messages.success(request, f"{accion}: {resultado.filas} filas, {resultado.creados} creados, "
+                                      f"{resultado.actualizados} actualizados, {resultado.total_errores} con errores.")
+    return render(request, "importar.html", {
+        "form": form,
+        "resultado": resultado,
+        "columnas": {tipo: (clase.columnas, clase.opcionales) for tipo, clase in IMPORTADORES.items()},
+    })
+
+
+# --- Instrumentación ---
+
+def _token_valido(request):
+    """ La cabecera Authorization trae el token de INSTRUMENTACION_TOKEN (para Prometheus). """
+    token = settings.INSTRUMENTACION_TOKEN
+    return bool(token) and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+def _puede_ver_metricas(request):
+    """ Staff con sesión, o el token de INSTRUMENTACION_TOKEN. """
+    return _token_valido(request) or (request.user.is_active and request.user.is_staff)
+
+
+def _estadisticas_json(request):
+    if request.method == "POST":
+        estadisticas.reiniciar()
+    return JsonResponse({"muestreo": settings.INSTRUMENTACION_MUESTREO, "vistas": estadisticas.como_dict()})
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def instrumentacion(request):
+    """
+    Agregados por vista de este proceso, en JSON. Un POST los reinicia.
+    Con el token no se pide CSRF (un sitio ajeno no puede mandar la cabecera
+    Authorization por el navegador); con la sesión de staff, sí.
+    """
+    if _token_valido(request):
+        return _estadisticas_json(request)
+    if not _puede_ver_metricas(request):
+        return HttpResponseForbidden()
+    return csrf_protect(_estadisticas_json)(request)
+
+
+def metricas(request):
+    """ Los mismos agregados en formato de texto de Prometheus. """
+    if not _puede_ver_metricas(request):
+        return HttpResponseForbidden()
+    return HttpResponse(estadisticas.como_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")